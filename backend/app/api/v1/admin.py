@@ -1,20 +1,30 @@
+import asyncio
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.api.v1.dependencies import require_admin
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db, run_in_sync_session
 from app.models.alert import AlertEvent, AlertRule
 from app.models.group import GroupRoleMapping, UserGroup
 from app.models.permission import UserPermission
 from app.models.session import Session as SessionModel
 from app.models.system_config import SystemConfig
 from app.models.user import User
+from app.services.alert_detector import alert_detector
+from app.services.audit_search import parse_query
 from app.services.audit_service import AuditService
+from app.services.config_cache import config_cache
+from app.services.event_bus import event_bus
 from app.services.ip_whitelist_service import IPWhitelistService
+from app.services.session_stats_service import session_stats
+from app.services.user_principal_cache import user_principal_cache
 from app.services.user_service import UserService
+from app.utils.pagination import decode_cursor
 
 router = APIRouter()
 _ip_whitelist_service = IPWhitelistService()
@@ -65,18 +75,22 @@ async def list_users(
             (User.username.ilike(f"%{search}%")) | (User.email.ilike(f"%{search}%"))
         )
     total = query.count()
-    users = query.offset(offset).limit(limit).all()
+    # 用户与每日配额一次 JOIN 取回，会话数一次分组聚合取回（与页大小无关，共 3 条查询）
+    rows = (
+        query.outerjoin(UserPermission, UserPermission.user_id == User.id)
+        .add_columns(UserPermission.daily_session_quota)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
 
     service = UserService(db)
+    session_counts = service.get_session_counts([u.id for u, _ in rows])
     user_list = []
-    for u in users:
-        # 获取用户权限配置
-        perm = service.get_user_permissions(u.id)
-        daily_quota = perm.daily_session_quota if perm else 10
-        
-        # 获取今日已用会话数
-        today_used = service.get_user_total_sessions(u.id, today_only=True)
-        
+    for u, quota in rows:
+        daily_quota = quota if quota is not None else 10
+        today_used, total_sessions = session_counts.get(u.id, (0, 0))
+
         user_list.append({
             "id": u.id,
             "username": u.username,
@@ -87,7 +101,7 @@ async def list_users(
             "last_login_at": u.last_login_at,
             "today_sessions": today_used,        # 今日已用
             "daily_quota": daily_quota,          # 每日配额
-            "total_sessions": service.get_user_total_sessions(u.id),  # 保留总会话数
+            "total_sessions": total_sessions,    # 保留总会话数
         })
 
     return {"success": True, "data": {"users": user_list, "total": total, "limit": limit, "offset": offset}}
@@ -156,11 +170,9 @@ async def update_permissions(
     user_id: int,
     body: dict,
     current_user=Depends(require_admin),
-    db: Session = Depends(get_db),
 ):
-    service = UserService(db)
     try:
-        service.update_permissions(user_id, body)
+        await run_in_sync_session(lambda db: UserService(db).update_permissions(user_id, body))
         return {"success": True, "message": "Permissions updated"}
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -171,10 +183,15 @@ async def list_groups(
     current_user=Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    mappings = db.query(GroupRoleMapping).all()
+    # 单条 LEFT JOIN + GROUP BY 统计各组成员数
+    rows = (
+        db.query(GroupRoleMapping, func.count(UserGroup.id))
+        .outerjoin(UserGroup, UserGroup.group_name == GroupRoleMapping.group_name)
+        .group_by(GroupRoleMapping.id)
+        .all()
+    )
     groups = []
-    for m in mappings:
-        member_count = db.query(UserGroup).filter_by(group_name=m.group_name).count()
+    for m, member_count in rows:
         groups.append({
             "id": m.id,
             "group_name": m.group_name,
@@ -201,17 +218,24 @@ async def update_group_role(
     group_id: int,
     body: dict,
     current_user=Depends(require_admin),
-    db: Session = Depends(get_db),
 ):
-    mapping = db.query(GroupRoleMapping).filter_by(id=group_id).first()
-    if not mapping:
-        raise HTTPException(status_code=404, detail="Group not found")
     role = body.get("role")
     if role not in ("admin", "user"):
         raise HTTPException(status_code=400, detail="Invalid role")
+    if not await run_in_sync_session(_set_group_role, group_id, role):
+        raise HTTPException(status_code=404, detail="Group not found")
+    # 组角色影响成员用户角色，整体失效身份缓存
+    user_principal_cache.clear()
+    return {"success": True, "message": "Group role updated"}
+
+
+def _set_group_role(db: Session, group_id: int, role: str) -> bool:
+    mapping = db.query(GroupRoleMapping).filter_by(id=group_id).first()
+    if not mapping:
+        return False
     mapping.role = role
     db.commit()
-    return {"success": True, "message": "Group role updated"}
+    return True
 
 
 # ─── IP 白名单 ────────────────────────────────────────────────────────────────
@@ -249,7 +273,7 @@ async def update_ip_whitelist(
     requester_ip = _get_client_ip(request)
 
     try:
-        _ip_whitelist_service.update_whitelist(db, enabled, entries, requester_ip)
+        await _ip_whitelist_service.update_whitelist(db, enabled, entries, requester_ip)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except (PermissionError, RuntimeError) as e:
@@ -266,10 +290,12 @@ async def export_audit_logs(
     event_type: Optional[str] = Query(default=None),
     start_time: Optional[str] = Query(default=None),
     end_time: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None, max_length=200),
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(default=False),
     current_user=Depends(require_admin),
-    db: Session = Depends(get_db),
 ):
-    """导出审计日志为 CSV 文件"""
+    """流式导出审计日志（CSV / NDJSON，可选 gzip 压缩），不限制行数，支持与列表相同的过滤和检索"""
     from datetime import datetime
     filters = {}
     if user_id:
@@ -286,7 +312,12 @@ async def export_audit_logs(
             filters["end_time"] = datetime.fromisoformat(end_time)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_time format")
-    return _audit_service.export_csv(db, filters)
+    if q:
+        try:
+            filters["q"] = tuple(parse_query(q))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return _audit_service.export(filters, fmt=format, compress=gzip)
 
 
 @router.get("/audit-logs")
@@ -295,12 +326,14 @@ async def get_audit_logs(
     event_type: Optional[str] = Query(default=None),
     start_time: Optional[str] = Query(default=None),
     end_time: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None, max_length=200),
     limit: int = Query(default=100, ge=1, le=1000),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None),
     current_user=Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    """查询审计日志，支持过滤和分页"""
+    """查询审计日志，支持过滤、全文检索（q）和分页；传入 cursor 时按游标翻页，深度翻页代价恒定"""
     from datetime import datetime
     filters = {}
     if user_id:
@@ -317,8 +350,22 @@ async def get_audit_logs(
             filters["end_time"] = datetime.fromisoformat(end_time)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_time format")
+    if q:
+        try:
+            filters["q"] = tuple(parse_query(q))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    logs, total = _audit_service.query_logs(db, filters, limit=limit, offset=offset)
+    decoded_cursor = None
+    if cursor:
+        try:
+            decoded_cursor = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    logs, total, next_cursor = _audit_service.query_logs(
+        db, filters, limit=limit, offset=offset, cursor=decoded_cursor
+    )
     return {
         "success": True,
         "data": {
@@ -339,29 +386,72 @@ async def get_audit_logs(
             "total": total,
             "limit": limit,
             "offset": offset,
+            "next_cursor": next_cursor,
         },
     }
 
 
-# ─── 告警规则 ─────────────────────────────────────────────────────────────────
+@router.get("/audit-logs/retention")
+async def get_audit_retention(
+    current_user=Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """返回审计日志热数据 / 归档保留天数及归档层统计"""
+    from app.services.audit_archive import audit_archive
+    return {
+        "success": True,
+        "data": {**audit_archive.get_retention(db), "archive": audit_archive.get_stats()},
+    }
 
-_ALERT_CONFIG_KEYS = [
-    "alert_offhour_start",
-    "alert_offhour_end",
-    "alert_offhour_tz",
-    "alert_cooldown_minutes",
-    "sns_topic_arn",
-]
+
+@router.put("/audit-logs/retention")
+async def update_audit_retention(
+    body: dict,
+    current_user=Depends(require_admin),
+):
+    """更新审计日志保留天数（0：热数据不归档 / 归档永久保留）"""
+    key_map = {
+        "hot_retention_days": "audit_hot_retention_days",
+        "archive_retention_days": "audit_archive_retention_days",
+    }
+    values = {}
+    for field, db_key in key_map.items():
+        if field not in body:
+            continue
+        try:
+            days = int(body[field])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid {field}")
+        if days < 0:
+            raise HTTPException(status_code=400, detail=f"Invalid {field}")
+        values[db_key] = str(days)
+    await run_in_sync_session(_save_system_configs, values)
+    return {"success": True, "message": "审计日志保留策略已更新"}
+
+
+@router.post("/audit-logs/retention/run")
+async def run_audit_retention(
+    current_user=Depends(require_admin),
+):
+    """立即执行一次审计日志归档 / 过期清理"""
+    from app.services.audit_archive import audit_archive
+    from app.services.audit_count_cache import audit_count_cache
+    result = await run_in_sync_session(audit_archive.run)
+    audit_count_cache.clear()
+    return {"success": True, "data": result}
 
 
+# ─── 告警规则 ─────────────────────────────────────────────────────────────────
+
 @router.get("/alert-rules")
 async def get_alert_rules(
     current_user=Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     """返回所有告警规则配置及 SNS/非工作时间/冷却期配置"""
-    rules = db.query(AlertRule).all()
-    configs = {c.key: c.value for c in db.query(SystemConfig).filter(SystemConfig.key.in_(_ALERT_CONFIG_KEYS)).all()}
+    snapshot = config_cache.get(db)
+    rules = snapshot.rules
+    configs = snapshot.configs
     return {
         "success": True,
         "data": {
@@ -392,13 +482,23 @@ async def get_alert_rules(
 async def update_alert_rules(
     body: dict,
     current_user=Depends(require_admin),
-    db: Session = Depends(get_db),
 ):
     """更新告警规则阈值、时间窗口、非工作时间段、冷却期、SNS Topic ARN"""
-    now = datetime.utcnow()
+    config_map = body.get("config", {})
+    key_map = {
+        "offhour_start": "alert_offhour_start",
+        "offhour_end": "alert_offhour_end",
+        "offhour_tz": "alert_offhour_tz",
+        "cooldown_minutes": "alert_cooldown_minutes",
+        "sns_topic_arn": "sns_topic_arn",
+    }
+    values = {db_key: str(config_map[field]) for field, db_key in key_map.items() if field in config_map}
+    await run_in_sync_session(_save_alert_rules, body.get("rules", []), values)
+    return {"success": True, "message": "告警规则已更新"}
+
 
-    # 更新规则列表
-    rules_data = body.get("rules", [])
+def _save_alert_rules(db: Session, rules_data: List[dict], values: Dict[str, str]) -> None:
+    now = datetime.utcnow()
     for rd in rules_data:
         rule = db.query(AlertRule).filter_by(rule_key=rd.get("rule_key")).first()
         if not rule:
@@ -410,27 +510,22 @@ async def update_alert_rules(
         if "enabled" in rd:
             rule.enabled = bool(rd["enabled"])
         rule.updated_at = now
+    _save_system_configs(db, values)
+    # 时间窗口 / 冷却期可能变长，按新的保留时长重建滑动窗口
+    alert_detector.warm(db)
 
-    # 更新系统配置
-    config_map = body.get("config", {})
-    key_map = {
-        "offhour_start": "alert_offhour_start",
-        "offhour_end": "alert_offhour_end",
-        "offhour_tz": "alert_offhour_tz",
-        "cooldown_minutes": "alert_cooldown_minutes",
-        "sns_topic_arn": "sns_topic_arn",
-    }
-    for field, db_key in key_map.items():
-        if field in config_map:
-            cfg = db.query(SystemConfig).filter_by(key=db_key).first()
-            if cfg:
-                cfg.value = str(config_map[field])
-                cfg.updated_at = now
-            else:
-                db.add(SystemConfig(key=db_key, value=str(config_map[field]), updated_at=now))
 
-    db.commit()
-    return {"success": True, "message": "告警规则已更新"}
+def _save_system_configs(db: Session, values: Dict[str, str]) -> None:
+    """写入 / 新增 system_config 条目，随配置版本号一起提交"""
+    now = datetime.utcnow()
+    for key, value in values.items():
+        cfg = db.query(SystemConfig).filter_by(key=key).first()
+        if cfg:
+            cfg.value = value
+            cfg.updated_at = now
+        else:
+            db.add(SystemConfig(key=key, value=value, updated_at=now))
+    config_cache.bump(db)
 
 
 @router.get("/alert-events")
@@ -473,6 +568,9 @@ async def get_alert_events(
                     "event_detail": e.event_detail,
                     "notification_sent": e.notification_sent,
                     "notification_error": e.notification_error,
+                    "delivery_status": e.delivery_status,
+                    "delivery_attempts": e.delivery_attempts,
+                    "delivered_at": e.delivered_at.isoformat() if e.delivered_at else None,
                 }
                 for e in events
             ],
@@ -483,6 +581,16 @@ async def get_alert_events(
     }
 
 
+@router.get("/alert-events/outbox")
+async def get_alert_outbox_status(
+    current_user=Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """返回告警通知投递线程的吞吐、积压与延迟统计"""
+    from app.services.alert_outbox import alert_outbox
+    return {"success": True, "data": alert_outbox.get_stats(db)}
+
+
 # ─── SNS 测试发送 ─────────────────────────────────────────────────────────────
 
 @router.post("/alert-rules/test-sns")
@@ -495,6 +603,8 @@ async def test_sns_notification(
     import boto3
     from botocore.exceptions import ClientError
 
+    from app.services.alert_outbox import extract_region_from_arn
+
     topic_arn = body.get("sns_topic_arn", "").strip()
     if not topic_arn:
         raise HTTPException(status_code=400, detail="sns_topic_arn is required")
@@ -502,9 +612,11 @@ async def test_sns_notification(
     try:
         # 从 SNS ARN 中提取 region
         # ARN 格式: arn:aws-cn:sns:cn-northwest-1:123456789012:topic-name
-        region = _extract_region_from_arn(topic_arn)
+        region = extract_region_from_arn(topic_arn)
         sns = boto3.client("sns", region_name=region)
-        sns.publish(
+        # boto3 为阻塞调用，放到线程中执行，避免阻塞事件循环
+        await asyncio.to_thread(
+            sns.publish,
             TopicArn=topic_arn,
             Subject="[KiroCLI] SNS 测试通知",
             Message=f"这是来自 KiroCLI Platform 的测试消息，由管理员 {current_user.username} 触发。",
@@ -517,22 +629,6 @@ async def test_sns_notification(
     return {"success": True, "message": "测试消息已发送"}
 
 
-def _extract_region_from_arn(arn: str) -> str:
-    """
-    从 ARN 中提取 region
-    ARN 格式: arn:aws-cn:sns:cn-northwest-1:123456789012:topic-name
-    """
-    try:
-        parts = arn.split(":")
-        if len(parts) >= 4:
-            return parts[3]
-    except Exception:
-        pass
-    # 回退到配置文件中的 region
-    from app.config import settings
-    return settings.AWS_REGION
-
-
 # ─── 强制下线 ─────────────────────────────────────────────────────────────────
 
 @router.post("/users/{user_id}/force-logout")
@@ -540,18 +636,20 @@ async def force_logout_user(
     user_id: int,
     request: Request,
     current_user=Depends(require_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """强制下线指定用户：撤销所有 Refresh Token、关闭所有活动会话"""
     from app.services.gotty_service import gotty_service
+    from app.services.session_service import SessionService
     from app.services.token_service import token_service
 
-    user = db.query(User).filter_by(id=user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # 撤销所有 Refresh Token（立即生效，用户无法续期）
-    token_service.revoke_all_user_tokens(db, user_id)
+    await token_service.revoke_all_user_tokens(db, user_id)
+    user_principal_cache.invalidate(user_id)
 
     # 注意：Access Token 无法在此处主动加入黑名单。
     # Access Token 以 HttpOnly Cookie 形式存储在用户浏览器端，
@@ -562,13 +660,13 @@ async def force_logout_user(
 
     # 关闭所有活动 Gotty 会话
     active_sessions = (
-        db.query(SessionModel)
-        .filter(
-            SessionModel.user_id == user_id,
-            SessionModel.status.in_(["starting", "running"]),
+        await db.scalars(
+            select(SessionModel).where(
+                SessionModel.user_id == user_id,
+                SessionModel.status.in_(["starting", "running"]),
+            )
         )
-        .all()
-    )
+    ).all()
     from datetime import datetime
     for sess in active_sessions:
         try:
@@ -577,11 +675,16 @@ async def force_logout_user(
             pass
         sess.status = "closed"
         sess.closed_at = datetime.utcnow()
-    db.commit()
+        await db.run_sync(lambda sync_db: session_stats.record_close(sync_db, sess))
+    await db.commit()
+    for sess in active_sessions:
+        SessionService.on_session_closed(sess)
+    # 断开该用户的事件流，令牌撤销后不再推送
+    event_bus.disconnect_user(user_id)
 
     # 审计日志
     _audit_service.log(
-        db, "ADMIN_FORCE_LOGOUT",
+        None, "ADMIN_FORCE_LOGOUT",
         current_user.id, current_user.username,
         _get_client_ip(request), request.headers.get("User-Agent", ""),
         {"target_user_id": user_id, "target_username": user.username},
@@ -591,6 +694,100 @@ async def force_logout_user(
     return {"success": True, "message": f"用户 {user.username} 已强制下线"}
 
 
+# ─── Gotty 预热进程池 ────────────────────────────────────────────────────────
+
+@router.get("/gotty-pool/status")
+async def get_gotty_pool_status(
+    current_user=Depends(require_admin),
+):
+    """返回 Gotty 预热进程池的空闲数量与命中/未命中计数"""
+    from app.services.gotty_service import gotty_service
+    return {"success": True, "data": gotty_service.get_pool_stats()}
+
+
+# ─── Nginx 动态配置 ──────────────────────────────────────────────────────────
+
+@router.get("/nginx/status")
+async def get_nginx_status(
+    current_user=Depends(require_admin),
+):
+    """返回 Nginx 动态配置写入任务的 reload 次数、耗时与待处理变更"""
+    from app.services.nginx_config_service import nginx_config_writer
+    return {"success": True, "data": nginx_config_writer.get_stats()}
+
+
+# ─── 审计日志写入 ────────────────────────────────────────────────────────────
+
+@router.get("/audit-logs/writer/status")
+async def get_audit_writer_status(
+    current_user=Depends(require_admin),
+):
+    """返回审计日志批量写入队列长度、批次、溢出与丢弃计数"""
+    from app.services.audit_writer import audit_writer
+    return {"success": True, "data": audit_writer.get_stats()}
+
+
+# ─── 内存缓存 ────────────────────────────────────────────────────────────────
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    current_user=Depends(require_admin),
+):
+    """返回进程内缓存的大小与命中率"""
+    from app.core.security import get_token_cache_stats
+    from app.services.audit_count_cache import audit_count_cache
+    from app.services.token_service import token_service
+    return {
+        "success": True,
+        "data": {
+            "jwt_decode": get_token_cache_stats(),
+            "token_blacklist": token_service.stats(),
+            "user_principal": user_principal_cache.stats(),
+            "audit_log_count": audit_count_cache.stats(),
+            "alert_detector": alert_detector.stats(),
+            "config": config_cache.stats(),
+        },
+    }
+
+
+# ─── 会话每日汇总 ────────────────────────────────────────────────────────────
+
+@router.get("/session-stats/status")
+async def get_session_stats_status(
+    current_user=Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """返回会话每日汇总表的行数与最近一次重建耗时"""
+    return {"success": True, "data": session_stats.get_stats(db)}
+
+
+@router.post("/session-stats/rebuild")
+async def rebuild_session_stats(
+    days: int = Query(default=30, ge=1, le=3650),
+    current_user=Depends(require_admin),
+):
+    """从 sessions 原始行重新计算最近 days 天的会话每日汇总"""
+    from datetime import timedelta
+
+    end_day = datetime.utcnow().date() + timedelta(days=1)
+    start_day = end_day - timedelta(days=days)
+    rows = await run_in_sync_session(session_stats.rebuild, start_day, end_day)
+    return {
+        "success": True,
+        "data": {"start_date": start_day.isoformat(), "end_date": end_day.isoformat(), "rows": rows},
+    }
+
+
+# ─── 事件推送 ────────────────────────────────────────────────────────────────
+
+@router.get("/events/status")
+async def get_event_stream_status(
+    current_user=Depends(require_admin),
+):
+    """返回 SSE 连接数、已推送 / 丢弃事件数与慢速客户端数"""
+    return {"success": True, "data": event_bus.get_stats()}
+
+
 # ─── Secrets Manager 状态 ────────────────────────────────────────────────────
 
 @router.get("/secrets/status")
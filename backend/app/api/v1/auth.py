@@ -1,18 +1,20 @@
 import logging
 import secrets
 import time
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 from fastapi import APIRouter, BackgroundTasks, Cookie, Depends, HTTPException, Request, Response, status
 from fastapi.responses import RedirectResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.api.v1.dependencies import get_current_user
 from app.config import settings
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db, run_in_sync_session
 from app.core.exceptions import SAMLError
 from app.core.saml import get_saml_settings, is_saml_configured, parse_saml_attributes
 from app.core.security import create_access_token, decode_access_token
@@ -21,7 +23,10 @@ from app.core.database import SessionLocal
 from app.services.alert_service import AlertService
 from app.services.audit_service import AuditEventType, AuditService
 from app.services.device_service import device_service
+from app.services.event_bus import event_bus
 from app.services.gotty_service import gotty_service
+from app.services.session_service import SessionService
+from app.services.session_stats_service import session_stats
 from app.services.token_service import token_service
 from app.services.user_service import create_or_update_user
 
@@ -47,6 +52,15 @@ def _store_saml_state(fingerprint: str) -> str:
     return state_id
 
 
+def _saml_login_sync(
+    db: Session, user_info: dict, fingerprint_hash: str, client_ip: str, user_agent: str
+) -> Tuple[int, str, bool]:
+    """写入用户与设备记录，返回 (user_id, username, is_new_device)"""
+    user = create_or_update_user(db, user_info)
+    is_new_device = device_service.process_login(db, user.id, fingerprint_hash, client_ip, user_agent)
+    return user.id, user.username, is_new_device
+
+
 def _pop_saml_state(state_id: str) -> str:
     """取出并删除指纹，过期或不存在返回空字符串"""
     if not state_id:
@@ -116,7 +130,7 @@ async def saml_callback(
     request: Request,
     response: Response,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    async_db: AsyncSession = Depends(get_async_db),
 ):
     if not is_saml_configured():
         raise HTTPException(status_code=503, detail="SAML not configured")
@@ -153,36 +167,37 @@ async def saml_callback(
         if not user_info["email"] and "@" in (name_id or ""):
             user_info["email"] = name_id
 
-        user = create_or_update_user(db, user_info)
         # 从 saml_state cookie 取回设备指纹（AWS IAM Identity Center 会覆盖 RelayState，改用服务端 state）
         state_id = request.cookies.get("saml_state", "")
         fingerprint_hash = _pop_saml_state(state_id)
         if not fingerprint_hash:
             fingerprint_hash = request.headers.get("X-Device-Fingerprint", "")
-        is_new_device = device_service.process_login(db, user.id, fingerprint_hash, client_ip, user_agent)
+        user_id, username, is_new_device = await run_in_sync_session(
+            _saml_login_sync, user_info, fingerprint_hash, client_ip, user_agent
+        )
 
         token = create_access_token(
-            {"sub": str(user.id)},
+            {"sub": str(user_id)},
             expires_delta=timedelta(hours=settings.JWT_EXPIRATION_HOURS),
         )
-        refresh_token_plaintext = token_service.create_refresh_token(db, user.id)
+        refresh_token_plaintext = await token_service.create_refresh_token(async_db, user_id)
 
         # 审计日志：登录成功
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.LOGIN,
-            user.id, user.username, client_ip, user_agent,
+            _audit_service.log, None, AuditEventType.LOGIN,
+            user_id, username, client_ip, user_agent,
             {"method": "saml"}, "success"
         )
         # 告警检测：登录成功
         background_tasks.add_task(
             _alert_service.check_and_alert,
-            AuditEventType.LOGIN, user.id, client_ip, None, user.username,
+            AuditEventType.LOGIN, user_id, client_ip, None, username,
         )
         # 新设备登录审计
         if is_new_device:
             background_tasks.add_task(
-                _audit_service.log, db, AuditEventType.NEW_DEVICE_LOGIN,
-                user.id, user.username, client_ip, user_agent,
+                _audit_service.log, None, AuditEventType.NEW_DEVICE_LOGIN,
+                user_id, username, client_ip, user_agent,
                 {"fingerprint_preview": fingerprint_hash[:8] if fingerprint_hash else ""}, "success"
             )
 
@@ -205,7 +220,7 @@ async def saml_callback(
         return redirect
     except SAMLError as e:
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.LOGIN,
+            _audit_service.log, None, AuditEventType.LOGIN,
             None, None, client_ip, user_agent,
             {"method": "saml", "error": str(e)}, "failure"
         )
@@ -227,27 +242,34 @@ async def logout(
     access_token: Optional[str] = Cookie(default=None),
     refresh_token: Optional[str] = Cookie(default=None),
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     active_sessions = (
-        db.query(SessionModel)
-        .filter(
-            SessionModel.user_id == current_user.id,
-            SessionModel.status.in_(["starting", "running"]),
+        await db.scalars(
+            select(SessionModel).where(
+                SessionModel.user_id == current_user.id,
+                SessionModel.status.in_(["starting", "running"]),
+            )
         )
-        .all()
-    )
+    ).all()
     for sess in active_sessions:
         try:
             await gotty_service.stop_gotty(sess.gotty_pid, sess.gotty_port)
             sess.status = "closed"
+            # 不计时长（与原先一致），但记录结束时间，供每日汇总回填计算并发数
+            sess.closed_at = datetime.utcnow()
+            await db.run_sync(lambda sync_db: session_stats.record_close(sync_db, sess))
         except Exception:
             pass
-    db.commit()
+    await db.commit()
+    for sess in active_sessions:
+        if sess.status == "closed":
+            SessionService.on_session_closed(sess)
+    event_bus.disconnect_user(current_user.id)
 
     # 撤销 Refresh Token
     if refresh_token:
-        token_service.revoke_all_user_tokens(db, current_user.id)
+        await token_service.revoke_all_user_tokens(db, current_user.id)
 
     # 将 Access Token 加入黑名单
     if access_token:
@@ -256,11 +278,11 @@ async def logout(
             from datetime import datetime
             exp = payload.get("exp")
             expires_at = datetime.utcfromtimestamp(exp) if exp else datetime.utcnow()
-            token_service.blacklist_access_token(db, payload["jti"], current_user.id, expires_at)
+            await token_service.blacklist_access_token(db, payload["jti"], current_user.id, expires_at)
 
     # 审计日志：登出
     background_tasks.add_task(
-        _audit_service.log, db, AuditEventType.LOGOUT,
+        _audit_service.log, None, AuditEventType.LOGOUT,
         current_user.id, current_user.username,
         _get_client_ip(request), request.headers.get("User-Agent", ""),
         {}, "success"
@@ -321,7 +343,6 @@ async def register_device(
     request: Request,
     background_tasks: BackgroundTasks,
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
     """登录后由前端主动上报设备指纹（用于 SAML 跨站 POST 无法携带 cookie 的场景）"""
     body = await request.json()
@@ -332,11 +353,13 @@ async def register_device(
     if not fingerprint_hash:
         return {"success": True, "data": {"registered": False}}
 
-    is_new_device = device_service.process_login(db, current_user.id, fingerprint_hash, client_ip, user_agent)
+    is_new_device = await run_in_sync_session(
+        device_service.process_login, current_user.id, fingerprint_hash, client_ip, user_agent
+    )
 
     if is_new_device:
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.NEW_DEVICE_LOGIN,
+            _audit_service.log, None, AuditEventType.NEW_DEVICE_LOGIN,
             current_user.id, current_user.username, client_ip, user_agent,
             {"fingerprint_preview": fingerprint_hash[:8]}, "success"
         )
@@ -348,17 +371,17 @@ async def register_device(
 async def refresh_token(
     response: Response,
     refresh_token: Optional[str] = Cookie(default=None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """使用 Refresh Token 轮换签发新的 Access Token 和 Refresh Token"""
     if not refresh_token:
         raise HTTPException(status_code=401, detail={"code": "NO_REFRESH_TOKEN", "message": "Refresh token missing"})
 
-    new_refresh = token_service.rotate_refresh_token(db, refresh_token)
+    new_refresh = await token_service.rotate_refresh_token(db, refresh_token)
     if not new_refresh:
         raise HTTPException(status_code=401, detail={"code": "INVALID_REFRESH_TOKEN", "message": "Invalid or expired refresh token"})
 
-    user_id = token_service.verify_refresh_token(db, new_refresh)
+    user_id = await token_service.verify_refresh_token(db, new_refresh)
     if not user_id:
         raise HTTPException(status_code=401, detail={"code": "INVALID_REFRESH_TOKEN", "message": "Invalid refresh token"})
 
@@ -1,17 +1,19 @@
 from typing import Optional
 
 from fastapi import Cookie, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal
 from app.core.security import decode_access_token
 from app.models.user import User
+from app.services.user_principal_cache import UserPrincipal, user_principal_cache
 
 
-def get_current_user(
-    access_token: Optional[str] = Cookie(default=None),
-    db: Session = Depends(get_db),
-) -> User:
+async def get_current_user(access_token: Optional[str] = Cookie(default=None)) -> UserPrincipal:
+    """
+    缓存未命中时才查库，且使用用完即关的短会话：连接立即归还连接池，
+    不会在处理函数的请求级会话之外再占用一个连接直到请求结束（并发高时会耗尽连接池）。
+    """
     if not access_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -29,7 +31,17 @@ def get_current_user(
     jti = payload.get("jti")
     if jti:
         from app.services.token_service import token_service
-        if token_service.is_blacklisted(jti, db):
+        # 黑名单缓存已初始化时先查内存；未命中时按轮询间隔拉取其他 worker 新拉黑的记录，
+        # 间隔内的请求不占用数据库连接
+        if token_service.initialized:
+            revoked = await token_service.is_blacklisted(jti)
+            if not revoked and token_service.needs_sync():
+                async with AsyncSessionLocal() as db:
+                    revoked = await token_service.sync_blacklist(db, jti)
+        else:
+            async with AsyncSessionLocal() as db:
+                revoked = await token_service.is_blacklisted(jti, db)
+        if revoked:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail={"code": "TOKEN_REVOKED", "message": "Token has been revoked"},
@@ -42,16 +54,23 @@ def get_current_user(
             detail={"code": "INVALID_TOKEN", "message": "Invalid token payload"},
         )
 
-    user = db.query(User).filter_by(id=int(user_id)).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"code": "USER_NOT_FOUND", "message": "User not found"},
-        )
-    return user
+    principal = user_principal_cache.get(int(user_id))
+    if principal is not None:
+        return principal
+
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).filter_by(id=int(user_id)))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail={"code": "USER_NOT_FOUND", "message": "User not found"},
+            )
+        principal = UserPrincipal.from_user(user)
+    user_principal_cache.put(principal)
+    return principal
 
 
-def require_admin(current_user: User = Depends(get_current_user)) -> User:
+async def require_admin(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
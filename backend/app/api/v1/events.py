@@ -0,0 +1,40 @@
+from typing import Optional
+
+from fastapi import APIRouter, Cookie, Depends, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.api.v1.dependencies import get_current_user
+from app.core.security import decode_access_token
+from app.services.event_bus import TOPICS, event_bus
+from app.services.user_principal_cache import UserPrincipal
+
+router = APIRouter()
+
+
+@router.get("")
+async def stream_events(
+    topics: str = Query(default="sessions", description="逗号分隔：sessions / alerts / metrics"),
+    access_token: Optional[str] = Cookie(default=None),
+    current_user: UserPrincipal = Depends(get_current_user),
+):
+    """
+    SSE 事件流（text/event-stream）。会话事件只包含本人的会话（管理员为全部），
+    告警事件仅管理员可订阅。连接在访问令牌过期时结束，客户端刷新令牌后重连。
+    客户端收到 resync 事件（积压过多被丢弃）或重连后应通过 REST 接口重新拉取一次。
+    """
+    is_admin = current_user.role == "admin"
+    wanted = {t.strip() for t in topics.split(",") if t.strip()} & TOPICS
+    if not is_admin:
+        wanted.discard("alerts")
+    sub = event_bus.subscribe(current_user.id, is_admin, frozenset(wanted or {"sessions"}))
+
+    payload = decode_access_token(access_token) if access_token else None
+    deadline = payload.get("exp") if payload else None
+    return StreamingResponse(
+        event_bus.stream(sub, deadline),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # 客户端在开始推送前断开时生成器不会执行，由后台任务兜底释放连接名额
+        background=BackgroundTask(event_bus.unsubscribe, sub),
+    )
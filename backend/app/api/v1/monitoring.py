@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, Query
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from app.api.v1.dependencies import get_current_user, require_admin
 from app.core.database import get_db
+from app.services.metrics_sampler import metrics_sampler
+from app.services.metrics_store import METRICS, TIER_NAMES, choose_tier, metrics_store
 from app.services.monitoring_service import MonitoringService
 
 router = APIRouter()
@@ -19,6 +24,33 @@ async def get_realtime(
     return {"success": True, "data": data}
 
 
+@router.get("/history")
+async def get_history(
+    minutes: int = Query(default=15, ge=1, le=1440),
+    current_user=Depends(get_current_user),
+):
+    """返回最近 minutes 分钟的主机指标采样（来自内存环形缓冲区）"""
+    samples = [s.as_dict() for s in metrics_sampler.history(minutes)]
+    return {"success": True, "data": {"samples": samples, "interval_seconds": metrics_sampler.interval_seconds}}
+
+
+@router.get("/timeseries")
+async def get_timeseries(
+    metric: str = Query(...),
+    hours: float = Query(default=24, gt=0, le=24 * 365 * 3),
+    current_user=Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """返回最近 hours 小时的指标时间序列，按跨度自动选择 1 分钟 / 1 小时 / 1 天粒度"""
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric, expected one of: {', '.join(METRICS)}")
+    end = datetime.utcnow()
+    start = end - timedelta(hours=hours)
+    tier = choose_tier(end - start)
+    points = metrics_store.query(db, metric, start, end, tier)
+    return {"success": True, "data": {"metric": metric, "resolution": TIER_NAMES[tier], "points": points}}
+
+
 @router.get("/statistics")
 async def get_statistics(
     days: int = Query(default=7, ge=1, le=90),
@@ -34,13 +66,37 @@ async def get_statistics(
 async def export_report(
     start_date: str = Query(default=""),
     end_date: str = Query(default=""),
+    report: str = Query(default="sessions", pattern="^(sessions|daily)$"),
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(default=False),
+    columns: Optional[str] = Query(default=None, description="逗号分隔的列名，默认导出全部原有列"),
+    user_id: Optional[int] = Query(default=None),
+    username: Optional[str] = Query(default=None),
+    status: Optional[str] = Query(default=None, description="逗号分隔的会话状态"),
     current_user=Depends(require_admin),
     db: Session = Depends(get_db),
 ):
+    """
+    report=sessions 流式导出每个会话（CSV / NDJSON，可选 gzip、列选择、按用户 / 状态过滤）；
+    report=daily 导出按天 / 用户的会话汇总
+    """
     service = MonitoringService(db)
-    csv_content = service.export_csv(start_date, end_date)
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=sessions_report.csv"},
-    )
+    if report == "daily":
+        return Response(
+            content=service.export_daily_csv(start_date, end_date),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=sessions_daily_report.csv"},
+        )
+
+    filters = {}
+    if user_id:
+        filters["user_id"] = user_id
+    if username:
+        filters["username"] = username
+    if status:
+        filters["status"] = [s.strip() for s in status.split(",") if s.strip()]
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    try:
+        return service.export(start_date, end_date, filters, selected, fmt=format, compress=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
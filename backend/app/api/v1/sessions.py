@@ -1,10 +1,11 @@
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.v1.dependencies import get_current_user
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal, get_async_db
 from app.core.exceptions import (
     DailyQuotaExceededError,
     GottyStartupError,
@@ -14,25 +15,47 @@ from app.core.exceptions import (
 )
 from app.core.security import decode_access_token
 from app.models.session import Session as SessionModel
-from app.models.user import User
 from app.services.audit_service import AuditEventType, AuditService
 from app.services.session_service import SessionService
+from app.services.session_token_index import SessionTokenEntry, session_token_index
+from app.services.token_service import token_service
+from app.services.user_principal_cache import UserPrincipal
+from app.utils.pagination import decode_cursor
 
 router = APIRouter()
 _audit_service = AuditService()
 
 
+async def _lookup_session_token(token: str) -> Optional[SessionTokenEntry]:
+    """优先查活动会话内存索引，未命中（已关闭或未知 token）再回退到数据库"""
+    entry = session_token_index.get(token)
+    if entry is not None:
+        return entry
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(SessionModel.id, SessionModel.user_id, SessionModel.status, SessionModel.gotty_port)
+            .filter_by(random_token=token)
+        )
+        row = result.first()
+    if row is None:
+        return None
+    return SessionTokenEntry(session_id=row.id, user_id=row.user_id, status=row.status, port=row.gotty_port)
+
+
 @router.get("/token-verify")
 async def token_verify(
     request: Request,
+    response: Response,
     background_tasks: BackgroundTasks,
     x_session_token: Optional[str] = Header(default=None, alias="X-Session-Token"),
-    db: Session = Depends(get_db),
 ):
     """
     供 Nginx auth_request 调用的 Token 绑定验证接口。
     从 Cookie 读取 JWT，从请求头 X-Session-Token 读取 session_token，
     验证两者绑定关系。
+    验证通过时通过 X-Gotty-Port 响应头返回会话端口，
+    Nginx 用 auth_request_set 取得端口直接路由，新会话无需 reload。
+    活动会话命中内存索引时不占用数据库连接；审计日志交给批量写入线程。
     """
     client_ip = request.headers.get("X-Forwarded-For", "").split(",")[0].strip() or (
         request.client.host if request.client else ""
@@ -42,7 +65,7 @@ async def token_verify(
     access_token = request.cookies.get("access_token")
     if not access_token:
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.TOKEN_VERIFY_FAIL,
+            _audit_service.log, None, AuditEventType.TOKEN_VERIFY_FAIL,
             None, None, client_ip, request.headers.get("User-Agent"),
             {"reason": "missing_jwt_cookie", "path": str(request.url)}, "failure"
         )
@@ -52,7 +75,7 @@ async def token_verify(
     payload = decode_access_token(access_token)
     if payload is None:
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.TOKEN_VERIFY_FAIL,
+            _audit_service.log, None, AuditEventType.TOKEN_VERIFY_FAIL,
             None, None, client_ip, request.headers.get("User-Agent"),
             {"reason": "invalid_jwt", "path": str(request.url)}, "failure"
         )
@@ -62,15 +85,20 @@ async def token_verify(
     if jwt_user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT payload")
 
+    # 已登出 / 被撤销的 Access Token（内存黑名单，登出后下一次请求即拒绝）
+    jti = payload.get("jti")
+    if jti and await token_service.is_blacklisted(jti):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+
     # 3. 验证 session_token 存在
     if not x_session_token:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Missing session token")
 
     # 4. 查找会话
-    session = db.query(SessionModel).filter_by(random_token=x_session_token).first()
+    session = await _lookup_session_token(x_session_token)
     if not session:
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.TOKEN_VERIFY_FAIL,
+            _audit_service.log, None, AuditEventType.TOKEN_VERIFY_FAIL,
             int(jwt_user_id), None, client_ip, request.headers.get("User-Agent"),
             {"reason": "session_not_found", "session_token": x_session_token}, "failure"
         )
@@ -79,9 +107,9 @@ async def token_verify(
     # 5. 检查会话状态
     if session.status == "closed":
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.TOKEN_VERIFY_FAIL,
+            _audit_service.log, None, AuditEventType.TOKEN_VERIFY_FAIL,
             int(jwt_user_id), None, client_ip, request.headers.get("User-Agent"),
-            {"reason": "session_closed", "session_id": session.id}, "failure"
+            {"reason": "session_closed", "session_id": session.session_id}, "failure"
         )
         raise HTTPException(status_code=410, detail="Session already closed")
 
@@ -90,7 +118,7 @@ async def token_verify(
     # 6. 验证用户归属
     if str(session.user_id) != str(jwt_user_id):
         background_tasks.add_task(
-            _audit_service.log, db, AuditEventType.TOKEN_VERIFY_FAIL,
+            _audit_service.log, None, AuditEventType.TOKEN_VERIFY_FAIL,
             int(jwt_user_id), None, client_ip, request.headers.get("User-Agent"),
             {
                 "reason": "user_mismatch",
@@ -101,14 +129,15 @@ async def token_verify(
         )
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User mismatch")
 
+    response.headers["X-Gotty-Port"] = str(session.port)
     return {"success": True}
 
 
 @router.post("/start")
 async def start_session(
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
     service = SessionService(db)
     try:
@@ -139,9 +168,14 @@ async def list_sessions(
     user_id: Optional[int] = Query(default=None),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """
+    会话列表。默认按 offset 分页；传入上一页返回的 next_cursor 时
+    按 (started_at, id) 游标分页，深翻页代价不随页码增长。
+    """
     service = SessionService(db)
     filter_user_id = None
     if current_user.role == "admin" and user_id is not None:
@@ -149,18 +183,23 @@ async def list_sessions(
     elif current_user.role != "admin":
         filter_user_id = current_user.id
 
-    sessions, total = service.get_sessions(
-        user_id=filter_user_id, status=status, limit=limit, offset=offset
+    decoded_cursor = None
+    if cursor:
+        try:
+            decoded_cursor = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows, total, next_cursor = await service.get_sessions(
+        user_id=filter_user_id, status=status, limit=limit, offset=offset, cursor=decoded_cursor
     )
 
-    from app.models.user import User as UserModel
     session_list = []
-    for sess in sessions:
-        u = db.query(UserModel).filter_by(id=sess.user_id).first()
+    for sess, username in rows:
         session_list.append({
             "id": sess.id,
             "user_id": sess.user_id,
-            "username": u.username if u else None,
+            "username": username,
             "gotty_url": sess.gotty_url,
             "random_token": sess.random_token,
             "status": sess.status,
@@ -171,33 +210,36 @@ async def list_sessions(
 
     return {
         "success": True,
-        "data": {"sessions": session_list, "total": total, "limit": limit, "offset": offset},
+        "data": {
+            "sessions": session_list,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_cursor": next_cursor,
+        },
     }
 
 
 @router.get("/{session_id}")
 async def get_session(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    from app.models.session import Session as SessionModel
-    from app.models.user import User as UserModel
-
-    query = db.query(SessionModel).filter_by(id=session_id)
-    if current_user.role != "admin":
-        query = query.filter_by(user_id=current_user.id)
-    sess = query.first()
-    if not sess:
+    service = SessionService(db)
+    row = await service.get_session_detail(
+        session_id, user_id=None if current_user.role == "admin" else current_user.id
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    u = db.query(UserModel).filter_by(id=sess.user_id).first()
+    sess, username = row
     return {
         "success": True,
         "data": {
             "id": sess.id,
             "user_id": sess.user_id,
-            "username": u.username if u else None,
+            "username": username,
             "gotty_url": sess.gotty_url,
             "random_token": sess.random_token,
             "gotty_pid": sess.gotty_pid,
@@ -213,8 +255,8 @@ async def get_session(
 @router.delete("/{session_id}")
 async def close_session(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
     service = SessionService(db)
     try:
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from app.api.v1.dependencies import get_current_user
-from app.core.database import get_db
+from app.core.database import get_db, run_in_sync_session
 from app.services.device_service import device_service
 from app.services.user_service import UserService
 
@@ -27,10 +27,8 @@ async def get_preferences(
 async def update_preferences(
     body: dict,
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    service = UserService(db)
-    service.update_preferences(current_user.id, body)
+    await run_in_sync_session(lambda db: UserService(db).update_preferences(current_user.id, body))
     return {"success": True, "message": "Preferences updated"}
 
 
@@ -53,14 +51,13 @@ async def update_my_device(
     device_id: int,
     body: dict,
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
     """更新设备名称（最大 50 字符）"""
     name = body.get("device_name", "").strip()
     if not name:
         raise HTTPException(status_code=400, detail="device_name is required")
     try:
-        device_service.update_device_name(db, current_user.id, device_id, name)
+        await run_in_sync_session(device_service.update_device_name, current_user.id, device_id, name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"success": True, "message": "设备名称已更新"}
@@ -71,12 +68,11 @@ async def delete_my_device(
     device_id: int,
     request: Request,
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
     """删除设备，不允许删除当前设备"""
     current_fp = request.headers.get("X-Device-Fingerprint", "")
     try:
-        device_service.delete_device(db, current_user.id, device_id, current_fp)
+        await run_in_sync_session(device_service.delete_device, current_user.id, device_id, current_fp)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except PermissionError as e:
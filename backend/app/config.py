@@ -9,6 +9,8 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "change-me-to-a-random-secret-key"
 
     DATABASE_URL: str = "sqlite:///./data.db"
+    # 会话状态在进程内维护，后端只能以单个 worker 运行；启动时对该文件加排他锁，第二个进程拒绝启动
+    INSTANCE_LOCK_FILE: str = "./backend.lock"
 
     SAML_IDP_ENTITY_ID: Optional[str] = None
     SAML_IDP_SSO_URL: Optional[str] = None
@@ -23,12 +25,23 @@ class Settings(BaseSettings):
     GOTTY_PRIMARY_PORT: int = 7860
     GOTTY_PORT_START: int = 7861
     GOTTY_PORT_END: int = 7960
+    GOTTY_PORT_QUARANTINE_SECONDS: float = 5.0  # 端口释放后的隔离期，避免立即复用
     GOTTY_CERT_PATH: Optional[str] = None
     GOTTY_KEY_PATH: Optional[str] = None
     GOTTY_PATH: str = "/usr/local/bin/gotty"
     KIRO_CLI_PATH: str = "kiro-cli"
     GOTTY_REMOTE_MODE: bool = False
     GOTTY_REMOTE_HOST: Optional[str] = None
+    # 终端路由模式：
+    #   map          - 生成 gotty_routes.conf（token → port map），每次会话变更需 reload Nginx
+    #   auth_request - token-verify 通过 X-Gotty-Port 响应头返回端口，Nginx 用 auth_request_set 路由，无需 reload
+    GOTTY_ROUTING_MODE: str = "map"
+
+    # Gotty 预热进程池：预先启动空闲 Gotty 进程，会话创建时直接取用
+    GOTTY_POOL_ENABLED: bool = False
+    GOTTY_POOL_SIZE: int = 4        # 补充时的目标空闲数量
+    GOTTY_POOL_MIN_IDLE: int = 2    # 空闲数量低于该值时触发后台补充
+    GOTTY_POOL_MAX_IDLE: int = 8    # 空闲数量上限
 
     SSH_HOST: str = ""
     SSH_PORT: int = 22
@@ -45,11 +58,58 @@ class Settings(BaseSettings):
 
     DOMAIN: Optional[str] = None
 
+    # Nginx 动态配置写入：防抖窗口内的多次变更合并为一次 reload
+    NGINX_RELOAD_DEBOUNCE_SECONDS: float = 1.0
+
+    # 审计日志批量写入：事件入队后由写入线程按批量 / 时间间隔写库
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 0.5
+    AUDIT_QUEUE_MAX_SIZE: int = 10000
+    AUDIT_QUEUE_FULL_POLICY: str = "drop_oldest"    # drop_newest / drop_oldest / block
+    AUDIT_QUEUE_BLOCK_TIMEOUT_SECONDS: float = 0.1  # block 策略下调用方最长等待时间
+    AUDIT_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0    # 关闭时等待队列写完的最长时间
+    AUDIT_COUNT_CACHE_TTL_SECONDS: float = 60       # 审计日志列表总数缓存时间，过期后后台刷新
+    # 审计日志保留：热表 / 归档保留天数在 SystemConfig 中配置
+    AUDIT_ARCHIVE_DIR: str = "./audit_archive"
+    AUDIT_RETENTION_INTERVAL_HOURS: float = 24
+
+    # 告警通知投递（outbox）：alert_events 中待发送的事件由投递线程批量发送
+    ALERT_NOTIFIER: str = "sns"                     # sns / log（本地 / 离线环境，写入日志或文件）
+    ALERT_NOTIFIER_LOG_FILE: str = ""               # log 通知器输出文件（JSON Lines），为空时写应用日志
+    ALERT_OUTBOX_BATCH_SIZE: int = 50
+    ALERT_OUTBOX_WORKERS: int = 4                   # 并发发送线程数
+    ALERT_OUTBOX_POLL_SECONDS: float = 5            # 无新告警唤醒时的轮询间隔
+    ALERT_OUTBOX_MAX_ATTEMPTS: int = 6
+    ALERT_OUTBOX_BACKOFF_BASE_SECONDS: float = 5    # 第 n 次失败后等待 base * 2^(n-1) 秒（带随机抖动）
+    ALERT_OUTBOX_BACKOFF_MAX_SECONDS: float = 900
+    ALERT_OUTBOX_SEND_TIMEOUT_SECONDS: float = 10   # 单次发送的连接 / 读取超时
+
+    # 主机指标后台采样：环形缓冲区保留最近 METRICS_HISTORY_MINUTES 分钟的采样
+    METRICS_SAMPLE_INTERVAL_SECONDS: float = 5
+    METRICS_HISTORY_MINUTES: float = 60
+    # 监控时序存储各粒度保留时长：1 分钟 / 1 小时 / 1 天
+    METRICS_MINUTE_RETENTION_HOURS: float = 48
+    METRICS_HOUR_RETENTION_DAYS: float = 90
+    METRICS_DAY_RETENTION_DAYS: float = 1095
+    # 服务端事件推送（SSE）：连接数上限、每个连接的待发送队列长度（超出时丢弃并通知客户端重新拉取）
+    EVENTS_MAX_CONNECTIONS: int = 500
+    EVENTS_MAX_CONNECTIONS_PER_USER: int = 5
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_HEARTBEAT_SECONDS: float = 15
+    EVENTS_METRICS_INTERVAL_SECONDS: float = 5   # 有订阅者时推送实时监控指标的间隔
+    # Prometheus /metrics：多 worker 时设置共享目录（启动前清空），状态类指标按间隔刷新
+    PROMETHEUS_MULTIPROC_DIR: str = ""
+    PROMETHEUS_REFRESH_SECONDS: float = 5
+
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "/var/log/kirocli-platform/backend.log"
 
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 8
+    JWT_CACHE_MAX_ENTRIES: int = 10000  # 已验证 JWT 解码结果缓存条目上限，0 表示禁用
+    USER_CACHE_TTL_SECONDS: float = 30  # get_current_user 用户身份缓存时间，0 表示禁用
+    CONFIG_CACHE_POLL_SECONDS: float = 2  # 告警规则 / 系统配置缓存检查版本号的间隔（多 worker 同步）
+    TOKEN_BLACKLIST_POLL_SECONDS: float = 1  # 拉取其他 worker 新拉黑 token 的间隔，0 表示每次内存未命中都查库
 
     SESSION_IDLE_TIMEOUT_MINUTES: int = 30
     SESSION_CLEANUP_INTERVAL_MINUTES: int = 5
@@ -1,16 +1,80 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+from typing import Callable, TypeVar
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.config import settings
+from app.core.prometheus import DB_POOL_CHECKOUT_SECONDS
+
+
+class TimedQueuePool(QueuePool):
+    """记录从连接池取连接的等待时间（含池满时的排队和新建连接）"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """异步引擎的连接池，同样记录取连接的等待时间"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-)
+
+# 数据库类型 -> 默认异步驱动
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def _engine_options(url: str, poolclass=TimedQueuePool) -> dict:
+    options = {}
+    if "sqlite" in url:
+        options["connect_args"] = {"check_same_thread": False}
+    # 内存 SQLite 使用 SingletonThreadPool / StaticPool，保持默认
+    if make_url(url).database not in (None, "", ":memory:"):
+        options["poolclass"] = poolclass
+    return options
+
+
+def _async_url(url: str) -> str:
+    """DATABASE_URL 换成对应的异步驱动（已指定异步驱动时保持不变）"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS or parsed.get_driver_name() in ASYNC_DRIVERS.values():
+        return url
+    drivername = f"{backend}+{ASYNC_DRIVERS[backend]}"
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 请求处理函数使用的异步引擎：查询不阻塞事件循环。
+# 同步引擎继续用于建表 / 迁移、独立脚本、后台线程（审计写入、告警投递、指标汇总等）。
+# SQLite 只允许一个写事务：异步事务在 await 期间持有写锁，此时在事件循环线程中执行同步写入
+# 会阻塞事件循环直到锁超时，因此事件循环中的写入应使用异步会话或交给线程执行。
+ASYNC_DATABASE_URL = _async_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool)
+)
+
+# expire_on_commit=False：提交后仍可读取对象属性（异步会话不能隐式懒加载）
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -22,6 +86,59 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+T = TypeVar("T")
+
+
+async def run_in_sync_session(fn: Callable[..., T], *args) -> T:
+    """
+    在线程池中用一个独立的同步会话执行 fn(db, *args)，返回其结果（fn 负责 commit）。
+    供仍基于同步 Session 的服务在请求处理函数中写库，写入不会在事件循环线程上等待 SQLite 写锁。
+    """
+
+    def _call() -> T:
+        with SessionLocal() as db:
+            return fn(db, *args)
+
+    return await asyncio.to_thread(_call)
+
+
 def init_db():
     from app.models import user, session, permission, preference, group  # noqa
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _create_missing_indexes()
+
+    from app.services.audit_search import init_search_index
+    init_search_index(engine)
+
+
+def _add_missing_columns():
+    """create_all 不会为已存在的表补加列，这里为新增列执行 ALTER TABLE ADD COLUMN（新增列须可空或带 server_default）"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                conn.execute(text(ddl))
+
+
+def _create_missing_indexes():
+    """create_all 不会为已存在的表补建索引，这里逐个检查并补建新增索引"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
@@ -65,3 +65,8 @@ class IAMSyncError(AppException):
 class SAMLError(AppException):
     def __init__(self, message: str = "SAML error"):
         super().__init__(message, "SAML_ERROR", 400)
+
+
+class EventStreamLimitError(AppException):
+    def __init__(self, message: str = "Too many event stream connections"):
+        super().__init__(message, "EVENT_STREAM_LIMIT", 429)
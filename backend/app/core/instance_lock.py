@@ -0,0 +1,56 @@
+"""
+后端单实例锁
+
+会话相关状态只在进程内维护：Gotty 子进程与预热池、端口分配（PortManager）、
+会话准入计数（admission_controller）、活动会话 Token 索引（session_token_index），
+启动时的会话恢复也会把其他进程创建、本进程看不到的会话标记为关闭。
+因此后端只能以单个进程运行（uvicorn 不加 --workers）。
+
+lifespan 启动时先对 INSTANCE_LOCK_FILE 加非阻塞排他锁（flock），已有进程持有时拒绝启动；
+进程退出（包括被 kill）时锁由操作系统自动释放，不会残留。
+"""
+import fcntl
+import logging
+import os
+from typing import IO, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InstanceLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO[str]] = None
+
+    def acquire(self) -> None:
+        """获取排他锁并写入本进程 pid；已被其他进程持有时抛出 RuntimeError"""
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.seek(0)
+            owner = f.read().strip() or "unknown"
+            f.close()
+            raise RuntimeError(
+                f"Another backend process (pid {owner}) holds {self.path}; "
+                f"the backend keeps session state in memory and must run as a single worker"
+            )
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        logger.info(f"Instance lock acquired: {self.path}")
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+# 全局单例
+instance_lock = InstanceLock(settings.INSTANCE_LOCK_FILE)
@@ -0,0 +1,245 @@
+"""
+Prometheus 指标
+
+GET /metrics 以 Prometheus 文本格式输出：
+- 每个路由的请求耗时 / 请求数（按路由模板，如 /api/v1/sessions/token-verify）
+- Gotty 启动耗时，按阶段拆分：端口分配 / 进程启动 / token 提取
+- 端口池各状态端口数与使用率、预热池命中
+- Nginx reload 次数与耗时
+- 审计日志写入队列长度、告警通知待发送数
+- 数据库连接池取连接的等待时间与已借出连接数
+- Token 黑名单缓存大小
+
+多 worker 部署时设置 PROMETHEUS_MULTIPROC_DIR（每次启动前清空该目录），
+各进程把计数写入该目录下的 mmap 文件，任一 worker 响应 /metrics 时汇总所有进程的值。
+计数器 / 直方图在事件发生时更新；队列长度等状态类指标由每个 worker 定期刷新
+（PROMETHEUS_REFRESH_SECONDS），响应 /metrics 的 worker 在输出前再刷新一次自身的值。
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from app.config import settings
+
+# prometheus_client 在导入时根据该环境变量决定是否使用多进程模式，必须先设置
+if settings.PROMETHEUS_MULTIPROC_DIR and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.makedirs(settings.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = settings.PROMETHEUS_MULTIPROC_DIR
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client import REGISTRY  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# ── 指标定义 ──────────────────────────────────────────────────────────────────
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "kirocli_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUESTS = Counter(
+    "kirocli_http_requests_total",
+    "HTTP requests by route template and status code",
+    ["method", "route", "status"],
+)
+
+GOTTY_SPAWN_SECONDS = Histogram(
+    "kirocli_gotty_spawn_seconds",
+    "Gotty spawn time by phase (port_allocation / process_exec / token_extraction / total)",
+    ["phase"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15),
+)
+GOTTY_POOL_REQUESTS = Counter(
+    "kirocli_gotty_pool_requests_total",
+    "Session starts served from the warm pool (hit) or by spawning (miss)",
+    ["result"],
+)
+PORT_POOL_PORTS = Gauge(
+    "kirocli_port_pool_ports",
+    "Gotty ports by state, as seen by each worker",
+    ["state"],
+    multiprocess_mode="liveall",
+)
+PORT_POOL_UTILIZATION = Gauge(
+    "kirocli_port_pool_utilization_ratio",
+    "Share of Gotty ports allocated or in use",
+    multiprocess_mode="livemax",
+)
+
+NGINX_RELOADS = Counter(
+    "kirocli_nginx_reloads_total",
+    "Nginx config test + reload attempts by result",
+    ["result"],
+)
+NGINX_RELOAD_SECONDS = Histogram(
+    "kirocli_nginx_reload_duration_seconds",
+    "Time spent in nginx -t and nginx -s reload",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+AUDIT_QUEUE_DEPTH = Gauge(
+    "kirocli_audit_queue_depth",
+    "Audit events waiting for the batch writer",
+    multiprocess_mode="livesum",
+)
+AUDIT_DROPPED = Gauge(
+    "kirocli_audit_dropped_events",
+    "Audit events dropped since the worker started (queue full or write failure)",
+    multiprocess_mode="livesum",
+)
+ALERT_OUTBOX_PENDING = Gauge(
+    "kirocli_alert_outbox_pending",
+    "Alert notifications waiting for delivery",
+    multiprocess_mode="livemax",
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "kirocli_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "kirocli_db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],  # sync / async
+    multiprocess_mode="livesum",
+)
+
+TOKEN_BLACKLIST_SIZE = Gauge(
+    "kirocli_token_blacklist_cache_entries",
+    "Entries in the in-memory access token blacklist",
+    multiprocess_mode="livemax",
+)
+
+
+# ── 请求耗时中间件 ────────────────────────────────────────────────────────────
+
+class PrometheusMiddleware:
+    """
+    纯 ASGI 中间件，记录每个请求的耗时与状态码。
+    路由标签取匹配到的路由模板（路径参数不展开），未匹配的请求记为 "unmatched"，避免标签基数失控。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
+
+
+# ── 状态类指标刷新 ────────────────────────────────────────────────────────────
+
+def refresh() -> None:
+    """从各组件读取当前状态写入 Gauge（同步，含一次告警通知待发送数查询，在线程中调用）"""
+    from app.core.database import SessionLocal, async_engine, engine
+    from app.services.alert_outbox import alert_outbox
+    from app.services.audit_writer import audit_writer
+    from app.services.gotty_service import gotty_service
+    from app.services.token_service import token_service
+
+    ports = gotty_service.port_manager.get_stats()
+    total = ports.pop("total")
+    for state, count in ports.items():
+        PORT_POOL_PORTS.labels(state).set(count)
+    busy = ports.get("allocated", 0) + ports.get("in_use", 0)
+    PORT_POOL_UTILIZATION.set(busy / total if total else 0.0)
+
+    writer = audit_writer.get_stats()
+    AUDIT_QUEUE_DEPTH.set(writer["queue_size"])
+    AUDIT_DROPPED.set(writer["dropped"])
+
+    TOKEN_BLACKLIST_SIZE.set(token_service.blacklist_size())
+
+    for label, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        checkedout = getattr(pool, "checkedout", None)
+        if checkedout is not None:
+            DB_POOL_CHECKED_OUT.labels(label).set(checkedout())
+
+    db = SessionLocal()
+    try:
+        ALERT_OUTBOX_PENDING.set(alert_outbox.pending_count(db))
+    finally:
+        db.close()
+
+
+def render() -> bytes:
+    """刷新本进程的状态类指标后输出文本格式（多进程模式下汇总所有 worker）"""
+    try:
+        refresh()
+    except Exception as e:
+        logger.warning(f"Prometheus gauge refresh failed: {e}")
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class PrometheusRefresher:
+    """多进程模式下每个 worker 定期刷新自身的状态类指标，供其他 worker 响应 /metrics 时读取"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = max(interval_seconds, 0.5)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if MULTIPROCESS and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if MULTIPROCESS:
+            # 移除本进程的 live* Gauge 文件，退出的 worker 不再计入汇总
+            multiprocess.mark_process_dead(os.getpid())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(refresh)
+            except Exception as e:
+                logger.warning(f"Prometheus gauge refresh failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+# 全局单例
+prometheus_refresher = PrometheusRefresher(settings.PROMETHEUS_REFRESH_SECONDS)
@@ -1,12 +1,102 @@
+import hashlib
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from jose import JWTError, jwt
 
 from app.config import settings
 
 
+class _DecodedTokenCache:
+    """
+    已验证 JWT 的解码结果缓存（LRU + 到期淘汰）。
+
+    以 token 的 SHA-256 摘要为键，条目在 token 自身的 exp 到期；
+    SECRET_KEY 变化时整体失效。同步处理函数和后台线程中也会解码 token，需加锁。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._jti_index: Dict[str, str] = {}
+        self._secret_key = settings.SECRET_KEY
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> Optional[dict]:
+        with self._lock:
+            self._check_secret_key()
+            item = self._entries.get(digest)
+            if item is None:
+                self.misses += 1
+                return None
+            payload, expires_at = item
+            if expires_at <= time.time():
+                self._evict(digest)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def put(self, digest: str, payload: dict) -> None:
+        exp = payload.get("exp")
+        if not exp or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_secret_key()
+            self._entries[digest] = (payload, float(exp))
+            self._entries.move_to_end(digest)
+            jti = payload.get("jti")
+            if jti:
+                self._jti_index[jti] = digest
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate_jti(self, jti: str) -> None:
+        with self._lock:
+            digest = self._jti_index.get(jti)
+            if digest:
+                self._evict(digest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._jti_index.clear()
+            self._secret_key = settings.SECRET_KEY
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _evict(self, digest: str) -> None:
+        item = self._entries.pop(digest, None)
+        if item is not None:
+            jti = item[0].get("jti")
+            if jti and self._jti_index.get(jti) == digest:
+                del self._jti_index[jti]
+
+    def _check_secret_key(self) -> None:
+        if self._secret_key != settings.SECRET_KEY:
+            self._entries.clear()
+            self._jti_index.clear()
+            self._secret_key = settings.SECRET_KEY
+
+
+_token_cache = _DecodedTokenCache(settings.JWT_CACHE_MAX_ENTRIES)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -19,10 +109,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 
 def decode_access_token(token: str) -> Optional[dict]:
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        return dict(payload)
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
     except JWTError:
         return None
+    _token_cache.put(digest, payload)
+    return dict(payload)
+
+
+def invalidate_token_cache(jti: Optional[str] = None) -> None:
+    """按 jti 淘汰单个缓存条目；不传 jti 时清空整个缓存（如 SECRET_KEY 轮换）"""
+    if jti:
+        _token_cache.invalidate_jti(jti)
+    else:
+        _token_cache.clear()
+
+
+def get_token_cache_stats() -> dict:
+    return _token_cache.stats()
 
 
 def verify_token(token: str) -> Optional[int]:
@@ -4,12 +4,13 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
-from app.api.v1 import auth, sessions, monitoring, admin, users
+from app.api.v1 import auth, sessions, monitoring, admin, users, events
 from app.config import settings
 from app.core.database import init_db
 from app.core.exceptions import AppException
+from app.core.prometheus import CONTENT_TYPE_LATEST, PrometheusMiddleware, prometheus_refresher
 
 logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL, logging.INFO))
 logger = logging.getLogger(__name__)
@@ -18,16 +19,26 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up KiroCLI Platform backend...")
+    # 会话状态只在本进程内维护，拒绝以多个 worker / 多个实例运行（须在恢复会话状态之前）
+    from app.core.instance_lock import instance_lock
+    instance_lock.acquire()
     init_db()
     logger.info("Database initialized")
 
-    from app.core.database import SessionLocal
+    from app.core.database import AsyncSessionLocal, SessionLocal, async_engine
     from app.services.session_service import SessionService
 
     db = SessionLocal()
     try:
-        service = SessionService(db)
-        await service.restore_sessions_on_startup()
+        # 首次启用会话每日汇总时从 sessions 回填（须在恢复会话状态之前，之后的关闭由增量更新记录）
+        from app.services.session_stats_service import session_stats
+        try:
+            await asyncio.to_thread(session_stats.backfill_if_empty, db)
+        except Exception as e:
+            logger.warning(f"Session daily stats backfill skipped: {e}")
+
+        async with AsyncSessionLocal() as async_db:
+            await SessionService(async_db).restore_sessions_on_startup()
         logger.info("Session state restored")
 
         # 初始化 Nginx IP 白名单配置
@@ -44,6 +55,13 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"Token blacklist cache init skipped: {e}")
 
+        # 从数据库预热告警规则滑动窗口
+        from app.services.alert_detector import alert_detector
+        try:
+            alert_detector.warm(db)
+        except Exception as e:
+            logger.warning(f"Alert detector warm-up skipped: {e}")
+
         # 检测 SECRET_KEY 是否轮换
         from app.services.secrets_manager import secrets_loader
         try:
@@ -53,17 +71,45 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
 
+    # 启动审计日志批量写入线程
+    from app.services.audit_writer import audit_writer
+    audit_writer.start()
+
+    # 启动告警通知投递线程（发送 alert_events 中待发送的通知，包括上次退出时未发送的）
+    from app.services.alert_outbox import alert_outbox
+    alert_outbox.start()
+
+    # 启动 Nginx 动态配置写入任务（合并路由 / 白名单变更后统一 reload）
+    from app.services.nginx_config_service import nginx_config_writer
+    nginx_config_writer.start()
+
+    # 启动主机指标后台采样
+    from app.services.metrics_sampler import metrics_sampler
+    metrics_sampler.start()
+
+    # 启动监控时序存储（每分钟写入 1 分钟数据并汇总到小时 / 天）
+    from app.services.metrics_store import metrics_store
+    metrics_store.start()
+
+    # 启动事件总线（SSE 推送会话 / 告警事件与实时监控指标）
+    from app.services.event_bus import event_bus
+    event_bus.start()
+
+    # 多 worker 时定期刷新本进程的 Prometheus 状态类指标
+    prometheus_refresher.start()
+
+    # 启动 Gotty 预热进程池（后台补充，不阻塞启动）
+    from app.services.gotty_service import gotty_service
+    gotty_service.start_pool()
+
     async def cleanup_task():
         while True:
             await asyncio.sleep(settings.SESSION_CLEANUP_INTERVAL_MINUTES * 60)
-            db = SessionLocal()
             try:
-                service = SessionService(db)
-                await service.cleanup_idle_sessions()
+                async with AsyncSessionLocal() as async_db:
+                    await SessionService(async_db).cleanup_idle_sessions()
             except Exception as e:
                 logger.error(f"Cleanup error: {e}")
-            finally:
-                db.close()
 
     async def token_cleanup_task():
         """每 24 小时清理过期 Token 记录"""
@@ -78,11 +124,39 @@ async def lifespan(app: FastAPI):
             finally:
                 db.close()
 
+    async def audit_retention_task():
+        """定期归档超过热数据保留期的审计日志，删除过期归档；启动后先执行一次"""
+        from app.services.audit_archive import audit_archive
+        from app.services.audit_count_cache import audit_count_cache
+        while True:
+            db = SessionLocal()
+            try:
+                await asyncio.to_thread(audit_archive.run, db)
+                audit_count_cache.clear()
+            except Exception as e:
+                logger.error(f"Audit retention error: {e}")
+            finally:
+                db.close()
+            await asyncio.sleep(settings.AUDIT_RETENTION_INTERVAL_HOURS * 3600)
+
     task = asyncio.create_task(cleanup_task())
     token_task = asyncio.create_task(token_cleanup_task())
+    retention_task = asyncio.create_task(audit_retention_task())
     yield
     task.cancel()
     token_task.cancel()
+    retention_task.cancel()
+    await event_bus.stop()
+    await prometheus_refresher.stop()
+    await metrics_store.stop()
+    await metrics_sampler.stop()
+    await gotty_service.stop_pool()
+    await nginx_config_writer.stop()
+    await alert_outbox.stop()
+    # 最后停止审计写入，确保关闭过程中产生的审计事件也能落库
+    await audit_writer.stop()
+    await async_engine.dispose()
+    instance_lock.release()
     logger.info("Shutting down")
 
 
@@ -99,6 +173,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(PrometheusMiddleware)
 
 
 @app.exception_handler(AppException)
@@ -117,16 +192,23 @@ app.include_router(sessions.router, prefix="/api/v1/sessions", tags=["sessions"]
 app.include_router(monitoring.router, prefix="/api/v1/monitoring", tags=["monitoring"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["admin"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
+app.include_router(events.router, prefix="/api/v1/events", tags=["events"])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 文本格式指标（后端只监听 127.0.0.1，Nginx 只转发 /api/，不对外暴露）"""
+    from app.core.prometheus import render
+    return Response(content=await asyncio.to_thread(render), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/api/v1/health")
 async def health_check():
-    from app.core.database import SessionLocal
+    from app.core.database import AsyncSessionLocal
     db_status = "connected"
     try:
-        db = SessionLocal()
-        db.execute(__import__("sqlalchemy").text("SELECT 1"))
-        db.close()
+        async with AsyncSessionLocal() as db:
+            await db.execute(__import__("sqlalchemy").text("SELECT 1"))
     except Exception:
         db_status = "disconnected"
 
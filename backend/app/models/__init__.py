@@ -1,5 +1,5 @@
 from app.models.user import User
-from app.models.session import Session, AppSession
+from app.models.session import Session, AppSession, SessionDailyStats
 from app.models.permission import UserPermission
 from app.models.preference import UserPreference
 from app.models.group import UserGroup, GroupRoleMapping
@@ -11,12 +11,14 @@ from app.models.alert import AlertRule, AlertEvent
 from app.models.token import RefreshToken, BlacklistedToken
 from app.models.device import UserDevice
 from app.models.system_config import SystemConfig
+from app.models.metric_point import MetricPoint
 
 __all__ = [
     # v1.0
     "User",
     "Session",
     "AppSession",
+    "SessionDailyStats",
     "UserPermission",
     "UserPreference",
     "UserGroup",
@@ -30,4 +32,5 @@ __all__ = [
     "BlacklistedToken",
     "UserDevice",
     "SystemConfig",
+    "MetricPoint",
 ]
@@ -28,8 +28,14 @@ class AlertEvent(Base):
     event_detail = Column(Text, nullable=True)          # JSON
     notification_sent = Column(Boolean, default=False, nullable=False)
     notification_error = Column(Text, nullable=True)
+    # 通知投递（outbox）：pending / sent / failed，NULL 表示无需通知
+    delivery_status = Column(String(20), nullable=True)
+    delivery_attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    next_attempt_at = Column(DateTime, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
 
 
 Index("idx_alert_events_rule_key", AlertEvent.rule_key)
 Index("idx_alert_events_triggered_at", AlertEvent.triggered_at)
 Index("idx_alert_events_user_id", AlertEvent.triggered_user_id)
+Index("idx_alert_events_delivery", AlertEvent.delivery_status, AlertEvent.next_attempt_at)
@@ -19,6 +19,8 @@ class AuditLog(Base):
     result = Column(String(20), nullable=False)  # 'success' / 'failure'
 
 
-Index("idx_audit_logs_user_id", AuditLog.user_id)
-Index("idx_audit_logs_event_type", AuditLog.event_type)
 Index("idx_audit_logs_event_time", AuditLog.event_time)
+# 列表页按 user_id / event_type 过滤并按 event_time 倒序翻页；
+# 复合索引的前缀同时覆盖单列 user_id / event_type 查询
+Index("idx_audit_logs_user_time", AuditLog.user_id, AuditLog.event_time)
+Index("idx_audit_logs_type_time", AuditLog.event_type, AuditLog.event_time)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Float, Index, Integer, SmallInteger
+
+from app.core.database import Base
+
+
+class MetricPoint(Base):
+    """
+    时序指标定长记录：每个 (指标, 粒度, 时间桶) 一行，只存聚合值。
+    WITHOUT ROWID 表按主键聚簇存储，同一指标同一粒度的时间桶在磁盘上连续。
+    """
+    __tablename__ = "metric_points"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    metric_id = Column(SmallInteger, primary_key=True)
+    tier = Column(SmallInteger, primary_key=True)      # 0: 1 分钟 / 1: 1 小时 / 2: 1 天
+    bucket = Column(Integer, primary_key=True)         # 时间桶起点（UTC epoch 秒）
+    count = Column(Integer, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
+
+# 汇总 / 清理 / 按天读取所有指标时按 (粒度, 时间桶) 范围查找
+Index("idx_metric_points_tier_bucket", MetricPoint.tier, MetricPoint.bucket)
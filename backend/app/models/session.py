@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, String
 
 from app.core.database import Base
 
@@ -25,6 +25,19 @@ Index("idx_sessions_user_id", Session.user_id)
 Index("idx_sessions_status", Session.status)
 Index("idx_sessions_started_at", Session.started_at)
 Index("idx_sessions_gotty_port", Session.gotty_port)
+Index("idx_sessions_random_token", Session.random_token)
+
+
+class SessionDailyStats(Base):
+    """按 (UTC 日期, 用户) 汇总的会话统计，随会话创建 / 关闭增量更新"""
+    __tablename__ = "session_daily_stats"
+
+    day = Column(Date, primary_key=True)                    # 会话 started_at 所在日期
+    user_id = Column(Integer, primary_key=True)
+    session_count = Column(Integer, nullable=False, default=0)
+    closed_count = Column(Integer, nullable=False, default=0)           # 已关闭且有时长的会话数
+    total_duration_seconds = Column(Integer, nullable=False, default=0)  # 已关闭会话的时长合计
+    max_concurrency = Column(Integer, nullable=False, default=0)        # 当天创建会话时该用户的最大活动会话数
 
 
 class AppSession(Base):
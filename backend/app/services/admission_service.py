@@ -0,0 +1,114 @@
+"""
+会话准入控制
+
+内存维护每个用户的活动会话数和当日（UTC）已创建会话数，
+会话创建前原子地预占名额，Gotty 启动失败时归还；关闭会话时释放活动名额。
+启动时从 sessions 表重建计数。所有操作均无 await，在事件循环内天然原子。
+计数只在本进程内有效，后端以单个 worker 运行（见 app.core.instance_lock）。
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.exceptions import DailyQuotaExceededError, SessionLimitExceededError
+from app.models.permission import UserPermission
+from app.models.session import Session as SessionModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_SESSIONS = 3
+DEFAULT_DAILY_SESSION_QUOTA = 10
+
+
+class AdmissionController:
+    def __init__(self):
+        self._active: Dict[int, int] = defaultdict(int)
+        self._daily: Dict[int, int] = defaultdict(int)
+        self._day: date = datetime.utcnow().date()
+        # user_id -> (max_concurrent_sessions, daily_session_quota)
+        self._limits: Dict[int, Tuple[int, int]] = {}
+
+    def load(self, db: Session) -> None:
+        """启动时从 sessions 表重建活动数和当日创建数"""
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        active_rows = (
+            db.query(SessionModel.user_id, func.count(SessionModel.id))
+            .filter(SessionModel.status.in_(["starting", "running"]))
+            .group_by(SessionModel.user_id)
+            .all()
+        )
+        daily_rows = (
+            db.query(SessionModel.user_id, func.count(SessionModel.id))
+            .filter(SessionModel.started_at >= today_start)
+            .group_by(SessionModel.user_id)
+            .all()
+        )
+        self._active = defaultdict(int, {uid: cnt for uid, cnt in active_rows})
+        self._daily = defaultdict(int, {uid: cnt for uid, cnt in daily_rows})
+        self._day = today_start.date()
+        self._limits.clear()
+        logger.info(
+            f"Admission counters initialized: {sum(self._active.values())} active sessions, "
+            f"{sum(self._daily.values())} started today"
+        )
+
+    def get_limits(self, db: Session, user_id: int) -> Tuple[int, int]:
+        limits = self._limits.get(user_id)
+        if limits is None:
+            perm = db.query(UserPermission).filter_by(user_id=user_id).first()
+            limits = (
+                perm.max_concurrent_sessions if perm else DEFAULT_MAX_CONCURRENT_SESSIONS,
+                perm.daily_session_quota if perm else DEFAULT_DAILY_SESSION_QUOTA,
+            )
+            self._limits[user_id] = limits
+        return limits
+
+    def invalidate_limits(self, user_id: int) -> None:
+        self._limits.pop(user_id, None)
+
+    def acquire(self, user_id: int, max_sessions: int, daily_quota: int) -> None:
+        """检查并预占一个活动名额和一个当日名额，超限时抛出异常"""
+        self._roll_day()
+        current = self._active[user_id]
+        if current >= max_sessions:
+            raise SessionLimitExceededError(current, max_sessions)
+        if self._daily[user_id] >= daily_quota:
+            raise DailyQuotaExceededError()
+        self._active[user_id] = current + 1
+        self._daily[user_id] += 1
+
+    def cancel(self, user_id: int) -> None:
+        """会话创建失败，归还 acquire 预占的两个名额"""
+        self._roll_day()
+        self._decrement(self._active, user_id)
+        self._decrement(self._daily, user_id)
+
+    def release(self, user_id: int) -> None:
+        """会话关闭，释放活动名额（当日创建数不变）"""
+        self._decrement(self._active, user_id)
+
+    def get_counts(self, user_id: int) -> dict:
+        self._roll_day()
+        return {"active": self._active.get(user_id, 0), "today": self._daily.get(user_id, 0)}
+
+    def _roll_day(self) -> None:
+        today = datetime.utcnow().date()
+        if today != self._day:
+            self._daily = defaultdict(int)
+            self._day = today
+
+    @staticmethod
+    def _decrement(counter: Dict[int, int], user_id: int) -> None:
+        value = counter.get(user_id, 0) - 1
+        if value > 0:
+            counter[user_id] = value
+        else:
+            counter.pop(user_id, None)
+
+
+# 全局单例
+admission_controller = AdmissionController()
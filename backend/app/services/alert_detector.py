@@ -0,0 +1,269 @@
+"""
+告警规则流式检测
+
+在内存中维护告警规则所需的滑动窗口状态，事件发生时更新，检测时不再查询数据库：
+- 会话创建（session_burst）：每个用户最近的会话创建时间
+- 登录失败（login_failure）：每个 IP 最近的登录失败时间
+- 多 IP 登录（multi_ip_login）：每个用户各登录 IP 的最后一次成功登录时间
+- 冷却期：每条规则（及用户）最近一次触发告警的时间
+
+窗口内保存的是事件时间本身而非按秒 / 分钟分桶的计数，去重 IP 也是精确集合而非
+HyperLogLog 估计：规则阈值都很小（默认 3~10），分桶会让窗口边界、HLL 会让阈值附近的
+判定与原先基于 audit_logs / sessions 的 COUNT 结果不一致。
+判断"是否超过阈值"时只需从最新一端检查至多 threshold + 1 个元素，与流量大小无关。
+
+状态启动时从数据库预热，规则时间窗口变更后重新预热。
+log() 与会话创建既在事件循环中也在线程池中调用，所有方法加锁。
+"""
+import logging
+import threading
+from bisect import insort
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.alert import AlertEvent
+from app.models.audit_log import AuditLog
+from app.models.session import Session as SessionModel
+from app.services.audit_writer import audit_writer
+from app.services.config_cache import config_cache
+
+logger = logging.getLogger(__name__)
+
+# 窗口保留时长下限，以及单个 key 保留的事件数上限（洪峰时只保留最新的部分）
+MIN_HORIZON = timedelta(hours=1)
+MAX_EVENTS_PER_KEY = 10000
+# 每记录这么多事件清理一次已过期的 key
+SWEEP_EVERY = 10000
+WARM_FLUSH_TIMEOUT_SECONDS = 5
+
+
+def _append(events: Deque[datetime], ts: datetime) -> None:
+    """按时间顺序追加；多线程写入可能略有乱序，此时插入到正确位置"""
+    if not events or events[-1] <= ts:
+        events.append(ts)
+    else:
+        items = list(events)
+        insort(items, ts)
+        events.clear()
+        events.extend(items)
+    if len(events) > MAX_EVENTS_PER_KEY:
+        events.popleft()
+
+
+def _count_exceeds(events: Optional[Deque[datetime]], since: datetime, threshold: int) -> bool:
+    """窗口 [since, ∞) 内的事件数是否 > threshold，最多检查 threshold + 1 个元素"""
+    if not events:
+        return False
+    seen = 0
+    for ts in reversed(events):
+        if ts < since:
+            return False
+        seen += 1
+        if seen > threshold:
+            return True
+    return False
+
+
+class AlertDetector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session_starts: Dict[int, Deque[datetime]] = defaultdict(deque)
+        self._login_failures: Dict[str, Deque[datetime]] = defaultdict(deque)
+        self._login_ips: Dict[int, Dict[str, datetime]] = defaultdict(dict)
+        self._last_alert: Dict[Tuple[str, Optional[int]], datetime] = {}
+        self._horizon = MIN_HORIZON
+        self._observed = 0
+        self.warmed_at: Optional[datetime] = None
+
+    # ── 预热 ──────────────────────────────────────────────────────────────────
+
+    def warm(self, db: Session, now: Optional[datetime] = None) -> None:
+        """从 sessions / audit_logs / alert_events 重建窗口状态"""
+        # 仍在批量写入队列中的登录事件先落库，否则重建后会丢失
+        audit_writer.flush(WARM_FLUSH_TIMEOUT_SECONDS)
+        now = now or datetime.utcnow()
+        horizon = self._compute_horizon(db)
+        since = now - horizon
+
+        session_rows = (
+            db.query(SessionModel.user_id, SessionModel.started_at)
+            .filter(SessionModel.started_at >= since)
+            .order_by(SessionModel.started_at)
+            .all()
+        )
+        failure_rows = (
+            db.query(AuditLog.client_ip, AuditLog.event_time)
+            .filter(
+                AuditLog.event_type == "LOGIN",
+                AuditLog.result == "failure",
+                AuditLog.client_ip.isnot(None),
+                AuditLog.event_time >= since,
+            )
+            .order_by(AuditLog.event_time)
+            .all()
+        )
+        ip_rows = (
+            db.query(AuditLog.user_id, AuditLog.client_ip, func.max(AuditLog.event_time))
+            .filter(
+                AuditLog.event_type == "LOGIN",
+                AuditLog.result == "success",
+                AuditLog.user_id.isnot(None),
+                AuditLog.client_ip.isnot(None),
+                AuditLog.event_time >= since,
+            )
+            .group_by(AuditLog.user_id, AuditLog.client_ip)
+            .all()
+        )
+        alert_rows = (
+            db.query(AlertEvent.rule_key, AlertEvent.triggered_user_id, func.max(AlertEvent.triggered_at))
+            .filter(AlertEvent.triggered_at >= since)
+            .group_by(AlertEvent.rule_key, AlertEvent.triggered_user_id)
+            .all()
+        )
+
+        session_starts: Dict[int, Deque[datetime]] = defaultdict(deque)
+        for user_id, started_at in session_rows:
+            _append(session_starts[user_id], started_at)
+        login_failures: Dict[str, Deque[datetime]] = defaultdict(deque)
+        for client_ip, event_time in failure_rows:
+            _append(login_failures[client_ip], event_time)
+        login_ips: Dict[int, Dict[str, datetime]] = defaultdict(dict)
+        for user_id, client_ip, last_seen in ip_rows:
+            login_ips[user_id][client_ip] = last_seen
+        last_alert: Dict[Tuple[str, Optional[int]], datetime] = {}
+        for rule_key, user_id, triggered_at in alert_rows:
+            self._merge_alert(last_alert, rule_key, user_id, triggered_at)
+
+        with self._lock:
+            self._horizon = horizon
+            self._session_starts = session_starts
+            self._login_failures = login_failures
+            self._login_ips = login_ips
+            self._last_alert = last_alert
+            self.warmed_at = now
+        logger.info(
+            f"Alert detector warmed ({horizon}): {len(session_rows)} session starts, "
+            f"{len(failure_rows)} login failures, {len(ip_rows)} user/IP pairs"
+        )
+
+    @staticmethod
+    def _compute_horizon(db: Session) -> timedelta:
+        """窗口保留时长取所有规则窗口与冷却期的最大值"""
+        horizon = MIN_HORIZON
+        snapshot = config_cache.get(db)
+        for rule in snapshot.rules:
+            if rule.rule_key == "multi_ip_login":
+                window = timedelta(hours=rule.time_window_minutes // 60 or 1)
+            else:
+                window = timedelta(minutes=rule.time_window_minutes)
+            horizon = max(horizon, window)
+        try:
+            horizon = max(horizon, timedelta(minutes=int(snapshot.configs.get("alert_cooldown_minutes", "30"))))
+        except ValueError:
+            pass
+        return horizon
+
+    # ── 事件 ──────────────────────────────────────────────────────────────────
+
+    def observe_login(
+        self, user_id: Optional[int], client_ip: Optional[str], result: str, event_time: datetime
+    ) -> None:
+        with self._lock:
+            if result == "failure" and client_ip:
+                _append(self._login_failures[client_ip], event_time)
+            elif result == "success" and user_id is not None and client_ip:
+                # 与原 COUNT(DISTINCT client_ip) 一致：缺少 IP 的登录不计入不同 IP 数
+                ips = self._login_ips[user_id]
+                if ips.get(client_ip) is None or ips[client_ip] < event_time:
+                    ips[client_ip] = event_time
+            self._after_observe(event_time)
+
+    def observe_session(self, user_id: int, started_at: datetime) -> None:
+        with self._lock:
+            _append(self._session_starts[user_id], started_at)
+            self._after_observe(started_at)
+
+    def record_alert(self, rule_key: str, user_id: Optional[int], triggered_at: datetime) -> None:
+        with self._lock:
+            self._merge_alert(self._last_alert, rule_key, user_id, triggered_at)
+
+    @staticmethod
+    def _merge_alert(target: dict, rule_key: str, user_id: Optional[int], triggered_at: datetime) -> None:
+        # (rule_key, None) 记录该规则任意用户的最近一次告警，供无用户的冷却期判断
+        for key in ((rule_key, user_id), (rule_key, None)):
+            if target.get(key) is None or target[key] < triggered_at:
+                target[key] = triggered_at
+
+    # ── 检测 ──────────────────────────────────────────────────────────────────
+
+    def session_burst(self, user_id: int, since: datetime, threshold: int) -> bool:
+        """同一用户 since 之后创建会话次数超过 threshold"""
+        with self._lock:
+            return _count_exceeds(self._session_starts.get(user_id), since, threshold)
+
+    def login_failure(self, client_ip: str, since: datetime, threshold: int) -> bool:
+        """同一 IP since 之后登录失败次数超过 threshold"""
+        with self._lock:
+            return _count_exceeds(self._login_failures.get(client_ip), since, threshold)
+
+    def multi_ip(self, user_id: int, since: datetime, threshold: int) -> bool:
+        """同一账号 since 之后从超过 threshold 个不同 IP 成功登录"""
+        with self._lock:
+            seen = 0
+            for last_seen in self._login_ips.get(user_id, {}).values():
+                if last_seen >= since:
+                    seen += 1
+                    if seen > threshold:
+                        return True
+            return False
+
+    def in_cooldown(self, rule_key: str, user_id: Optional[int], since: datetime) -> bool:
+        """同规则（有用户时同用户）在 since 之后是否已触发过告警"""
+        with self._lock:
+            last = self._last_alert.get((rule_key, user_id or None))
+            return last is not None and last >= since
+
+    # ── 清理 / 统计 ────────────────────────────────────────────────────────────
+
+    def _after_observe(self, now: datetime) -> None:
+        self._observed += 1
+        if self._observed % SWEEP_EVERY == 0:
+            self._sweep(now - self._horizon)
+
+    def _sweep(self, cutoff: datetime) -> None:
+        """删除窗口保留时长之外的事件及空 key（调用方持锁）"""
+        for mapping in (self._session_starts, self._login_failures):
+            for key in list(mapping):
+                events = mapping[key]
+                while events and events[0] < cutoff:
+                    events.popleft()
+                if not events:
+                    del mapping[key]
+        for user_id in list(self._login_ips):
+            ips = self._login_ips[user_id]
+            for ip in [ip for ip, ts in ips.items() if ts < cutoff]:
+                del ips[ip]
+            if not ips:
+                del self._login_ips[user_id]
+        for key in [k for k, ts in self._last_alert.items() if ts < cutoff]:
+            del self._last_alert[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "horizon_minutes": int(self._horizon.total_seconds() // 60),
+                "observed_events": self._observed,
+                "session_users": len(self._session_starts),
+                "login_failure_ips": len(self._login_failures),
+                "login_ip_users": len(self._login_ips),
+                "cooldown_keys": len(self._last_alert),
+                "warmed_at": self.warmed_at.isoformat() if self.warmed_at else None,
+            }
+
+
+# 全局单例
+alert_detector = AlertDetector()
@@ -0,0 +1,419 @@
+"""
+告警通知投递（outbox）
+
+check_and_alert 只在 alert_events 中写入 delivery_status = 'pending' 的事件并唤醒投递线程，
+不在事件循环中调用 boto3、也不在重试等待期间占用数据库会话。投递线程：
+
+1. 取出到期的待发送事件（next_attempt_at 为空或已到），逐条以条件 UPDATE 认领：
+   认领时把 next_attempt_at 推后一个租约时长，多个 worker 不会重复发送，
+   发送中途进程退出的事件在租约到期后重新发送
+2. 在线程池中并发调用通知器发送
+3. 成功标记 sent；失败按指数退避加随机抖动安排下次发送，超过最大次数标记 failed
+
+通知器可替换：sns 发送到配置的 SNS Topic，log 写入本地文件 / 应用日志，
+供测试和无法访问 AWS 的环境使用；也可通过 set_notifier() 注入自定义实现。
+"""
+import abc
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.database import SessionLocal
+from app.models.alert import AlertEvent
+from app.services.config_cache import config_cache
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_PENDING = "pending"
+DELIVERY_SENT = "sent"
+DELIVERY_FAILED = "failed"
+
+THROUGHPUT_WINDOW_SECONDS = 60
+
+
+def build_message(rule_key: str, detail: Dict[str, Any]) -> Tuple[str, str]:
+    """返回 (subject, message)"""
+    subject = f"[KiroCLI Alert] {rule_key}"
+    message = (
+        f"告警类型: {rule_key}\n"
+        f"用户: {detail.get('username') or detail.get('user_id', 'unknown')}\n"
+        f"IP: {detail.get('client_ip', 'unknown')}\n"
+        f"时间: {detail.get('event_time', '')}\n"
+    )
+    return subject, message
+
+
+def extract_region_from_arn(arn: str) -> str:
+    """
+    从 ARN 中提取 region
+    ARN 格式: arn:aws-cn:sns:cn-northwest-1:123456789012:topic-name
+    """
+    parts = arn.split(":")
+    if len(parts) >= 4 and parts[3]:
+        return parts[3]
+    # 回退到配置文件中的 region
+    return settings.AWS_REGION
+
+
+# ── 通知器 ────────────────────────────────────────────────────────────────────
+
+class AlertNotifier(abc.ABC):
+    """通知器接口：publish 在投递线程池中调用，失败时抛出异常"""
+
+    name = "base"
+    # 为 True 时需要配置 sns_topic_arn 才会投递
+    requires_topic = True
+
+    @abc.abstractmethod
+    def publish(self, topic_arn: str, subject: str, message: str, detail: Dict[str, Any]) -> None:
+        ...
+
+
+class SNSNotifier(AlertNotifier):
+    name = "sns"
+    requires_topic = True
+
+    def __init__(self, timeout_seconds: float):
+        self._timeout = timeout_seconds
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _client(self, region: str):
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                import boto3
+                from botocore.config import Config
+
+                # 重试由 outbox 负责，这里只发送一次且限制超时
+                client = boto3.client(
+                    "sns",
+                    region_name=region,
+                    config=Config(
+                        connect_timeout=self._timeout,
+                        read_timeout=self._timeout,
+                        retries={"total_max_attempts": 1},
+                    ),
+                )
+                self._clients[region] = client
+            return client
+
+    def publish(self, topic_arn: str, subject: str, message: str, detail: Dict[str, Any]) -> None:
+        self._client(extract_region_from_arn(topic_arn)).publish(
+            TopicArn=topic_arn, Subject=subject, Message=message
+        )
+
+
+class LogNotifier(AlertNotifier):
+    """本地通知器：写入 JSON Lines 文件，未配置文件时写应用日志"""
+
+    name = "log"
+    requires_topic = False
+
+    def __init__(self, path: str = ""):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def publish(self, topic_arn: str, subject: str, message: str, detail: Dict[str, Any]) -> None:
+        if not self._path:
+            logger.warning(f"{subject}\n{message}")
+            return
+        line = json.dumps(
+            {"subject": subject, "message": message, "detail": detail, "sent_at": datetime.utcnow().isoformat()},
+            ensure_ascii=False,
+        )
+        with self._lock, open(self._path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def create_notifier(name: str) -> AlertNotifier:
+    if name == "log":
+        return LogNotifier(settings.ALERT_NOTIFIER_LOG_FILE)
+    if name != "sns":
+        logger.warning(f"Unknown ALERT_NOTIFIER '{name}', using sns")
+    return SNSNotifier(settings.ALERT_OUTBOX_SEND_TIMEOUT_SECONDS)
+
+
+# ── 投递线程 ──────────────────────────────────────────────────────────────────
+
+@dataclass
+class AlertOutboxStats:
+    delivered: int = 0
+    attempts: int = 0
+    failed_attempts: int = 0
+    dead: int = 0               # 超过最大次数、不再重试的事件数
+    batches: int = 0
+    last_batch_size: int = 0
+    last_batch_ms: float = 0.0
+    last_lag_seconds: float = 0.0   # 最近一条通知从触发到送达的时间
+    max_lag_seconds: float = 0.0
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "delivered": self.delivered,
+            "attempts": self.attempts,
+            "failed_attempts": self.failed_attempts,
+            "dead": self.dead,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+            "last_error": self.last_error,
+        }
+
+
+def backoff_seconds(attempts: int) -> float:
+    """第 attempts 次失败后的等待时间：指数退避，在 [delay/2, delay] 内随机抖动"""
+    delay = min(
+        settings.ALERT_OUTBOX_BACKOFF_MAX_SECONDS,
+        settings.ALERT_OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)),
+    )
+    return random.uniform(delay / 2, delay)
+
+
+class AlertOutbox:
+    def __init__(self, notifier: Optional[AlertNotifier] = None):
+        self._notifier = notifier
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._delivered_at: Deque[float] = deque()
+        self.stats = AlertOutboxStats()
+
+    @property
+    def notifier(self) -> AlertNotifier:
+        if self._notifier is None:
+            self._notifier = create_notifier(settings.ALERT_NOTIFIER)
+        return self._notifier
+
+    def set_notifier(self, notifier: AlertNotifier) -> None:
+        self._notifier = notifier
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def should_deliver(self, configs: Dict[str, str]) -> bool:
+        """新告警是否需要通知（SNS 通知器未配置 Topic 时不通知）"""
+        return not self.notifier.requires_topic or bool(configs.get("sns_topic_arn"))
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.ALERT_OUTBOX_WORKERS), thread_name_prefix="alert-notify"
+        )
+        self._thread = threading.Thread(target=self._run, name="alert-outbox", daemon=True)
+        self._thread.start()
+        logger.info(f"Alert outbox started (notifier {self.notifier.name})")
+
+    async def stop(self) -> None:
+        """停止投递线程；未发送的事件留在 outbox 中，下次启动后继续发送"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        await asyncio.to_thread(self._thread.join, settings.ALERT_OUTBOX_SEND_TIMEOUT_SECONDS * 2)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+        logger.info(f"Alert outbox stopped: {self.stats.as_dict()}")
+
+    def wake(self) -> None:
+        """有新的待发送事件时调用，投递线程立即处理"""
+        self._wakeup.set()
+
+    @staticmethod
+    def pending_count(db: Session) -> int:
+        return (
+            db.query(func.count(AlertEvent.id))
+            .filter(AlertEvent.delivery_status == DELIVERY_PENDING)
+            .scalar()
+        )
+
+    def get_stats(self, db: Session) -> dict:
+        now = datetime.utcnow()
+        pending, oldest = (
+            db.query(func.count(AlertEvent.id), func.min(AlertEvent.triggered_at))
+            .filter(AlertEvent.delivery_status == DELIVERY_PENDING)
+            .one()
+        )
+        with self._lock:
+            self._prune_throughput()
+            delivered_last_minute = len(self._delivered_at)
+            data = self.stats.as_dict()
+        data.update({
+            "running": self.running,
+            "notifier": self.notifier.name,
+            "pending": pending,
+            "oldest_pending_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+            "delivered_last_minute": delivered_last_minute,
+            "workers": settings.ALERT_OUTBOX_WORKERS,
+            "max_attempts": settings.ALERT_OUTBOX_MAX_ATTEMPTS,
+        })
+        return data
+
+    def _prune_throughput(self) -> None:
+        """丢弃统计窗口之外的送达时间（调用方持锁）"""
+        cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+        while self._delivered_at and self._delivered_at[0] < cutoff:
+            self._delivered_at.popleft()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                logger.error(f"Alert outbox batch failed: {e}", exc_info=True)
+                processed = 0
+            # 整批已满说明可能还有积压，立即继续
+            if processed < settings.ALERT_OUTBOX_BATCH_SIZE:
+                self._wakeup.wait(settings.ALERT_OUTBOX_POLL_SECONDS)
+                self._wakeup.clear()
+
+    def process_batch(self, now: Optional[datetime] = None) -> int:
+        """认领并发送一批到期事件，返回本批处理的事件数"""
+        started = time.monotonic()
+        claimed = self._claim(now or datetime.utcnow())
+        if not claimed:
+            return 0
+
+        db = SessionLocal()
+        try:
+            topic_arn = config_cache.get(db).configs.get("sns_topic_arn", "")
+        finally:
+            db.close()
+
+        if self._executor is not None:
+            results = list(self._executor.map(lambda ev: self._send(ev, topic_arn), claimed))
+        else:
+            results = [self._send(ev, topic_arn) for ev in claimed]
+        self._record(results)
+
+        with self._lock:
+            self.stats.batches += 1
+            self.stats.last_batch_size = len(claimed)
+            self.stats.last_batch_ms = (time.monotonic() - started) * 1000
+        return len(claimed)
+
+    def _claim(self, now: datetime) -> List[dict]:
+        """逐条条件 UPDATE 认领到期事件，返回认领成功的事件"""
+        lease_until = now + timedelta(seconds=max(60.0, settings.ALERT_OUTBOX_SEND_TIMEOUT_SECONDS * 3))
+        due = or_(AlertEvent.next_attempt_at.is_(None), AlertEvent.next_attempt_at <= now)
+        db = SessionLocal()
+        try:
+            candidates = (
+                db.query(
+                    AlertEvent.id, AlertEvent.rule_key, AlertEvent.triggered_at,
+                    AlertEvent.event_detail, AlertEvent.delivery_attempts,
+                )
+                .filter(AlertEvent.delivery_status == DELIVERY_PENDING, due)
+                .order_by(AlertEvent.id)
+                .limit(max(1, settings.ALERT_OUTBOX_BATCH_SIZE))
+                .all()
+            )
+            claimed = []
+            for row in candidates:
+                updated = (
+                    db.query(AlertEvent)
+                    .filter(AlertEvent.id == row.id, AlertEvent.delivery_status == DELIVERY_PENDING, due)
+                    .update(
+                        {
+                            AlertEvent.next_attempt_at: lease_until,
+                            AlertEvent.delivery_attempts: AlertEvent.delivery_attempts + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                if updated:
+                    claimed.append({
+                        "id": row.id,
+                        "rule_key": row.rule_key,
+                        "triggered_at": row.triggered_at,
+                        "detail": json.loads(row.event_detail) if row.event_detail else {},
+                        "attempts": row.delivery_attempts + 1,
+                    })
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _send(self, event: dict, topic_arn: str) -> Tuple[dict, Optional[str]]:
+        notifier = self.notifier
+        if notifier.requires_topic and not topic_arn:
+            return event, "SNS topic not configured"
+        subject, message = build_message(event["rule_key"], event["detail"])
+        try:
+            notifier.publish(topic_arn, subject, message, event["detail"])
+            return event, None
+        except Exception as e:
+            return event, f"{type(e).__name__}: {e}"
+
+    def _record(self, results: List[Tuple[dict, Optional[str]]]) -> None:
+        now = datetime.utcnow()
+        max_attempts = max(1, settings.ALERT_OUTBOX_MAX_ATTEMPTS)
+        db = SessionLocal()
+        try:
+            for event, error in results:
+                query = db.query(AlertEvent).filter(AlertEvent.id == event["id"])
+                if error is None:
+                    query.update({
+                        AlertEvent.delivery_status: DELIVERY_SENT,
+                        AlertEvent.notification_sent: True,
+                        AlertEvent.notification_error: None,
+                        AlertEvent.delivered_at: now,
+                        AlertEvent.next_attempt_at: None,
+                    }, synchronize_session=False)
+                elif event["attempts"] >= max_attempts:
+                    query.update({
+                        AlertEvent.delivery_status: DELIVERY_FAILED,
+                        AlertEvent.notification_error: f"Delivery failed after {event['attempts']} attempts: {error}",
+                        AlertEvent.next_attempt_at: None,
+                    }, synchronize_session=False)
+                else:
+                    query.update({
+                        AlertEvent.notification_error: error,
+                        AlertEvent.next_attempt_at: now + timedelta(seconds=backoff_seconds(event["attempts"])),
+                    }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            for event, error in results:
+                self.stats.attempts += 1
+                if error is None:
+                    lag = (now - event["triggered_at"]).total_seconds() if event["triggered_at"] else 0.0
+                    self.stats.delivered += 1
+                    self.stats.last_lag_seconds = lag
+                    self.stats.max_lag_seconds = max(self.stats.max_lag_seconds, lag)
+                    self._delivered_at.append(time.monotonic())
+                    self._prune_throughput()
+                else:
+                    self.stats.failed_attempts += 1
+                    self.stats.last_error = error
+                    if event["attempts"] >= max_attempts:
+                        self.stats.dead += 1
+                        logger.error(f"Alert event {event['id']} delivery failed permanently: {error}")
+                    else:
+                        logger.warning(f"Alert event {event['id']} delivery attempt {event['attempts']} failed: {error}")
+
+
+# 全局单例
+alert_outbox = AlertOutbox()
@@ -0,0 +1,374 @@
+"""
+审计日志保留与归档
+
+audit_logs 表作为热数据层，按自然月（UTC）划分分区。后台任务定期将早于热数据保留期的
+整月数据写入压缩归档文件后从热表删除，再按归档保留期删除过期的归档文件：
+
+- 归档目录：AUDIT_ARCHIVE_DIR，每个分区可有多个只追加的分片文件
+  audit_logs_YYYY-MM.partNNN.ndjson.gz，分片内按 (event_time, id) 倒序存放
+- manifest.json 记录每个分片的行数、时间范围、id 范围以及按事件类型 / 用户的计数，
+  统计总数时大多无需解压分片
+- 保留期来自 SystemConfig：audit_hot_retention_days（0 表示不归档）、
+  audit_archive_retention_days（0 表示永久保留）
+
+分片文件先以临时文件写入再 rename，并先写 manifest 再删除热表数据；
+中途崩溃后，下次运行会先补删已归档分片对应的热表行，不会重复归档。
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.audit_log import AuditLog
+from app.models.system_config import SystemConfig
+from app.services.audit_search import row_matches
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_HOT_RETENTION_DAYS = 90
+DEFAULT_ARCHIVE_RETENTION_DAYS = 730
+DELETE_BATCH_ROWS = 5000
+ARCHIVE_FETCH_ROWS = 2000
+
+ROW_FIELDS = (
+    "id", "event_type", "user_id", "username",
+    "client_ip", "user_agent", "event_time", "event_detail", "result",
+)
+
+
+@dataclass
+class ArchivedAuditLog:
+    """归档层中的一行审计日志，属性与 AuditLog 一致，可与热表行统一处理"""
+    id: int
+    event_type: str
+    user_id: Optional[int]
+    username: Optional[str]
+    client_ip: Optional[str]
+    user_agent: Optional[str]
+    event_time: datetime
+    event_detail: Optional[str]
+    result: str
+
+
+def serialize_row(row) -> dict:
+    """AuditLog / 列元组 / ArchivedAuditLog 转为可 JSON 序列化的 dict"""
+    data = {name: getattr(row, name) for name in ROW_FIELDS}
+    data["event_time"] = row.event_time.isoformat() if row.event_time else None
+    return data
+
+
+def _deserialize_row(data: dict) -> ArchivedAuditLog:
+    data["event_time"] = datetime.fromisoformat(data["event_time"])
+    return ArchivedAuditLog(**data)
+
+
+def _month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(ts: datetime) -> datetime:
+    return (ts.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _matches(row: ArchivedAuditLog, filters: Dict[str, Any], cursor: Optional[Tuple[datetime, int]]) -> bool:
+    if filters.get("user_id") and row.user_id != filters["user_id"]:
+        return False
+    if filters.get("event_type") and row.event_type != filters["event_type"]:
+        return False
+    if filters.get("start_time") and row.event_time < filters["start_time"]:
+        return False
+    if filters.get("end_time") and row.event_time > filters["end_time"]:
+        return False
+    if filters.get("q") and not row_matches(row, filters["q"]):
+        return False
+    if cursor is not None and (row.event_time, row.id) >= cursor:
+        return False
+    return True
+
+
+class AuditArchive:
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self._lock = threading.Lock()
+        # 保留任务与手动触发不能并发执行
+        self._run_lock = threading.Lock()
+        self._manifest: Optional[dict] = None
+        self.last_run: Optional[dict] = None
+
+    # ── manifest ──────────────────────────────────────────────────────────────
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.archive_dir, MANIFEST_NAME)
+
+    def _load_manifest(self) -> dict:
+        with self._lock:
+            if self._manifest is None:
+                try:
+                    with open(self._manifest_path()) as f:
+                        self._manifest = json.load(f)
+                except FileNotFoundError:
+                    self._manifest = {"parts": []}
+            return self._manifest
+
+    def _save_manifest(self, manifest: dict) -> None:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+        with self._lock:
+            self._manifest = manifest
+
+    def _parts(self) -> List[dict]:
+        return list(self._load_manifest()["parts"])
+
+    # ── 读取 ──────────────────────────────────────────────────────────────────
+
+    def may_contain(self, filters: Dict[str, Any]) -> bool:
+        """过滤条件的时间范围是否可能落在归档层"""
+        return any(self._part_overlaps(p, filters) for p in self._parts())
+
+    def iter_rows(
+        self,
+        filters: Dict[str, Any],
+        cursor: Optional[Tuple[datetime, int]] = None,
+    ) -> Iterator[ArchivedAuditLog]:
+        """按 (event_time, id) 倒序逐行读取归档层中满足过滤条件的行"""
+        parts = [p for p in self._parts() if self._part_overlaps(p, filters, cursor)]
+        by_month: Dict[str, List[dict]] = {}
+        for part in parts:
+            by_month.setdefault(part["month"], []).append(part)
+        for month in sorted(by_month, reverse=True):
+            streams = [self._read_part(p) for p in by_month[month]]
+            merged = heapq.merge(*streams, key=lambda r: (r.event_time, r.id), reverse=True)
+            for row in merged:
+                if _matches(row, filters, cursor):
+                    yield row
+
+    def count(self, filters: Dict[str, Any]) -> int:
+        """统计归档层中满足过滤条件的行数，分片完全落在时间范围内时直接使用 manifest 计数"""
+        total = 0
+        for part in self._parts():
+            if not self._part_overlaps(part, filters):
+                continue
+            start, end = filters.get("start_time"), filters.get("end_time")
+            covered = (not start or datetime.fromisoformat(part["min_time"]) >= start) and \
+                      (not end or datetime.fromisoformat(part["max_time"]) <= end)
+            user_id, event_type = filters.get("user_id"), filters.get("event_type")
+            if covered and not (user_id and event_type) and not filters.get("q"):
+                if user_id:
+                    total += part["users"].get(str(user_id), 0)
+                elif event_type:
+                    total += part["event_types"].get(event_type, 0)
+                else:
+                    total += part["rows"]
+                continue
+            total += sum(1 for row in self._read_part(part) if _matches(row, filters, None))
+        return total
+
+    def _read_part(self, part: dict) -> Iterator[ArchivedAuditLog]:
+        path = os.path.join(self.archive_dir, part["file"])
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield _deserialize_row(json.loads(line))
+        except FileNotFoundError:
+            # 分片已被保留任务删除
+            logger.warning(f"Audit archive part missing: {part['file']}")
+
+    @staticmethod
+    def _part_overlaps(part: dict, filters: Dict[str, Any], cursor=None) -> bool:
+        if filters.get("start_time") and datetime.fromisoformat(part["max_time"]) < filters["start_time"]:
+            return False
+        if filters.get("end_time") and datetime.fromisoformat(part["min_time"]) > filters["end_time"]:
+            return False
+        if cursor is not None and datetime.fromisoformat(part["min_time"]) > cursor[0]:
+            return False
+        return True
+
+    # ── 保留任务 ──────────────────────────────────────────────────────────────
+
+    def get_retention(self, db: Session) -> Dict[str, int]:
+        configs = {
+            c.key: c.value
+            for c in db.query(SystemConfig).filter(
+                SystemConfig.key.in_(["audit_hot_retention_days", "audit_archive_retention_days"])
+            )
+        }
+        return {
+            "hot_retention_days": int(configs.get("audit_hot_retention_days", DEFAULT_HOT_RETENTION_DAYS)),
+            "archive_retention_days": int(
+                configs.get("audit_archive_retention_days", DEFAULT_ARCHIVE_RETENTION_DAYS)
+            ),
+        }
+
+    def run(self, db: Session, now: Optional[datetime] = None) -> dict:
+        """
+        执行一次保留任务（同步，耗时较长，应在线程中调用）：
+        归档早于热数据保留期的整月分区，删除超过归档保留期的分片。
+        """
+        with self._run_lock:
+            started = time.monotonic()
+            now = now or datetime.utcnow()
+            retention = self.get_retention(db)
+            result = {"archived_rows": 0, "archived_parts": 0, "deleted_parts": 0}
+
+            self._cleanup_orphans()
+            if retention["hot_retention_days"] > 0:
+                boundary = _month_start(now - timedelta(days=retention["hot_retention_days"]))
+                self._finish_pending_deletes(db)
+                oldest = db.query(func.min(AuditLog.event_time)).scalar()
+                month = _month_start(oldest) if oldest else boundary
+                while month < boundary:
+                    rows = self._archive_month(db, month)
+                    if rows:
+                        result["archived_rows"] += rows
+                        result["archived_parts"] += 1
+                    month = _next_month(month)
+
+            if retention["archive_retention_days"] > 0:
+                expire_before = now - timedelta(days=retention["archive_retention_days"])
+                result["deleted_parts"] = self._expire_parts(expire_before)
+
+            result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 2)
+            result["finished_at"] = now.isoformat()
+            self.last_run = result
+            if result["archived_parts"] or result["deleted_parts"]:
+                logger.info(f"Audit retention run: {result}")
+            return result
+
+    def _archive_month(self, db: Session, month: datetime) -> int:
+        """将一个月的热表数据写入新分片，写入 manifest 后从热表删除"""
+        month_end = _next_month(month)
+        month_key = month.strftime("%Y-%m")
+        columns = [getattr(AuditLog, name) for name in ROW_FIELDS]
+        stmt = (
+            select(*columns)
+            .where(AuditLog.event_time >= month, AuditLog.event_time < month_end)
+            .order_by(AuditLog.event_time.desc(), AuditLog.id.desc())
+            .execution_options(yield_per=ARCHIVE_FETCH_ROWS)
+        )
+
+        manifest = self._load_manifest()
+        seq = sum(1 for p in manifest["parts"] if p["month"] == month_key)
+        file_name = f"audit_logs_{month_key}.part{seq:03d}.ndjson.gz"
+        path = os.path.join(self.archive_dir, file_name)
+        tmp_path = path + ".tmp"
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        stats = {"rows": 0, "min_id": None, "max_id": None, "min_time": None, "max_time": None}
+        event_types: Dict[str, int] = {}
+        users: Dict[str, int] = {}
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in db.execute(stmt):
+                f.write(json.dumps(serialize_row(row), ensure_ascii=False))
+                f.write("\n")
+                stats["rows"] += 1
+                stats["min_id"] = row.id if stats["min_id"] is None else min(stats["min_id"], row.id)
+                stats["max_id"] = row.id if stats["max_id"] is None else max(stats["max_id"], row.id)
+                if stats["max_time"] is None:
+                    stats["max_time"] = row.event_time
+                stats["min_time"] = row.event_time
+                event_types[row.event_type] = event_types.get(row.event_type, 0) + 1
+                if row.user_id is not None:
+                    users[str(row.user_id)] = users.get(str(row.user_id), 0) + 1
+        db.rollback()  # 结束读事务
+
+        if stats["rows"] == 0:
+            os.unlink(tmp_path)
+            return 0
+        os.replace(tmp_path, path)
+
+        part = {
+            "month": month_key,
+            "file": file_name,
+            "rows": stats["rows"],
+            "bytes": os.path.getsize(path),
+            "min_id": stats["min_id"],
+            "max_id": stats["max_id"],
+            "min_time": stats["min_time"].isoformat(),
+            "max_time": stats["max_time"].isoformat(),
+            "event_types": event_types,
+            "users": users,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        manifest = dict(manifest, parts=manifest["parts"] + [part])
+        self._save_manifest(manifest)
+        self._delete_hot_rows(db, part)
+        return stats["rows"]
+
+    def _delete_hot_rows(self, db: Session, part: dict) -> None:
+        """分批删除已写入分片的热表行，避免长时间持有 SQLite 写锁"""
+        month = datetime.strptime(part["month"], "%Y-%m")
+        batch_ids = (
+            select(AuditLog.id)
+            .where(
+                AuditLog.event_time >= month,
+                AuditLog.event_time < _next_month(month),
+                AuditLog.id.between(part["min_id"], part["max_id"]),
+            )
+            .limit(DELETE_BATCH_ROWS)
+            .scalar_subquery()
+        )
+        stmt = delete(AuditLog).where(AuditLog.id.in_(batch_ids))
+        while True:
+            deleted = db.execute(stmt).rowcount
+            db.commit()
+            if deleted < DELETE_BATCH_ROWS:
+                break
+
+    def _finish_pending_deletes(self, db: Session) -> None:
+        """补删上次运行中已归档但尚未从热表删除的行"""
+        for part in self._parts():
+            self._delete_hot_rows(db, part)
+
+    def _expire_parts(self, expire_before: datetime) -> int:
+        manifest = self._load_manifest()
+        expired = [p for p in manifest["parts"] if datetime.fromisoformat(p["max_time"]) < expire_before]
+        if not expired:
+            return 0
+        self._save_manifest(dict(manifest, parts=[p for p in manifest["parts"] if p not in expired]))
+        for part in expired:
+            try:
+                os.unlink(os.path.join(self.archive_dir, part["file"]))
+            except FileNotFoundError:
+                pass
+        return len(expired)
+
+    def _cleanup_orphans(self) -> None:
+        """删除未登记到 manifest 的分片（写入分片后、更新 manifest 前中断时产生）"""
+        if not os.path.isdir(self.archive_dir):
+            return
+        known = {p["file"] for p in self._parts()}
+        for name in os.listdir(self.archive_dir):
+            if name.startswith("audit_logs_") and name not in known:
+                os.unlink(os.path.join(self.archive_dir, name))
+
+    def get_stats(self) -> dict:
+        parts = self._parts()
+        return {
+            "archive_dir": self.archive_dir,
+            "parts": len(parts),
+            "rows": sum(p["rows"] for p in parts),
+            "bytes": sum(p["bytes"] for p in parts),
+            "oldest": min((p["min_time"] for p in parts), default=None),
+            "newest": max((p["max_time"] for p in parts), default=None),
+            "last_run": self.last_run,
+        }
+
+
+# 全局单例
+audit_archive = AuditArchive(settings.AUDIT_ARCHIVE_DIR)
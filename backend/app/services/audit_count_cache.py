@@ -0,0 +1,96 @@
+"""
+审计日志总数缓存
+
+审计日志列表每翻一页都执行一次 COUNT(*)，表很大时代价与总行数成正比。
+这里按过滤条件缓存总数：首次查询同步计数，之后直接返回缓存值，
+超过 AUDIT_COUNT_CACHE_TTL_SECONDS 后在后台线程重新计数（stale-while-revalidate），
+因此翻页请求本身不再执行 COUNT。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 256
+
+
+class AuditCountCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        # key -> (total, computed_at)
+        self._entries: "OrderedDict[Hashable, Tuple[int, float]]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-count")
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def make_key(filters: Dict) -> Hashable:
+        return tuple(sorted((k, str(v)) for k, v in filters.items() if v))
+
+    def get_total(self, db: Session, filters: Dict, count_fn: Callable[[Session], int]) -> int:
+        """返回过滤条件对应的总数；缓存过期时先返回旧值并在后台刷新"""
+        key = self.make_key(filters)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                if time.monotonic() - item[1] >= self.ttl_seconds and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._executor.submit(self._refresh, key, count_fn)
+                return item[0]
+            self.misses += 1
+
+        total = count_fn(db)
+        self._store(key, total)
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _refresh(self, key: Hashable, count_fn: Callable[[Session], int]) -> None:
+        db = SessionLocal()
+        try:
+            self._store(key, count_fn(db))
+            self.refreshes += 1
+        except Exception as e:
+            logger.warning(f"Audit log count refresh failed: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key: Hashable, total: int) -> None:
+        with self._lock:
+            self._entries[key] = (total, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+
+# 全局单例
+audit_count_cache = AuditCountCache(settings.AUDIT_COUNT_CACHE_TTL_SECONDS)
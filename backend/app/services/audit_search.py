@@ -0,0 +1,112 @@
+"""
+审计日志全文检索
+
+会话 id、端口、目标用户名、错误信息等只存在于 event_detail JSON 文本中，
+这里在 SQLite 上建立 FTS5 外部内容表 audit_logs_fts（trigram 分词，支持任意子串检索），
+覆盖 event_detail / username / client_ip / user_agent 四列，由 audit_logs 上的触发器
+在插入 / 删除时同步，批量写入线程、同步写入和归档删除都无需额外处理。
+
+检索词按空白拆分，每个词至少 3 个字符，所有词都需在某一列中出现（AND）。
+FTS5 不可用（非 SQLite 或编译时未启用）时退化为 LIKE 扫描，结果一致但较慢。
+"""
+import logging
+from typing import List, Optional, Sequence
+
+from sqlalchemy import Integer, and_, column, func, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from app.models.audit_log import AuditLog
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "audit_logs_fts"
+SEARCH_COLUMNS = ("event_detail", "username", "client_ip", "user_agent")
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 8
+
+_COLUMNS_SQL = ", ".join(SEARCH_COLUMNS)
+_NEW_VALUES_SQL = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+_OLD_VALUES_SQL = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+
+_CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"{_COLUMNS_SQL}, content='audit_logs', content_rowid='id', tokenize='trigram')"
+)
+_TRIGGERS_SQL = [
+    f"""CREATE TRIGGER IF NOT EXISTS audit_logs_fts_insert AFTER INSERT ON audit_logs BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS_SQL}) VALUES (new.id, {_NEW_VALUES_SQL});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS audit_logs_fts_delete AFTER DELETE ON audit_logs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS_SQL}) VALUES ('delete', old.id, {_OLD_VALUES_SQL});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS audit_logs_fts_update AFTER UPDATE ON audit_logs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS_SQL}) VALUES ('delete', old.id, {_OLD_VALUES_SQL});
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS_SQL}) VALUES (new.id, {_NEW_VALUES_SQL});
+    END""",
+]
+
+# None：尚未初始化；init_search_index 后为 True / False
+_fts_available: Optional[bool] = None
+
+
+def init_search_index(engine: Engine) -> bool:
+    """创建 FTS5 表与同步触发器（幂等）；首次创建时从 audit_logs 重建索引"""
+    global _fts_available
+    if engine.dialect.name != "sqlite":
+        _fts_available = False
+        return False
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            if not exists:
+                conn.execute(text(_CREATE_TABLE_SQL))
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                logger.info("Audit log full-text index created")
+            for trigger_sql in _TRIGGERS_SQL:
+                conn.execute(text(trigger_sql))
+        _fts_available = True
+    except OperationalError as e:
+        logger.warning(f"Audit log full-text index unavailable, falling back to LIKE search: {e}")
+        _fts_available = False
+    return _fts_available
+
+
+def parse_query(q: str) -> List[str]:
+    """拆分检索词，格式不符合要求时抛出 ValueError"""
+    terms = q.split()
+    if not terms:
+        raise ValueError("Search query is empty")
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f"Search query supports at most {MAX_TERMS} terms")
+    short = [t for t in terms if len(t) < MIN_TERM_LENGTH]
+    if short:
+        raise ValueError(f"Search terms must be at least {MIN_TERM_LENGTH} characters: {' '.join(short)}")
+    return terms
+
+
+def search_condition(terms: Sequence[str]):
+    """返回 audit_logs 的过滤条件：所有检索词都在任一检索列中出现"""
+    if _fts_available:
+        # 每个词作为 FTS5 字符串短语，内部双引号转义
+        match = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        matched_ids = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match").bindparams(
+            match=match
+        ).columns(column("rowid", Integer))
+        return AuditLog.id.in_(matched_ids)
+    return and_(*[
+        or_(*[
+            func.lower(getattr(AuditLog, c)).contains(t.lower(), autoescape=True)
+            for c in SEARCH_COLUMNS
+        ])
+        for t in terms
+    ])
+
+
+def row_matches(row, terms: Sequence[str]) -> bool:
+    """归档层行的检索判断，与 search_condition 语义一致"""
+    values = [(getattr(row, c) or "").lower() for c in SEARCH_COLUMNS]
+    return all(any(t.lower() in v for v in values) for t in terms)
@@ -1,19 +1,30 @@
 """
 操作审计日志服务
 
-异步写入审计日志，写入失败不影响主业务流程。
+审计事件交给 audit_writer 批量异步写入，写入失败不影响主业务流程。
 """
+import asyncio
 import csv
 import io
+import itertools
 import json
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.core.database import SessionLocal
 from app.models.audit_log import AuditLog
+from app.services.alert_detector import alert_detector
+from app.services.audit_archive import audit_archive, serialize_row
+from app.services.audit_count_cache import audit_count_cache
+from app.services.audit_search import search_condition
+from app.services.audit_writer import audit_writer
+from app.utils.pagination import encode_cursor, keyset_before
+from app.utils.streaming import gzip_chunks
 
 logger = logging.getLogger(__name__)
 
@@ -30,11 +41,35 @@ class AuditEventType:
     NEW_DEVICE_LOGIN = "NEW_DEVICE_LOGIN"
 
 
+EXPORT_COLUMNS = [
+    "id", "event_type", "user_id", "username",
+    "client_ip", "user_agent", "event_time", "event_detail", "result",
+]
+EXPORT_FORMATS = ("csv", "ndjson")
+# 每次从游标取出的行数，以及单个响应分块的目标大小
+EXPORT_FETCH_ROWS = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _apply_filters(query, filters: Dict[str, Any]):
+    if filters.get("user_id"):
+        query = query.filter(AuditLog.user_id == filters["user_id"])
+    if filters.get("event_type"):
+        query = query.filter(AuditLog.event_type == filters["event_type"])
+    if filters.get("start_time"):
+        query = query.filter(AuditLog.event_time >= filters["start_time"])
+    if filters.get("end_time"):
+        query = query.filter(AuditLog.event_time <= filters["end_time"])
+    if filters.get("q"):
+        query = query.filter(search_condition(filters["q"]))
+    return query
+
+
 class AuditService:
 
     def log(
         self,
-        db: Session,
+        db: Optional[Session],
         event_type: str,
         user_id: Optional[int],
         username: Optional[str],
@@ -45,21 +80,46 @@ class AuditService:
     ) -> None:
         """
         写入审计日志。写入失败时记录到应用错误日志，不抛出异常。
-        在 FastAPI 中通过 BackgroundTasks 异步执行，不阻塞主请求。
+        批量写入线程运行时只入队，由其使用独立连接写入，不使用传入的 db，
+        因此使用异步会话的请求处理函数传入 None 即可，不会在事件循环中执行数据库写入；
+        未启动时（如独立脚本）直接用传入的 db 写入。db 为 None 时使用临时会话，
+        在事件循环中调用时交给线程池写入：同步写入若在事件循环中等待 SQLite 写锁，
+        持有写锁的异步事务无法提交，会一直等到锁超时。
         """
         try:
-            entry = AuditLog(
-                event_type=event_type,
-                user_id=user_id,
-                username=username,
-                client_ip=client_ip,
-                user_agent=user_agent,
-                event_time=datetime.utcnow(),
-                event_detail=json.dumps(event_detail, ensure_ascii=False) if event_detail else None,
-                result=result,
-            )
-            db.add(entry)
-            db.commit()
+            row = {
+                "event_type": event_type,
+                "user_id": user_id,
+                "username": username,
+                "client_ip": client_ip,
+                "user_agent": user_agent,
+                "event_time": datetime.utcnow(),
+                "event_detail": json.dumps(event_detail, ensure_ascii=False) if event_detail else None,
+                "result": result,
+            }
+            # 告警规则的滑动窗口在入队时同步更新，不依赖批量写入落库
+            if event_type == AuditEventType.LOGIN:
+                alert_detector.observe_login(user_id, client_ip, result, row["event_time"])
+            if audit_writer.running:
+                audit_writer.submit(row)
+                return
+            if db is not None:
+                db.add(AuditLog(**row))
+                db.commit()
+                return
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._write_row, row)
+            except RuntimeError:
+                self._write_row(row)
+        except Exception as e:
+            logger.error(f"AuditService.log failed: {e}", exc_info=True)
+
+    @staticmethod
+    def _write_row(row: Dict[str, Any]) -> None:
+        try:
+            with SessionLocal() as db:
+                db.add(AuditLog(**row))
+                db.commit()
         except Exception as e:
             logger.error(f"AuditService.log failed: {e}", exc_info=True)
 
@@ -69,62 +129,117 @@ class AuditService:
         filters: Dict[str, Any],
         limit: int = 100,
         offset: int = 0,
+        cursor: Optional[Tuple[datetime, int]] = None,
     ) -> tuple:
         """
-        查询审计日志，支持 user_id / event_type / start_time / end_time 过滤。
-        默认按时间倒序。
+        查询审计日志，支持 user_id / event_type / start_time / end_time 过滤，
+        以及 q（audit_search.parse_query 拆分后的检索词）全文检索。
+        按 (event_time, id) 倒序，返回 (logs, total, next_cursor)。
+        传入 cursor（上一页最后一行的 (event_time, id)）时按游标翻页，忽略 offset；
+        total 来自 audit_count_cache，不在每次翻页时执行 COUNT。
+        热表数据读完后透明地继续读取归档层（归档行均早于热表行）。
         """
-        query = db.query(AuditLog)
-
-        if filters.get("user_id"):
-            query = query.filter(AuditLog.user_id == filters["user_id"])
-        if filters.get("event_type"):
-            query = query.filter(AuditLog.event_type == filters["event_type"])
-        if filters.get("start_time"):
-            query = query.filter(AuditLog.event_time >= filters["start_time"])
-        if filters.get("end_time"):
-            query = query.filter(AuditLog.event_time <= filters["end_time"])
-
-        total = query.count()
-        logs = (
-            query.order_by(AuditLog.event_time.desc())
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
-        return logs, total
-
-    def export_csv(self, db: Session, filters: Dict[str, Any]) -> StreamingResponse:
-        """流式导出 CSV，避免大数据量时内存溢出"""
-        logs, _ = self.query_logs(db, filters, limit=100000, offset=0)
-
-        def generate():
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow([
-                "id", "event_type", "user_id", "username",
-                "client_ip", "user_agent", "event_time", "event_detail", "result"
-            ])
-            yield output.getvalue()
-            output.seek(0)
-            output.truncate(0)
-
-            for log in logs:
-                writer.writerow([
-                    log.id, log.event_type, log.user_id, log.username,
-                    log.client_ip, log.user_agent,
-                    log.event_time.isoformat() if log.event_time else "",
-                    log.event_detail or "",
-                    log.result,
-                ])
-                yield output.getvalue()
-                output.seek(0)
-                output.truncate(0)
+        query = _apply_filters(db.query(AuditLog), filters)
+        total = audit_count_cache.get_total(db, filters, lambda s: self._count(s, filters))
+
+        page = query.order_by(AuditLog.event_time.desc(), AuditLog.id.desc())
+        if cursor is not None:
+            page = page.filter(keyset_before(AuditLog.event_time, AuditLog.id, cursor))
+        else:
+            page = page.offset(offset)
+        logs = page.limit(limit).all()
+
+        if len(logs) < limit and audit_archive.may_contain(filters):
+            archive_offset = 0
+            if cursor is None and not logs:
+                # 热表行已取完且本页没有热表行：归档从 offset 扣除热表匹配行数处开始读。
+                # 热表行数取缓存总数减去归档行数（归档计数同样缓存），不对热表重新 COUNT
+                archived_total = audit_count_cache.get_total(
+                    db, {**filters, "tier": "archive"}, lambda s: audit_archive.count(filters)
+                )
+                archive_offset = max(offset - max(total - archived_total, 0), 0)
+            archived = audit_archive.iter_rows(filters, cursor)
+            logs += list(itertools.islice(archived, archive_offset, archive_offset + limit - len(logs)))
+
+        next_cursor = None
+        if len(logs) == limit:
+            next_cursor = encode_cursor(logs[-1].event_time, logs[-1].id)
+        return logs, total, next_cursor
+
+    @staticmethod
+    def _count(db: Session, filters: Dict[str, Any]) -> int:
+        total = _apply_filters(db.query(AuditLog), filters).count()
+        if audit_archive.may_contain(filters):
+            total += audit_archive.count(filters)
+        return total
+
+    def export(
+        self,
+        filters: Dict[str, Any],
+        fmt: str = "csv",
+        compress: bool = False,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> StreamingResponse:
+        """
+        流式导出审计日志（CSV 或 NDJSON，可选 gzip），不限制行数。
+        按批从游标读取列元组，不构造 ORM 对象，内存占用与总行数无关。
+        生成器在响应发送期间执行，此时请求级 db 已关闭，因此使用独立会话。
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        chunks = self.iter_export(filters, fmt, session_factory)
+        if compress:
+            chunks = gzip_chunks(chunks)
 
         date_str = datetime.utcnow().strftime("%Y%m%d")
-        filename = f"audit_logs_{date_str}.csv"
+        filename = f"audit_logs_{date_str}.{fmt}" + (".gz" if compress else "")
+        media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
         return StreamingResponse(
-            generate(),
-            media_type="text/csv",
+            chunks,
+            media_type="application/gzip" if compress else media_type,
             headers={"Content-Disposition": f'attachment; filename="{filename}"'},
         )
+
+    def iter_export(
+        self,
+        filters: Dict[str, Any],
+        fmt: str = "csv",
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> Iterator[bytes]:
+        """逐块生成导出内容（UTF-8 字节），每块约 EXPORT_CHUNK_BYTES"""
+        columns = [getattr(AuditLog, name) for name in EXPORT_COLUMNS]
+        stmt = _apply_filters(select(*columns), filters).order_by(
+            AuditLog.event_time.desc(), AuditLog.id.desc()
+        )
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+
+        db = session_factory()
+        try:
+            # 热表在前，归档层在后，整体仍按 (event_time, id) 倒序
+            rows = itertools.chain(
+                db.execute(stmt.execution_options(yield_per=EXPORT_FETCH_ROWS)),
+                audit_archive.iter_rows(filters),
+            )
+            for row in rows:
+                if fmt == "csv":
+                    writer.writerow([
+                        row.id, row.event_type, row.user_id, row.username,
+                        row.client_ip, row.user_agent,
+                        row.event_time.isoformat() if row.event_time else "",
+                        row.event_detail or "", row.result,
+                    ])
+                else:
+                    buffer.write(json.dumps(serialize_row(row), ensure_ascii=False))
+                    buffer.write("\n")
+                if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate(0)
+        finally:
+            db.close()
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,242 @@
+"""
+审计日志批量写入
+
+AuditService.log 只把事件放入进程内有界队列，由独立写入线程使用自己的数据库会话
+按批量（条数达到 AUDIT_BATCH_SIZE 或等待超过 AUDIT_FLUSH_INTERVAL_SECONDS）
+一次 INSERT 多行并提交，避免登录高峰 / token 校验失败洪峰时逐条 commit 争抢 SQLite 写锁。
+
+log() 既在事件循环中直接调用，也经 BackgroundTasks 在线程池中调用，
+因此使用线程安全的 queue.Queue + 写入线程，而不是 asyncio.Queue。
+
+队列满时的处理策略（AUDIT_QUEUE_FULL_POLICY）：
+- drop_newest：丢弃新事件
+- drop_oldest：丢弃队列中最旧的事件，放入新事件
+- block：调用方最多等待 AUDIT_QUEUE_BLOCK_TIMEOUT_SECONDS，仍满则丢弃新事件
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.core.database import SessionLocal
+from app.models.audit_log import AuditLog
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FULL_POLICIES = ("drop_newest", "drop_oldest", "block")
+WRITE_RETRY_DELAY_SECONDS = 0.2
+
+
+@dataclass
+class AuditWriterStats:
+    enqueued: int = 0
+    written: int = 0
+    batches: int = 0
+    overflowed: int = 0     # 入队时队列已满的次数
+    dropped: int = 0        # 最终未写入的事件数（队列满丢弃 + 写入失败）
+    write_failures: int = 0
+    last_batch_size: int = 0
+    last_batch_ms: float = 0.0
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "overflowed": self.overflowed,
+            "dropped": self.dropped,
+            "write_failures": self.write_failures,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "last_error": self.last_error,
+        }
+
+
+class AuditLogWriter:
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        # 已处理（写入或丢弃）的事件数，flush() 据此等待之前入队的事件落库
+        self._processed = 0
+        self._progress = threading.Condition()
+        self.stats = AuditWriterStats()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        policy = settings.AUDIT_QUEUE_FULL_POLICY
+        if policy not in QUEUE_FULL_POLICIES:
+            logger.warning(f"Unknown AUDIT_QUEUE_FULL_POLICY '{policy}', using drop_newest")
+        self._queue = queue.Queue(maxsize=max(1, settings.AUDIT_QUEUE_MAX_SIZE))
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Audit log writer started (batch {settings.AUDIT_BATCH_SIZE}, "
+            f"queue {settings.AUDIT_QUEUE_MAX_SIZE}, policy {policy})"
+        )
+
+    async def stop(self) -> None:
+        """停止写入线程，退出前写完队列中剩余的事件"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        await asyncio.to_thread(self._thread.join, settings.AUDIT_SHUTDOWN_TIMEOUT_SECONDS)
+        if self._thread.is_alive():
+            logger.warning(
+                f"Audit log writer did not finish within {settings.AUDIT_SHUTDOWN_TIMEOUT_SECONDS}s, "
+                f"{self._queue.qsize()} events lost"
+            )
+        self._thread = None
+        logger.info(f"Audit log writer stopped: {self.stats.as_dict()}")
+
+    def submit(self, row: dict) -> bool:
+        """事件入队，返回 False 表示按队列满策略被丢弃"""
+        q = self._queue
+        with self._progress:
+            self.stats.enqueued += 1
+        try:
+            q.put_nowait(row)
+            return True
+        except queue.Full:
+            pass
+
+        policy = settings.AUDIT_QUEUE_FULL_POLICY
+        with self._progress:
+            self.stats.overflowed += 1
+        if policy == "drop_oldest":
+            while True:
+                try:
+                    q.get_nowait()
+                    self._mark_processed(1, dropped=True)
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(row)
+                    return True
+                except queue.Full:
+                    continue
+        if policy == "block":
+            try:
+                q.put(row, timeout=settings.AUDIT_QUEUE_BLOCK_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        self._mark_processed(1, dropped=True)
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待调用前入队的事件全部处理完毕，返回是否在超时前完成"""
+        if not self.running:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._progress:
+            target = self.stats.enqueued
+            while self._processed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # 写入线程退出后不会再有进展
+                if not self.running:
+                    return False
+                self._progress.wait(remaining if remaining is not None else 1.0)
+            return True
+
+    def get_stats(self) -> dict:
+        data = self.stats.as_dict()
+        data.update({
+            "running": self.running,
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "queue_max_size": settings.AUDIT_QUEUE_MAX_SIZE,
+            "queue_full_policy": settings.AUDIT_QUEUE_FULL_POLICY,
+            "batch_size": settings.AUDIT_BATCH_SIZE,
+            "flush_interval_seconds": settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+        })
+        return data
+
+    # ── 写入线程 ──────────────────────────────────────────────────────────────
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+            elif self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _collect_batch(self) -> List[dict]:
+        """取第一条事件后继续收集，直到批量已满或超过刷新间隔"""
+        q = self._queue
+        batch_size = max(1, settings.AUDIT_BATCH_SIZE)
+        try:
+            batch = [q.get(timeout=settings.AUDIT_FLUSH_INTERVAL_SECONDS)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + settings.AUDIT_FLUSH_INTERVAL_SECONDS
+        while len(batch) < batch_size:
+            # 停止时不再等待，尽快写完剩余事件
+            remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(q.get_nowait())
+                else:
+                    batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[dict]) -> None:
+        started = time.monotonic()
+        error = None
+        # SQLite 写锁冲突等瞬时错误重试一次
+        for attempt in range(2):
+            db = SessionLocal()
+            try:
+                db.execute(insert(AuditLog), batch)
+                db.commit()
+                error = None
+                break
+            except Exception as e:
+                db.rollback()
+                error = e
+                if attempt == 0:
+                    time.sleep(WRITE_RETRY_DELAY_SECONDS)
+            finally:
+                db.close()
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        if error is not None:
+            logger.error(f"Audit log batch write failed, {len(batch)} events dropped: {error}")
+            self.stats.write_failures += 1
+            self.stats.last_error = str(error)
+            self._mark_processed(len(batch), dropped=True)
+            return
+        self.stats.batches += 1
+        self.stats.last_batch_size = len(batch)
+        self.stats.last_batch_ms = elapsed_ms
+        self._mark_processed(len(batch))
+
+    def _mark_processed(self, count: int, dropped: bool = False) -> None:
+        with self._progress:
+            self._processed += count
+            if dropped:
+                self.stats.dropped += count
+            else:
+                self.stats.written += count
+            self._progress.notify_all()
+
+
+# 全局单例
+audit_writer = AuditLogWriter()
@@ -0,0 +1,162 @@
+"""
+告警规则 / 系统配置缓存
+
+告警检测、IP 白名单查询和管理端告警规则接口每次都要读取 alert_rules / system_config /
+ip_whitelist，而这些表一个月只改几次。这里把它们整体缓存为只读快照：
+
+- 写入方（告警规则、白名单、保留策略更新，SECRET_KEY 轮换）修改后调用 bump()，
+  在同一事务中递增 system_config 中的 config_version 并提交，同时丢弃本进程快照
+- 读取方调用 get()，距上次校验不足 CONFIG_CACHE_POLL_SECONDS 时直接返回快照，
+  否则只按主键读取一次 config_version，版本未变则继续使用快照，变化时才重新加载
+
+多个 uvicorn worker 各自持有快照，其他 worker 的修改最多延迟一个轮询间隔生效。
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import Integer, String, cast
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.alert import AlertRule
+from app.models.ip_whitelist import IPWhitelist
+from app.models.system_config import SystemConfig
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "config_version"
+
+
+@dataclass(frozen=True)
+class AlertRuleSnapshot:
+    id: int
+    rule_key: str
+    rule_name: str
+    time_window_minutes: int
+    threshold: int
+    enabled: bool
+    updated_at: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class IPWhitelistEntry:
+    id: int
+    cidr: str
+    note: str
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    rules: Tuple[AlertRuleSnapshot, ...]
+    configs: Dict[str, str]
+    ip_whitelist: Tuple[IPWhitelistEntry, ...]
+
+    @property
+    def enabled_rules(self) -> Dict[str, AlertRuleSnapshot]:
+        return {r.rule_key: r for r in self.rules if r.enabled}
+
+
+def _read_version(db: Session) -> int:
+    value = db.query(SystemConfig.value).filter(SystemConfig.key == VERSION_KEY).scalar()
+    try:
+        return int(value) if value is not None else 0
+    except ValueError:
+        return 0
+
+
+class ConfigCache:
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._checked_at = 0.0
+        # bump() 时递增，加载期间发生过本进程修改则不保存加载结果
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.version_checks = 0
+        self.reloads = 0
+
+    def get(self, db: Session) -> ConfigSnapshot:
+        with self._lock:
+            snapshot, generation = self._snapshot, self._generation
+            if snapshot is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+                self.hits += 1
+                return snapshot
+
+        if snapshot is not None:
+            self.version_checks += 1
+            if _read_version(db) == snapshot.version:
+                with self._lock:
+                    if self._generation == generation:
+                        self._checked_at = time.monotonic()
+                return snapshot
+
+        snapshot = self._load(db)
+        with self._lock:
+            self.reloads += 1
+            if self._generation == generation:
+                self._snapshot = snapshot
+                self._checked_at = time.monotonic()
+        return snapshot
+
+    def bump(self, db: Session) -> None:
+        """递增配置版本号并提交（连同调用方尚未提交的修改），丢弃本进程快照"""
+        updated = (
+            db.query(SystemConfig)
+            .filter(SystemConfig.key == VERSION_KEY)
+            .update(
+                {SystemConfig.value: cast(cast(SystemConfig.value, Integer) + 1, String)},
+                synchronize_session=False,
+            )
+        )
+        if not updated:
+            db.add(SystemConfig(key=VERSION_KEY, value="1", updated_at=datetime.utcnow()))
+        db.commit()
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "poll_seconds": self.poll_seconds,
+            "hits": self.hits,
+            "version_checks": self.version_checks,
+            "reloads": self.reloads,
+        }
+
+    @staticmethod
+    def _load(db: Session) -> ConfigSnapshot:
+        version = _read_version(db)
+        rules = tuple(
+            AlertRuleSnapshot(
+                id=r.id,
+                rule_key=r.rule_key,
+                rule_name=r.rule_name,
+                time_window_minutes=r.time_window_minutes,
+                threshold=r.threshold,
+                enabled=r.enabled,
+                updated_at=r.updated_at,
+            )
+            for r in db.query(AlertRule).order_by(AlertRule.id).all()
+        )
+        configs = {c.key: c.value for c in db.query(SystemConfig).filter(SystemConfig.key != VERSION_KEY).all()}
+        entries = tuple(
+            IPWhitelistEntry(id=e.id, cidr=e.cidr, note=e.note or "")
+            for e in db.query(IPWhitelist).order_by(IPWhitelist.id).all()
+        )
+        logger.debug(f"Config cache loaded version {version}")
+        return ConfigSnapshot(version=version, rules=rules, configs=configs, ip_whitelist=entries)
+
+
+# 全局单例
+config_cache = ConfigCache(settings.CONFIG_CACHE_POLL_SECONDS)
@@ -0,0 +1,269 @@
+"""
+进程内事件总线与 SSE 推送
+
+发布方：
+- SessionService：会话创建 / 变为运行中 / 关闭（session）
+- AlertService：新告警事件（alert，仅管理员）
+- 后台任务：有订阅者时每隔 EVENTS_METRICS_INTERVAL_SECONDS 推送一次实时监控指标（metrics）
+
+每个 SSE 连接是一个订阅者，只接收所订阅主题中与自己相关的事件：
+会话事件投递给会话所属用户和管理员，告警事件只投递给管理员。
+事件只序列化一次，再放入各订阅者的有界队列；发布方从不等待订阅者。
+慢速客户端的队列写满时清空队列并放入一条 resync 事件，客户端收到后通过 REST 接口重新拉取，
+内存占用上限为 连接数 × EVENTS_QUEUE_SIZE。
+
+事件总线在单个进程内：以多个 uvicorn worker 运行时，客户端只收到所连接 worker 产生的事件。
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, FrozenSet, Optional, Set
+
+from app.config import settings
+from app.core.exceptions import EventStreamLimitError
+
+logger = logging.getLogger(__name__)
+
+TOPICS = frozenset({"sessions", "alerts", "metrics"})
+# 事件类型 -> 主题
+EVENT_TOPICS = {"session": "sessions", "alert": "alerts", "metrics": "metrics"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_event(event_type: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    """按 text/event-stream 格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, default=_json_default, separators=(",", ":")))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+_RESYNC = encode_event("resync", {"reason": "slow_consumer"})
+_HEARTBEAT = b": ping\n\n"
+
+
+class Subscriber:
+    def __init__(self, user_id: int, is_admin: bool, topics: FrozenSet[str], queue_size: int):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 2))
+        self.connected_at = time.time()
+        self.delivered = 0
+        self.overflows = 0
+
+    def wants(self, topic: str, user_id: Optional[int], admin_only: bool) -> bool:
+        if topic not in self.topics:
+            return False
+        if self.is_admin:
+            return True
+        return not admin_only and (user_id is None or user_id == self.user_id)
+
+    def offer(self, payload: bytes) -> int:
+        """放入一条事件（不等待），返回因队列已满而丢弃的事件数"""
+        try:
+            self.queue.put_nowait(payload)
+            return 0
+        except asyncio.QueueFull:
+            pass
+        dropped = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            dropped += 1
+        self.overflows += 1
+        self.queue.put_nowait(_RESYNC)
+        return dropped + 1
+
+    def close(self) -> None:
+        """让 stream() 结束（服务关闭 / 用户被强制下线）"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: Set[Subscriber] = set()
+        self._per_user: Dict[int, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._metrics_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # ── 订阅 ──────────────────────────────────────────────────────────────────
+
+    def subscribe(self, user_id: int, is_admin: bool, topics: FrozenSet[str]) -> Subscriber:
+        """新建订阅；超过总连接数或单用户连接数上限时抛出 EventStreamLimitError"""
+        if len(self._subscribers) >= settings.EVENTS_MAX_CONNECTIONS:
+            self.rejected += 1
+            raise EventStreamLimitError("Too many event stream connections")
+        if self._per_user.get(user_id, 0) >= settings.EVENTS_MAX_CONNECTIONS_PER_USER:
+            self.rejected += 1
+            raise EventStreamLimitError("Too many event stream connections for this user")
+        sub = Subscriber(user_id, is_admin, topics, settings.EVENTS_QUEUE_SIZE)
+        self._subscribers.add(sub)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        if sub not in self._subscribers:
+            return
+        self._subscribers.discard(sub)
+        remaining = self._per_user.get(sub.user_id, 0) - 1
+        if remaining > 0:
+            self._per_user[sub.user_id] = remaining
+        else:
+            self._per_user.pop(sub.user_id, None)
+
+    def disconnect_user(self, user_id: int) -> None:
+        """断开该用户的所有事件流（强制下线后不再推送）"""
+        self._call(self._disconnect_user, user_id)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return any(topic in sub.topics for sub in self._subscribers)
+
+    async def stream(self, sub: Subscriber, deadline: Optional[float] = None) -> AsyncIterator[bytes]:
+        """
+        逐条产出该订阅者的事件；空闲时每 EVENTS_HEARTBEAT_SECONDS 发送一次注释行保持连接。
+        到达 deadline（访问令牌过期时间）后结束，客户端重连时重新认证。
+        """
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                timeout = settings.EVENTS_HEARTBEAT_SECONDS
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return
+                    timeout = min(timeout, remaining)
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield _HEARTBEAT
+                    continue
+                if payload is None:
+                    return
+                sub.delivered += 1
+                yield payload
+        finally:
+            self.unsubscribe(sub)
+
+    # ── 发布 ──────────────────────────────────────────────────────────────────
+
+    def publish(self, event_type: str, data: dict, user_id: Optional[int] = None, admin_only: bool = False) -> None:
+        """
+        发布事件（不阻塞、线程安全）。user_id 非空时只投递给该用户和管理员；
+        admin_only 时只投递给管理员。
+        """
+        if not self._subscribers:
+            return
+        self._call(self._dispatch, event_type, data, user_id, admin_only)
+
+    def _call(self, fn, *args) -> None:
+        """在事件循环线程中执行（订阅者队列不是线程安全的）"""
+        loop = self._loop
+        if loop is None:
+            fn(*args)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            fn(*args)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(fn, *args)
+
+    def _dispatch(self, event_type: str, data: dict, user_id: Optional[int], admin_only: bool) -> None:
+        topic = EVENT_TOPICS[event_type]
+        targets = [s for s in self._subscribers if s.wants(topic, user_id, admin_only)]
+        with self._lock:
+            event_id = next(self._ids)
+        self.published += 1
+        if not targets:
+            return
+        payload = encode_event(event_type, data, event_id)
+        for sub in targets:
+            dropped = sub.offer(payload)
+            if dropped:
+                self.dropped += dropped
+            else:
+                self.delivered += 1
+
+    def _disconnect_user(self, user_id: int) -> None:
+        for sub in [s for s in self._subscribers if s.user_id == user_id]:
+            sub.close()
+
+    # ── 后台任务 ──────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._metrics_task is None:
+            self._metrics_task = asyncio.create_task(self._metrics_loop())
+
+    async def stop(self) -> None:
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            try:
+                await self._metrics_task
+            except asyncio.CancelledError:
+                pass
+            self._metrics_task = None
+        for sub in list(self._subscribers):
+            sub.close()
+        self._loop = None
+
+    def get_stats(self) -> dict:
+        return {
+            "connections": len(self._subscribers),
+            "users": len(self._per_user),
+            "max_connections": settings.EVENTS_MAX_CONNECTIONS,
+            "max_connections_per_user": settings.EVENTS_MAX_CONNECTIONS_PER_USER,
+            "queue_size": settings.EVENTS_QUEUE_SIZE,
+            "queued": sum(s.queue.qsize() for s in self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "slow_consumers": sum(1 for s in self._subscribers if s.overflows),
+        }
+
+    async def _metrics_loop(self) -> None:
+        """有订阅者时定期推送实时监控指标：每个间隔只采集一次，而不是每个客户端各轮询一次"""
+        from app.core.database import SessionLocal
+        from app.services.monitoring_service import MonitoringService
+
+        def snapshot() -> dict:
+            db = SessionLocal()
+            try:
+                return MonitoringService(db).get_realtime_metrics()
+            finally:
+                db.close()
+
+        while True:
+            await asyncio.sleep(settings.EVENTS_METRICS_INTERVAL_SECONDS)
+            if not self.has_subscribers("metrics"):
+                continue
+            try:
+                self.publish("metrics", await asyncio.to_thread(snapshot))
+            except Exception as e:
+                logger.warning(f"Metrics event snapshot failed: {e}")
+
+
+# 全局单例
+event_bus = EventBus()
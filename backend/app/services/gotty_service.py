@@ -1,13 +1,19 @@
 import asyncio
+import logging
 import re
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional
+from typing import Deque, Optional
 
 from app.config import settings
 from app.core.exceptions import GottyStartupError
+from app.core.prometheus import GOTTY_POOL_REQUESTS, GOTTY_SPAWN_SECONDS
 from app.utils.port_manager import PortManager
 from app.utils.process_manager import ProcessManager
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class GottySession:
@@ -23,17 +29,136 @@ class GottyService:
             settings.GOTTY_PRIMARY_PORT,
             settings.GOTTY_PORT_START,
             settings.GOTTY_PORT_END,
+            quarantine_seconds=settings.GOTTY_PORT_QUARANTINE_SECONDS,
         )
         self.process_manager = ProcessManager()
 
+        # 预热进程池：已监听端口、token 已知的空闲 Gotty 进程
+        self._pool: Deque[GottySession] = deque()
+        self._pool_wakeup = asyncio.Event()
+        self._pool_task: Optional[asyncio.Task] = None
+        self.pool_hits = 0
+        self.pool_misses = 0
+
     async def start_gotty(self, user_id: int) -> GottySession:
+        if settings.GOTTY_POOL_ENABLED:
+            sess = self._take_from_pool()
+            # 无论命中与否都唤醒补充任务，由其判断是否低于 min_idle
+            self._pool_wakeup.set()
+            if sess is not None:
+                self.pool_hits += 1
+                GOTTY_POOL_REQUESTS.labels("hit").inc()
+                await self.port_manager.mark_in_use(sess.port)
+                return sess
+            self.pool_misses += 1
+            GOTTY_POOL_REQUESTS.labels("miss").inc()
+        sess = await self._spawn_gotty()
+        await self.port_manager.mark_in_use(sess.port)
+        return sess
+
+    async def stop_gotty(self, pid: int, port: Optional[int] = None):
+        await self.process_manager.kill_process(pid)
+        if port is not None:
+            await self.port_manager.release_port(port)
+
+    async def check_process_alive(self, pid: int) -> bool:
+        return self.process_manager.is_alive(pid)
+
+    # ─── 预热进程池 ───────────────────────────────────────────────────────────
+
+    def start_pool(self) -> None:
+        """启动后台补充任务（应用启动时调用，不阻塞启动流程）"""
+        if not settings.GOTTY_POOL_ENABLED or self._pool_task is not None:
+            return
+        self._pool_task = asyncio.create_task(self._pool_refill_loop())
+        self._pool_wakeup.set()
+        logger.info(
+            f"Gotty warm pool enabled (size={settings.GOTTY_POOL_SIZE}, "
+            f"min_idle={settings.GOTTY_POOL_MIN_IDLE}, max_idle={settings.GOTTY_POOL_MAX_IDLE})"
+        )
+
+    async def stop_pool(self) -> None:
+        """停止补充任务并清理所有空闲进程（应用关闭时调用）"""
+        if self._pool_task is not None:
+            self._pool_task.cancel()
+            try:
+                await self._pool_task
+            except asyncio.CancelledError:
+                pass
+            self._pool_task = None
+        while self._pool:
+            sess = self._pool.popleft()
+            try:
+                await self.stop_gotty(sess.pid, sess.port)
+            except Exception as e:
+                logger.warning(f"Failed to stop pooled gotty pid={sess.pid}: {e}")
+
+    def get_pool_stats(self) -> dict:
+        total = self.pool_hits + self.pool_misses
+        return {
+            "enabled": settings.GOTTY_POOL_ENABLED,
+            "idle": len(self._pool),
+            "size": settings.GOTTY_POOL_SIZE,
+            "min_idle": settings.GOTTY_POOL_MIN_IDLE,
+            "max_idle": settings.GOTTY_POOL_MAX_IDLE,
+            "hits": self.pool_hits,
+            "misses": self.pool_misses,
+            "hit_rate": round(self.pool_hits / total, 4) if total else 0.0,
+        }
+
+    def _take_from_pool(self) -> Optional[GottySession]:
+        """取出一个存活的空闲进程；已退出的进程直接丢弃并释放端口"""
+        while self._pool:
+            sess = self._pool.popleft()
+            if self.process_manager.is_alive(sess.pid):
+                return sess
+            logger.warning(f"Discarding dead pooled gotty pid={sess.pid}")
+            asyncio.create_task(self.stop_gotty(sess.pid, sess.port))
+        return None
+
+    async def _pool_refill_loop(self) -> None:
+        max_idle = max(settings.GOTTY_POOL_MAX_IDLE, 0)
+        target = min(settings.GOTTY_POOL_SIZE, max_idle)
+        first_fill = True
+        while True:
+            await self._pool_wakeup.wait()
+            self._pool_wakeup.clear()
+            # 启动时填满到 size；之后仅在低于 min_idle 时补充
+            if not first_fill and len(self._pool) >= settings.GOTTY_POOL_MIN_IDLE:
+                continue
+            first_fill = False
+            while len(self._pool) < target:
+                try:
+                    sess = await self._spawn_gotty()
+                except GottyStartupError as e:
+                    logger.warning(f"Gotty warm pool refill failed: {e.message}")
+                    await asyncio.sleep(5)
+                    break
+                except Exception as e:
+                    # 端口耗尽等其他异常同样退避后等待下次唤醒，不能让补充任务退出
+                    logger.error(f"Gotty warm pool refill error: {e}", exc_info=True)
+                    await asyncio.sleep(5)
+                    break
+                self._pool.append(sess)
+
+    # ─── 进程启动 ─────────────────────────────────────────────────────────────
+
+    async def _spawn_gotty(self) -> GottySession:
+        started = time.perf_counter()
         port = await self.port_manager.allocate_port()
+        allocated = time.perf_counter()
+        GOTTY_SPAWN_SECONDS.labels("port_allocation").observe(allocated - started)
         try:
             cmd = self._build_command(port)
             process = await self.process_manager.start_process(cmd)
+            execed = time.perf_counter()
+            GOTTY_SPAWN_SECONDS.labels("process_exec").observe(execed - allocated)
             token = await asyncio.wait_for(
                 self._extract_random_token(process), timeout=15.0
             )
+            done = time.perf_counter()
+            GOTTY_SPAWN_SECONDS.labels("token_extraction").observe(done - execed)
+            GOTTY_SPAWN_SECONDS.labels("total").observe(done - started)
             url = self._build_gotty_url(port, token)
             return GottySession(pid=process.pid, port=port, token=token, url=url)
         except asyncio.TimeoutError:
@@ -43,14 +168,6 @@ class GottyService:
             await self.port_manager.release_port(port)
             raise GottyStartupError(str(e))
 
-    async def stop_gotty(self, pid: int, port: Optional[int] = None):
-        await self.process_manager.kill_process(pid)
-        if port is not None:
-            await self.port_manager.release_port(port)
-
-    async def check_process_alive(self, pid: int) -> bool:
-        return self.process_manager.is_alive(pid)
-
     def _build_command(self, port: int) -> list:
         cmd = [
             settings.GOTTY_PATH,
@@ -5,7 +5,6 @@ IP 白名单服务
 """
 import ipaddress
 import logging
-import subprocess
 from datetime import datetime
 from typing import List, Optional
 
@@ -13,6 +12,8 @@ from sqlalchemy.orm import Session
 
 from app.models.ip_whitelist import IPWhitelist
 from app.models.system_config import SystemConfig
+from app.services.config_cache import config_cache
+from app.services.nginx_config_service import nginx_config_writer, write_conf_atomic
 
 logger = logging.getLogger(__name__)
 
@@ -22,20 +23,17 @@ NGINX_WHITELIST_CONF = "/etc/nginx/conf.d/ip_whitelist.conf"
 class IPWhitelistService:
 
     def get_whitelist(self, db: Session) -> dict:
-        """返回启用状态和条目列表"""
-        enabled_cfg = db.query(SystemConfig).filter_by(key="ip_whitelist_enabled").first()
-        enabled = enabled_cfg.value == "true" if enabled_cfg else False
-
-        entries = db.query(IPWhitelist).order_by(IPWhitelist.id).all()
+        """返回启用状态和条目列表（读取配置缓存）"""
+        snapshot = config_cache.get(db)
         return {
-            "enabled": enabled,
+            "enabled": snapshot.configs.get("ip_whitelist_enabled") == "true",
             "entries": [
-                {"id": e.id, "cidr": e.cidr, "note": e.note or ""}
-                for e in entries
+                {"id": e.id, "cidr": e.cidr, "note": e.note}
+                for e in snapshot.ip_whitelist
             ],
         }
 
-    def update_whitelist(
+    async def update_whitelist(
         self,
         db: Session,
         enabled: bool,
@@ -47,7 +45,7 @@ class IPWhitelistService:
         1. 若 enabled=True，校验 requester_ip 在新条目中（防自锁）
         2. 全量替换数据库条目
         3. 更新 system_config 中的启用开关
-        4. 重新生成 Nginx 配置并 reload
+        4. 通过 Nginx 配置写入任务重新生成配置并 reload
         """
         if enabled and requester_ip:
             if not self._ip_in_entries(requester_ip, entries):
@@ -56,7 +54,16 @@ class IPWhitelistService:
                     f"请先将 {requester_ip} 加入白名单后再保存。"
                 )
 
-        # 全量替换数据库条目
+        # 数据库写入为同步操作，放到线程中执行，避免在事件循环上等待 SQLite 写锁
+        from app.core.database import run_in_sync_session
+        await run_in_sync_session(self._replace_entries, enabled, entries)
+
+        # 生成 Nginx 配置并 reload（等待写入任务完成，失败时向调用方抛出）
+        await self._reload_nginx()
+
+    @staticmethod
+    def _replace_entries(db: Session, enabled: bool, entries: List[dict]) -> None:
+        """全量替换白名单条目并更新启用开关，提交后递增配置版本"""
         db.query(IPWhitelist).delete()
         for entry in entries:
             cidr = entry.get("cidr", "").strip()
@@ -66,7 +73,6 @@ class IPWhitelistService:
                     note=entry.get("note", ""),
                 ))
 
-        # 更新启用开关
         cfg = db.query(SystemConfig).filter_by(key="ip_whitelist_enabled").first()
         if cfg:
             cfg.value = "true" if enabled else "false"
@@ -74,12 +80,7 @@ class IPWhitelistService:
         else:
             db.add(SystemConfig(key="ip_whitelist_enabled", value="true" if enabled else "false"))
 
-        db.commit()
-
-        # 生成 Nginx 配置并 reload
-        conf_content = self._generate_nginx_conf(enabled, entries)
-        self._write_conf(conf_content)
-        self._reload_nginx()
+        config_cache.bump(db)
 
     def init_nginx_conf(self, db: Session) -> None:
         """应用启动时初始化 Nginx 配置文件（若不存在则生成默认配置）"""
@@ -135,24 +136,34 @@ class IPWhitelistService:
 
     def _write_conf(self, content: str) -> None:
         try:
-            with open(NGINX_WHITELIST_CONF, "w") as f:
-                f.write(content)
+            write_conf_atomic(NGINX_WHITELIST_CONF, content)
         except PermissionError:
             logger.error(f"Permission denied writing {NGINX_WHITELIST_CONF}")
             raise
 
-    def _reload_nginx(self) -> None:
+    async def _reload_nginx(self) -> None:
+        """
+        交由 Nginx 配置写入任务生成配置、执行 nginx -t 并 reload，
+        与 Gotty 路由更新共用同一个写入任务，合并 reload。
+        """
         try:
-            result = subprocess.run(
-                ["/usr/bin/sudo", "/usr/sbin/nginx", "-s", "reload"],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
-            if result.returncode != 0:
-                logger.error(f"nginx reload failed: {result.stderr}")
-                raise RuntimeError(f"nginx reload failed: {result.stderr}")
-            logger.info("Nginx reloaded successfully.")
-        except subprocess.TimeoutExpired:
-            logger.error("nginx reload timed out")
-            raise RuntimeError("nginx reload timed out")
+            await nginx_config_writer.apply("ip_whitelist")
+        except PermissionError:
+            logger.error(f"Permission denied writing {NGINX_WHITELIST_CONF}")
+            raise
+        logger.info("Nginx IP whitelist config applied.")
+
+
+def _render_whitelist_conf() -> str:
+    """从数据库读取白名单并生成配置（由写入任务在线程池中调用）"""
+    from app.core.database import SessionLocal
+    service = IPWhitelistService()
+    db = SessionLocal()
+    try:
+        data = service.get_whitelist(db)
+        return service._generate_nginx_conf(data["enabled"], data["entries"])
+    finally:
+        db.close()
+
+
+nginx_config_writer.register("ip_whitelist", NGINX_WHITELIST_CONF, _render_whitelist_conf)
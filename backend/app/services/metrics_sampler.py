@@ -0,0 +1,154 @@
+"""
+主机指标后台采样
+
+原先 /monitoring/realtime 每次请求都调用 psutil.cpu_percent(interval=0.5)，
+在事件循环中阻塞 500ms。这里由后台任务每隔 METRICS_SAMPLE_INTERVAL_SECONDS 采样一次
+CPU / 内存 / 负载 / 打开的文件描述符 / 网络收发字节数，写入固定长度的环形缓冲区，
+实时接口直接返回最新一次采样，历史接口返回最近 N 分钟的采样。
+
+cpu_percent(interval=None) 返回距上次调用的平均使用率，不阻塞；
+psutil 调用本身放在线程中执行，避免慢速 /proc 读取占用事件循环。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Deque, List, Optional
+
+import psutil
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HostSample:
+    timestamp: datetime
+    cpu_usage_percent: float
+    memory_usage_percent: float
+    load_1m: float
+    load_5m: float
+    load_15m: float
+    open_fds: int                   # 本进程打开的文件描述符数（含 socket）
+    net_bytes_sent: int
+    net_bytes_recv: int
+    net_sent_bytes_per_sec: float   # 与上一次采样之间的平均速率
+    net_recv_bytes_per_sec: float
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["timestamp"] = self.timestamp.isoformat()
+        return data
+
+
+def _open_fds(process: psutil.Process) -> int:
+    try:
+        return process.num_fds()
+    except (AttributeError, psutil.Error):
+        # Windows 没有 num_fds
+        try:
+            return process.num_handles()
+        except (AttributeError, psutil.Error):
+            return 0
+
+
+class MetricsSampler:
+    def __init__(self, interval_seconds: float, history_minutes: float):
+        self.interval_seconds = max(interval_seconds, 0.1)
+        self._samples: Deque[HostSample] = deque(
+            maxlen=max(1, int(history_minutes * 60 / self.interval_seconds))
+        )
+        self._process = psutil.Process(os.getpid())
+        self._task: Optional[asyncio.Task] = None
+        self._prev_net: Optional[tuple] = None    # (monotonic, bytes_sent, bytes_recv)
+        # sample() 在线程中执行，latest() / history() 在请求中读取
+        self._lock = threading.Lock()
+        self.sample_errors = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            # 首次调用 cpu_percent 只用于建立基准，返回值无意义
+            psutil.cpu_percent(interval=None)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def latest(self) -> Optional[HostSample]:
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def history(self, minutes: float) -> List[HostSample]:
+        since = datetime.utcnow() - timedelta(minutes=minutes)
+        with self._lock:
+            return [s for s in self._samples if s.timestamp >= since]
+
+    def sample(self) -> HostSample:
+        """采集一次并写入环形缓冲区（非阻塞，可在线程中调用）"""
+        now = time.monotonic()
+        try:
+            load_1m, load_5m, load_15m = psutil.getloadavg()
+        except (AttributeError, OSError):
+            load_1m = load_5m = load_15m = 0.0
+        net = psutil.net_io_counters()
+        sent_rate = recv_rate = 0.0
+        with self._lock:
+            prev = self._prev_net
+            self._prev_net = (now, net.bytes_sent, net.bytes_recv)
+        if prev is not None and now > prev[0]:
+            # 计数器回绕 / 网卡重置时速率记为 0
+            sent_rate = max(net.bytes_sent - prev[1], 0) / (now - prev[0])
+            recv_rate = max(net.bytes_recv - prev[2], 0) / (now - prev[0])
+
+        sample = HostSample(
+            timestamp=datetime.utcnow(),
+            cpu_usage_percent=psutil.cpu_percent(interval=None),
+            memory_usage_percent=psutil.virtual_memory().percent,
+            load_1m=round(load_1m, 2),
+            load_5m=round(load_5m, 2),
+            load_15m=round(load_15m, 2),
+            open_fds=_open_fds(self._process),
+            net_bytes_sent=net.bytes_sent,
+            net_bytes_recv=net.bytes_recv,
+            net_sent_bytes_per_sec=round(sent_rate, 1),
+            net_recv_bytes_per_sec=round(recv_rate, 1),
+        )
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            size = len(self._samples)
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval_seconds,
+            "samples": size,
+            "capacity": self._samples.maxlen,
+            "sample_errors": self.sample_errors,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except Exception as e:
+                self.sample_errors += 1
+                logger.warning(f"Host metrics sample failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+# 全局单例
+metrics_sampler = MetricsSampler(settings.METRICS_SAMPLE_INTERVAL_SECONDS, settings.METRICS_HISTORY_MINUTES)
@@ -0,0 +1,304 @@
+"""
+监控时序存储
+
+每分钟把以下指标聚合为 (count, sum, min, max) 写入 metric_points 定长表：
+- active_sessions / online_users：每分钟采集一次会话数
+- cpu_usage_percent / memory_usage_percent：该分钟内 metrics_sampler 的全部采样
+- spawn_latency_ms：该分钟内每次创建会话启动 Gotty 的耗时（observe() 记录）
+
+1 分钟数据随后汇总到 1 小时、1 小时汇总到 1 天。汇总从目标粒度已有的最后一个时间桶
+（含尚未结束的当前桶）开始重新计算，可重复执行，停机后重启也会补齐；
+各粒度按 METRICS_*_RETENTION_* 分别清理。查询按时间范围自动选择粒度，
+监控统计接口读取的是汇总数据而不是原始行。
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.database import SessionLocal
+from app.models.metric_point import MetricPoint
+
+logger = logging.getLogger(__name__)
+
+# 指标 id 写入数据库，只能追加，不能修改已有编号
+METRICS: Dict[str, int] = {
+    "active_sessions": 1,
+    "online_users": 2,
+    "spawn_latency_ms": 3,
+    "cpu_usage_percent": 4,
+    "memory_usage_percent": 5,
+}
+
+TIER_MINUTE, TIER_HOUR, TIER_DAY = 0, 1, 2
+TIER_SECONDS = {TIER_MINUTE: 60, TIER_HOUR: 3600, TIER_DAY: 86400}
+TIER_NAMES = {TIER_MINUTE: "1m", TIER_HOUR: "1h", TIER_DAY: "1d"}
+
+COLLECT_INTERVAL_SECONDS = 60
+RETENTION_EVERY_SECONDS = 3600
+
+
+def _epoch(dt: datetime) -> int:
+    return int((dt - datetime(1970, 1, 1)).total_seconds())
+
+
+def _from_epoch(ts: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=ts)
+
+
+@dataclass
+class _Aggregate:
+    count: int = 0
+    sum: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+def choose_tier(span: timedelta) -> int:
+    """按查询时间跨度选择粒度，返回点数控制在几百个以内"""
+    if span <= timedelta(hours=6):
+        return TIER_MINUTE
+    if span <= timedelta(days=14):
+        return TIER_HOUR
+    return TIER_DAY
+
+
+class MetricsStore:
+    def __init__(self):
+        # (metric_id, 分钟桶) -> 尚未写库的聚合
+        self._pending: Dict[Tuple[int, int], _Aggregate] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_host_sample: Optional[datetime] = None
+        self._last_retention = 0.0
+        self.flushes = 0
+        self.last_run_ms = 0.0
+        self.errors = 0
+
+    # ── 写入 ──────────────────────────────────────────────────────────────────
+
+    def observe(self, metric: str, value: float, at: Optional[datetime] = None) -> None:
+        """记录一次观测值，计入所在分钟的聚合（线程安全，不访问数据库）"""
+        bucket = _epoch(at or datetime.utcnow()) // 60 * 60
+        with self._lock:
+            self._pending.setdefault((METRICS[metric], bucket), _Aggregate()).add(float(value))
+
+    def collect(self, db: Session, now: Optional[datetime] = None) -> None:
+        """采集当前会话数，并把上次采集以来的主机采样计入聚合"""
+        from app.services.metrics_sampler import metrics_sampler
+        from app.services.monitoring_service import MonitoringService
+
+        now = now or datetime.utcnow()
+        active_sessions, online_users = MonitoringService(db).get_session_counts()
+        self.observe("active_sessions", active_sessions, now)
+        self.observe("online_users", online_users, now)
+        for sample in metrics_sampler.history(COLLECT_INTERVAL_SECONDS * 2 / 60):
+            if self._last_host_sample is not None and sample.timestamp <= self._last_host_sample:
+                continue
+            self.observe("cpu_usage_percent", sample.cpu_usage_percent, sample.timestamp)
+            self.observe("memory_usage_percent", sample.memory_usage_percent, sample.timestamp)
+            self._last_host_sample = sample.timestamp
+
+    def flush(self, db: Session) -> int:
+        """把内存中的分钟聚合合并写入 1 分钟粒度，返回写入行数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        stmt = sqlite_insert(MetricPoint).values([
+            {
+                "metric_id": metric_id, "tier": TIER_MINUTE, "bucket": bucket,
+                "count": agg.count, "sum": agg.sum, "min": agg.min, "max": agg.max,
+            }
+            for (metric_id, bucket), agg in pending.items()
+        ])
+        # 同一分钟已写入过（当前分钟多次 flush）时合并聚合值
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["metric_id", "tier", "bucket"],
+            set_={
+                "count": MetricPoint.count + stmt.excluded.count,
+                "sum": MetricPoint.sum + stmt.excluded.sum,
+                "min": func.min(MetricPoint.min, stmt.excluded.min),
+                "max": func.max(MetricPoint.max, stmt.excluded.max),
+            },
+        )
+        db.execute(stmt)
+        db.commit()
+        self.flushes += 1
+        return len(pending)
+
+    def rollup(self, db: Session) -> None:
+        """1 分钟 → 1 小时 → 1 天，从目标粒度最后一个时间桶开始重新汇总"""
+        for source, target in ((TIER_MINUTE, TIER_HOUR), (TIER_HOUR, TIER_DAY)):
+            size = TIER_SECONDS[target]
+            watermark = db.execute(
+                select(func.max(MetricPoint.bucket)).where(MetricPoint.tier == target)
+            ).scalar()
+            if watermark is None:
+                watermark = db.execute(
+                    select(func.min(MetricPoint.bucket)).where(MetricPoint.tier == source)
+                ).scalar()
+                if watermark is None:
+                    continue
+            db.execute(
+                text(
+                    "INSERT OR REPLACE INTO metric_points (metric_id, tier, bucket, count, sum, min, max) "
+                    "SELECT metric_id, :target, bucket - bucket % :size, "
+                    "SUM(count), SUM(sum), MIN(min), MAX(max) "
+                    "FROM metric_points WHERE tier = :source AND bucket >= :watermark "
+                    "GROUP BY metric_id, bucket - bucket % :size"
+                ),
+                {"target": target, "source": source, "size": size, "watermark": watermark - watermark % size},
+            )
+        db.commit()
+
+    def apply_retention(self, db: Session, now: Optional[datetime] = None) -> None:
+        now = now or datetime.utcnow()
+        retention = {
+            TIER_MINUTE: timedelta(hours=settings.METRICS_MINUTE_RETENTION_HOURS),
+            TIER_HOUR: timedelta(days=settings.METRICS_HOUR_RETENTION_DAYS),
+            TIER_DAY: timedelta(days=settings.METRICS_DAY_RETENTION_DAYS),
+        }
+        for tier, keep in retention.items():
+            db.execute(
+                delete(MetricPoint).where(MetricPoint.tier == tier, MetricPoint.bucket < _epoch(now - keep))
+            )
+        db.commit()
+
+    def run_once(self, now: Optional[datetime] = None) -> None:
+        """采集、写入、汇总一次（同步，在线程中调用）"""
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            self.collect(db, now)
+            self.flush(db)
+            self.rollup(db)
+            if time.monotonic() - self._last_retention >= RETENTION_EVERY_SECONDS:
+                self.apply_retention(db, now)
+                self._last_retention = time.monotonic()
+        finally:
+            db.close()
+        self.last_run_ms = (time.monotonic() - started) * 1000
+
+    # ── 查询 ──────────────────────────────────────────────────────────────────
+
+    def query(
+        self, db: Session, metric: str, start: datetime, end: datetime, tier: Optional[int] = None
+    ) -> List[dict]:
+        """返回 [start, end) 内的时间序列点；tier 为空时按跨度自动选择"""
+        if tier is None:
+            tier = choose_tier(end - start)
+        size = TIER_SECONDS[tier]
+        rows = db.execute(
+            select(MetricPoint.bucket, MetricPoint.count, MetricPoint.sum, MetricPoint.min, MetricPoint.max)
+            .where(
+                MetricPoint.metric_id == METRICS[metric],
+                MetricPoint.tier == tier,
+                MetricPoint.bucket >= _epoch(start) // size * size,
+                MetricPoint.bucket < _epoch(end),
+            )
+            .order_by(MetricPoint.bucket)
+        ).all()
+        return [
+            {
+                "timestamp": _from_epoch(r.bucket).isoformat(),
+                "avg": round(r.sum / r.count, 2) if r.count else None,
+                "min": r.min,
+                "max": r.max,
+                "count": r.count,
+            }
+            for r in rows
+        ]
+
+    def daily(self, db: Session, start: datetime, end: datetime) -> Dict[str, Dict[str, dict]]:
+        """按天返回所有指标的汇总：{date: {metric: {avg, min, max}}}"""
+        names = {v: k for k, v in METRICS.items()}
+        rows = db.execute(
+            select(MetricPoint.metric_id, MetricPoint.bucket, MetricPoint.count,
+                   MetricPoint.sum, MetricPoint.min, MetricPoint.max)
+            .where(
+                MetricPoint.tier == TIER_DAY,
+                MetricPoint.bucket >= _epoch(start) // 86400 * 86400,
+                MetricPoint.bucket < _epoch(end),
+            )
+            .order_by(MetricPoint.bucket)
+        ).all()
+        result: Dict[str, Dict[str, dict]] = {}
+        for r in rows:
+            if r.metric_id not in names:
+                continue
+            day = _from_epoch(r.bucket).date().isoformat()
+            result.setdefault(day, {})[names[r.metric_id]] = {
+                "avg": round(r.sum / r.count, 2) if r.count else None,
+                "min": r.min,
+                "max": r.max,
+            }
+        return result
+
+    # ── 后台任务 ──────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # 写入尚未落库的观测值
+        try:
+            await asyncio.to_thread(self._flush_pending)
+        except Exception as e:
+            logger.warning(f"Metrics store final flush failed: {e}")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "running": self._task is not None,
+            "pending_buckets": pending,
+            "flushes": self.flushes,
+            "last_run_ms": round(self.last_run_ms, 2),
+            "errors": self.errors,
+        }
+
+    def _flush_pending(self) -> None:
+        db = SessionLocal()
+        try:
+            self.flush(db)
+            self.rollup(db)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            # 对齐到整分钟之后几秒，确保上一分钟的主机采样都已产生
+            await asyncio.sleep(COLLECT_INTERVAL_SECONDS - time.time() % COLLECT_INTERVAL_SECONDS + 2)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Metrics store run failed: {e}")
+
+
+# 全局单例
+metrics_store = MetricsStore()
@@ -1,20 +1,58 @@
 import csv
 import io
+import json
 from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-import psutil
-from sqlalchemy import func
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.core.database import SessionLocal
 from app.models.session import Session as SessionModel
 from app.models.user import User
+from app.services.metrics_sampler import metrics_sampler
+from app.services.metrics_store import metrics_store
+from app.services.session_stats_service import session_stats
+from app.utils.streaming import gzip_chunks
+
+
+# 可导出的列；默认列与原导出一致
+SESSION_EXPORT_COLUMNS = {
+    "session_id": SessionModel.id,
+    "user_id": SessionModel.user_id,
+    "username": User.username,
+    "status": SessionModel.status,
+    "started_at": SessionModel.started_at,
+    "last_activity_at": SessionModel.last_activity_at,
+    "closed_at": SessionModel.closed_at,
+    "duration_seconds": SessionModel.duration_seconds,
+}
+DEFAULT_EXPORT_COLUMNS = ["session_id", "username", "status", "started_at", "closed_at", "duration_seconds"]
+SESSION_STATUSES = ("starting", "running", "closed")
+EXPORT_FORMATS = ("csv", "ndjson")
+# 每次从游标取出的行数，以及单个响应分块的目标大小
+EXPORT_FETCH_ROWS = 2000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _parse_date_range(start_date: str, end_date: str) -> Tuple[datetime, datetime]:
+    """解析 YYYY-MM-DD 起止日期（含结束当天）；格式不合法时取最近 30 天"""
+    try:
+        sd = datetime.strptime(start_date, "%Y-%m-%d")
+        ed = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        sd = datetime.utcnow() - timedelta(days=30)
+        ed = datetime.utcnow()
+    return sd, ed
 
 
 class MonitoringService:
     def __init__(self, db: Session):
         self.db = db
 
-    def get_realtime_metrics(self) -> dict:
+    def get_session_counts(self) -> Tuple[int, int]:
+        """返回 (运行中会话数, 最近 5 分钟有活动的在线用户数)"""
         active_sessions = (
             self.db.query(SessionModel).filter_by(status="running").count()
         )
@@ -28,87 +66,141 @@ class MonitoringService:
             .distinct()
             .count()
         )
-        cpu_usage = psutil.cpu_percent(interval=0.5)
-        memory_usage = psutil.virtual_memory().percent
-        return {
+        return active_sessions, online_users
+
+    def get_realtime_metrics(self) -> dict:
+        active_sessions, online_users = self.get_session_counts()
+        # 主机指标取后台采样的最新值；采样任务未运行（如脚本环境）时现采一次，不阻塞
+        sample = metrics_sampler.latest() or metrics_sampler.sample()
+        data = sample.as_dict()
+        data.update({
             "active_sessions": active_sessions,
             "online_users": online_users,
-            "cpu_usage_percent": cpu_usage,
-            "memory_usage_percent": memory_usage,
+            "sampled_at": data["timestamp"],
             "timestamp": datetime.utcnow().isoformat(),
-        }
+        })
+        return data
 
     def get_statistics(self, days: int = 7) -> dict:
         start_date = datetime.utcnow() - timedelta(days=days)
         total_users = self.db.query(User).count()
-        total_sessions = (
-            self.db.query(SessionModel)
-            .filter(SessionModel.started_at >= start_date)
-            .count()
-        )
-        avg_duration = (
-            self.db.query(func.avg(SessionModel.duration_seconds))
-            .filter(
-                SessionModel.started_at >= start_date,
-                SessionModel.status == "closed",
-            )
-            .scalar()
-            or 0
-        )
-        daily_sessions = (
-            self.db.query(
-                func.date(SessionModel.started_at).label("date"),
-                func.count(SessionModel.id).label("count"),
-            )
-            .filter(SessionModel.started_at >= start_date)
-            .group_by(func.date(SessionModel.started_at))
-            .all()
-        )
-        top_users = (
-            self.db.query(
-                User.username,
-                func.count(SessionModel.id).label("session_count"),
-            )
-            .join(SessionModel, User.id == SessionModel.user_id)
-            .filter(SessionModel.started_at >= start_date)
-            .group_by(User.username)
-            .order_by(func.count(SessionModel.id).desc())
-            .limit(10)
-            .all()
-        )
+        # 会话数 / 平均时长 / 每日会话数 / 活跃用户排行读取 session_daily_stats 汇总，
+        # 只有 start_date 所在的不完整的一天扫描 sessions 原始行
+        summary = session_stats.summarize(self.db, start_date)
+        # 每日负载（峰值会话数 / 在线用户、CPU / 内存、会话启动耗时）读取时序存储的 1 天汇总
+        daily_load = metrics_store.daily(self.db, start_date, datetime.utcnow() + timedelta(days=1))
         return {
             "total_users": total_users,
-            "total_sessions": total_sessions,
-            "average_session_duration_seconds": int(avg_duration),
-            "daily_sessions": [{"date": str(d.date), "count": d.count} for d in daily_sessions],
-            "top_users": [{"username": u.username, "session_count": u.session_count} for u in top_users],
+            **summary,
+            "daily_load": [{"date": day, **metrics} for day, metrics in daily_load.items()],
         }
 
-    def export_csv(self, start_date: str, end_date: str) -> str:
-        try:
-            sd = datetime.strptime(start_date, "%Y-%m-%d")
-            ed = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-        except ValueError:
-            sd = datetime.utcnow() - timedelta(days=30)
-            ed = datetime.utcnow()
-
-        sessions = (
-            self.db.query(SessionModel, User.username)
+    def export(
+        self,
+        start_date: str,
+        end_date: str,
+        filters: Optional[Dict[str, Any]] = None,
+        columns: Optional[List[str]] = None,
+        fmt: str = "csv",
+        compress: bool = False,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> StreamingResponse:
+        """
+        流式导出 [start_date, end_date] 内创建的会话（CSV 或 NDJSON，可选 gzip）。
+        按批从游标读取列元组，内存占用与导出范围无关；生成器在响应发送期间执行，
+        此时请求级 db 已关闭，因此使用独立会话。列名或格式不合法时抛出 ValueError。
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        columns = columns or DEFAULT_EXPORT_COLUMNS
+        unknown = [c for c in columns if c not in SESSION_EXPORT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+        status = (filters or {}).get("status")
+        if status and any(s not in SESSION_STATUSES for s in status):
+            raise ValueError(f"Unknown session status, expected: {', '.join(SESSION_STATUSES)}")
+
+        sd, ed = _parse_date_range(start_date, end_date)
+        chunks = self.iter_export(sd, ed, filters or {}, columns, fmt, session_factory)
+        if compress:
+            chunks = gzip_chunks(chunks)
+
+        filename = "sessions_report." + fmt + (".gz" if compress else "")
+        media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            chunks,
+            media_type="application/gzip" if compress else media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+
+    @staticmethod
+    def iter_export(
+        sd: datetime,
+        ed: datetime,
+        filters: Dict[str, Any],
+        columns: List[str],
+        fmt: str = "csv",
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> Iterator[bytes]:
+        """逐块生成导出内容（UTF-8 字节），每块约 EXPORT_CHUNK_BYTES，按 started_at 升序"""
+        stmt = (
+            select(*(SESSION_EXPORT_COLUMNS[c] for c in columns))
             .join(User, SessionModel.user_id == User.id)
-            .filter(SessionModel.started_at >= sd, SessionModel.started_at < ed)
-            .all()
+            .where(SessionModel.started_at >= sd, SessionModel.started_at < ed)
+            .order_by(SessionModel.started_at, SessionModel.id)
         )
+        if filters.get("user_id"):
+            stmt = stmt.where(SessionModel.user_id == filters["user_id"])
+        if filters.get("username"):
+            stmt = stmt.where(User.username == filters["username"])
+        if filters.get("status"):
+            stmt = stmt.where(SessionModel.status.in_(filters["status"]))
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(columns)
+
+        db = session_factory()
+        try:
+            for row in db.execute(stmt.execution_options(yield_per=EXPORT_FETCH_ROWS)):
+                if fmt == "csv":
+                    # 与原导出格式一致：时间按 str(datetime) 输出，空值为空串
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(
+                        {c: v.isoformat() if isinstance(v, datetime) else v for c, v in zip(columns, row)},
+                        ensure_ascii=False,
+                    ))
+                    buffer.write("\n")
+                if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate(0)
+        finally:
+            db.close()
+        yield buffer.getvalue().encode("utf-8")
+
+    def export_daily_csv(self, start_date: str, end_date: str) -> str:
+        """按天 / 用户导出会话汇总（读取 session_daily_stats，不扫描 sessions）"""
+        sd, ed = _parse_date_range(start_date, end_date)
+        # ed 不在零点时（未指定日期，取到当前时刻）包含 ed 当天
+        end_day = (ed - timedelta(microseconds=1)).date() + timedelta(days=1)
 
         output = io.StringIO()
         writer = csv.writer(output)
-        writer.writerow(["session_id", "username", "status", "started_at", "closed_at", "duration_seconds"])
-        for sess, username in sessions:
+        writer.writerow([
+            "date", "username", "session_count", "closed_count",
+            "total_duration_seconds", "average_duration_seconds", "max_concurrency",
+        ])
+        for row in session_stats.daily_rows(self.db, sd.date(), end_day):
             writer.writerow([
-                sess.id,
-                username,
-                sess.status,
-                sess.started_at,
-                sess.closed_at,
-                sess.duration_seconds,
+                row.day.isoformat(),
+                row.username,
+                row.session_count,
+                row.closed_count,
+                row.total_duration_seconds,
+                int(row.total_duration_seconds / row.closed_count) if row.closed_count else 0,
+                row.max_concurrency,
             ])
         return output.getvalue()
@@ -0,0 +1,268 @@
+"""
+Nginx 动态配置写入服务
+
+单个后台任务统一负责 conf.d 下动态配置文件的生成、写入和 Nginx reload：
+- 防抖窗口内的多次变更通知合并为一次写入 + 一次 reload
+- 生成内容与上次写入一致时跳过写入和 reload
+- 临时文件 + rename 原子写入
+- reload 前执行 nginx -t，校验失败时回滚配置文件
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+from app.config import settings
+from app.core.prometheus import NGINX_RELOAD_SECONDS, NGINX_RELOADS
+
+logger = logging.getLogger(__name__)
+
+NGINX_TEST_CMD = ["/usr/bin/sudo", "/usr/sbin/nginx", "-t"]
+NGINX_RELOAD_CMD = ["/usr/bin/sudo", "/usr/sbin/nginx", "-s", "reload"]
+NGINX_CMD_TIMEOUT = 10
+
+
+@dataclass
+class _ManagedConf:
+    path: str
+    render: Callable[[], str]          # 同步函数，在线程池中执行（可查询数据库）
+    last_content: Optional[str] = None
+
+
+@dataclass
+class NginxReloadStats:
+    notifications: int = 0
+    batches: int = 0
+    writes: int = 0
+    skipped_unchanged: int = 0
+    reloads: int = 0
+    reload_failures: int = 0
+    last_reload_ms: float = 0.0
+    total_reload_ms: float = 0.0
+    last_error: Optional[str] = None
+    last_reload_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "writes": self.writes,
+            "skipped_unchanged": self.skipped_unchanged,
+            "reloads": self.reloads,
+            "reload_failures": self.reload_failures,
+            "last_reload_ms": round(self.last_reload_ms, 2),
+            "avg_reload_ms": round(self.total_reload_ms / self.reloads, 2) if self.reloads else 0.0,
+            "last_error": self.last_error,
+            "last_reload_at": self.last_reload_at,
+        }
+
+
+def _content_key(content: str) -> str:
+    """比较内容时忽略整行注释（如生成时间戳）"""
+    return "\n".join(
+        line for line in content.splitlines() if not line.lstrip().startswith("#")
+    )
+
+
+def write_conf_atomic(path: str, content: str) -> None:
+    """
+    临时文件 + rename 原子写入。
+    部署时通常只 chown 了目标文件本身，conf.d 目录不可写，此时回退为原地覆盖写入。
+    临时文件名不以 .conf 结尾，避免被 nginx 的 include conf.d/*.conf 读到。
+    """
+    tmp_path = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp"
+    )
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+    except PermissionError:
+        with open(path, "w") as f:
+            f.write(content)
+        return
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+
+class NginxConfigWriter:
+    def __init__(self, debounce_seconds: float = 1.0):
+        self.debounce_seconds = debounce_seconds
+        self._confs: Dict[str, _ManagedConf] = {}
+        self._dirty: Set[str] = set()
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = NginxReloadStats()
+
+    def register(self, name: str, path: str, render: Callable[[], str]) -> None:
+        self._confs[name] = _ManagedConf(path=path, render=render)
+
+    def notify(self, name: str) -> None:
+        """标记配置需要重新生成；防抖窗口内的多次通知合并处理"""
+        if name not in self._confs:
+            raise KeyError(f"Unknown nginx conf: {name}")
+        self.stats.notifications += 1
+        self._dirty.add(name)
+        self._wakeup.set()
+
+    async def apply(self, name: str) -> None:
+        """
+        标记变更并等待其所在批次完成。
+        写入或 reload 失败时抛出 RuntimeError / PermissionError。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.notify(name)
+        if self._task is None:
+            # 后台任务未启动（如脚本环境），直接在当前协程内处理
+            await self._process_batch()
+        await future
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务，停止前处理完尚未写入的变更"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._dirty:
+            await self._process_batch()
+
+    def get_stats(self) -> dict:
+        data = self.stats.as_dict()
+        data["pending"] = sorted(self._dirty)
+        data["debounce_seconds"] = self.debounce_seconds
+        return data
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.debounce_seconds)
+            await self._process_batch()
+
+    async def _process_batch(self) -> None:
+        self._wakeup.clear()
+        names, self._dirty = self._dirty, set()
+        waiters, self._waiters = self._waiters, []
+        if not names:
+            self._resolve(waiters, None)
+            return
+
+        self.stats.batches += 1
+        backups: Dict[str, Optional[str]] = {}
+        try:
+            for name in sorted(names):
+                conf = self._confs[name]
+                content = await asyncio.to_thread(conf.render)
+                previous = conf.last_content
+                if previous is None:
+                    previous = await asyncio.to_thread(self._read_existing, conf.path)
+                if previous is not None and _content_key(previous) == _content_key(content):
+                    conf.last_content = previous
+                    self.stats.skipped_unchanged += 1
+                    continue
+                await asyncio.to_thread(write_conf_atomic, conf.path, content)
+                backups[name] = previous
+                conf.last_content = content
+                self.stats.writes += 1
+
+            if backups:
+                await self._test_and_reload(backups)
+        except Exception as e:
+            self.stats.last_error = str(e)
+            logger.warning(f"Nginx config update failed: {e}")
+            self._resolve(waiters, e)
+            return
+        self._resolve(waiters, None)
+
+    async def _test_and_reload(self, backups: Dict[str, Optional[str]]) -> None:
+        start = time.perf_counter()
+        rc, output = await self._exec(NGINX_TEST_CMD)
+        if rc != 0:
+            self.stats.reload_failures += 1
+            NGINX_RELOADS.labels("test_failed").inc()
+            NGINX_RELOAD_SECONDS.observe(time.perf_counter() - start)
+            # 校验失败：回滚本批次写入的文件（此前不存在的文件直接删除），下次变更时重新生成
+            for name, previous in backups.items():
+                conf = self._confs[name]
+                conf.last_content = None
+                if previous is not None:
+                    await asyncio.to_thread(write_conf_atomic, conf.path, previous)
+                else:
+                    await asyncio.to_thread(self._remove_new, conf.path)
+            raise RuntimeError(f"nginx -t failed: {output}")
+
+        rc, output = await self._exec(NGINX_RELOAD_CMD)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        NGINX_RELOAD_SECONDS.observe(elapsed_ms / 1000)
+        if rc != 0:
+            self.stats.reload_failures += 1
+            NGINX_RELOADS.labels("reload_failed").inc()
+            raise RuntimeError(f"nginx reload failed: {output}")
+        self.stats.reloads += 1
+        NGINX_RELOADS.labels("success").inc()
+        self.stats.last_reload_ms = elapsed_ms
+        self.stats.total_reload_ms += elapsed_ms
+        self.stats.last_reload_at = time.time()
+        self.stats.last_error = None
+        logger.info(f"Nginx reloaded ({', '.join(sorted(backups))}) in {elapsed_ms:.0f} ms")
+
+    @staticmethod
+    async def _exec(cmd: list) -> tuple:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+        except OSError as e:
+            return -1, str(e)
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout=NGINX_CMD_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return -1, f"{' '.join(cmd)} timed out"
+        return proc.returncode, out.decode("utf-8", errors="replace").strip()
+
+    @staticmethod
+    def _read_existing(path: str) -> Optional[str]:
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _remove_new(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _resolve(waiters: List[asyncio.Future], error: Optional[Exception]) -> None:
+        for future in waiters:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+nginx_config_writer = NginxConfigWriter(settings.NGINX_RELOAD_DEBOUNCE_SECONDS)
@@ -53,6 +53,7 @@ class SecretsManagerLoader:
         返回 True 表示检测到轮换。
         """
         from app.models.system_config import SystemConfig
+        from app.services.config_cache import config_cache
         from app.services.token_service import token_service
 
         current_hash = _sha256(current_secret_key)
@@ -61,7 +62,7 @@ class SecretsManagerLoader:
         if cfg is None:
             # 首次启动，写入哈希
             db.add(SystemConfig(key="secret_key_hash", value=current_hash, updated_at=datetime.utcnow()))
-            db.commit()
+            config_cache.bump(db)
             logger.info("secret_key_hash initialized in system_config")
             return False
 
@@ -72,9 +73,11 @@ class SecretsManagerLoader:
             db.query(RefreshToken).filter_by(revoked=False).update({"revoked": True})
             cfg.value = current_hash
             cfg.updated_at = datetime.utcnow()
-            db.commit()
-            # 重新初始化黑名单缓存
+            config_cache.bump(db)
+            # 重新初始化黑名单缓存，清空按旧 key 验证过的 JWT 解码缓存
             token_service.init_blacklist_cache(db)
+            from app.core.security import invalidate_token_cache
+            invalidate_token_cache()
             return True
 
         return False
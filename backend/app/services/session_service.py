@@ -2,22 +2,27 @@ import asyncio
 import logging
 import random
 import string
-import subprocess
+import time
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.core.exceptions import (
-    DailyQuotaExceededError,
-    SessionLimitExceededError,
-    SessionNotFoundError,
-)
-from app.models.permission import UserPermission
+from app.core.exceptions import SessionNotFoundError
 from app.models.session import Session as SessionModel
+from app.models.user import User
+from app.services.admission_service import admission_controller
+from app.services.alert_detector import alert_detector
 from app.services.audit_service import AuditEventType, AuditService
+from app.services.event_bus import event_bus
 from app.services.gotty_service import gotty_service
+from app.services.metrics_store import metrics_store
+from app.services.nginx_config_service import nginx_config_writer
+from app.services.session_stats_service import session_stats
+from app.services.session_token_index import session_token_index
+from app.utils.pagination import encode_cursor, keyset_before
 
 logger = logging.getLogger(__name__)
 
@@ -36,39 +41,83 @@ def _generate_session_id() -> str:
     return "sess_" + "".join(random.choices(chars, k=16))
 
 
+def _publish_session_event(session: SessionModel, action: str) -> None:
+    """推送会话状态变化（不含 gotty_url / random_token，客户端需要时通过 REST 接口获取）"""
+    event_bus.publish(
+        "session",
+        {
+            "action": action,
+            "session": {
+                "id": session.id,
+                "user_id": session.user_id,
+                "status": session.status,
+                "started_at": session.started_at,
+                "closed_at": session.closed_at,
+                "duration_seconds": session.duration_seconds,
+            },
+        },
+        user_id=session.user_id,
+    )
+
+
 class SessionService:
-    def __init__(self, db: Session):
+    """
+    会话生命周期。使用 AsyncSession，查询不阻塞事件循环；
+    与同步 Session 共用的组件（准入控制、每日汇总、token 索引）通过 run_sync 在同一事务中执行。
+    """
+
+    def __init__(self, db: AsyncSession):
         self.db = db
 
     async def create_session(self, user_id: int, client_ip: str = None, username: str = None) -> SessionModel:
-        await self._check_concurrent_limit(user_id)
-        await self._check_daily_quota(user_id)
-
-        gotty_sess = await gotty_service.start_gotty(user_id)
-
-        session = SessionModel(
-            id=_generate_session_id(),
-            user_id=user_id,
-            gotty_pid=gotty_sess.pid,
-            gotty_port=gotty_sess.port,
-            gotty_url=gotty_sess.url,
-            random_token=gotty_sess.token,
-            status="starting",
-        )
-        self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
+        # 并发数 / 每日配额检查并预占名额（内存计数，O(1) 且并发安全）
+        max_sessions, daily_quota = await self.db.run_sync(admission_controller.get_limits, user_id)
+        admission_controller.acquire(user_id, max_sessions, daily_quota)
+        gotty_sess = None
+        try:
+            spawn_started = time.monotonic()
+            gotty_sess = await gotty_service.start_gotty(user_id)
+            metrics_store.observe("spawn_latency_ms", (time.monotonic() - spawn_started) * 1000)
 
-        # 审计日志：会话创建
+            session = SessionModel(
+                id=_generate_session_id(),
+                user_id=user_id,
+                gotty_pid=gotty_sess.pid,
+                gotty_port=gotty_sess.port,
+                gotty_url=gotty_sess.url,
+                random_token=gotty_sess.token,
+                status="starting",
+                started_at=datetime.utcnow(),
+            )
+            self.db.add(session)
+            # 每日汇总与会话行在同一事务中更新
+            await self.db.run_sync(lambda db: session_stats.record_start(db, session))
+            await self.db.commit()
+        except BaseException:
+            admission_controller.cancel(user_id)
+            if gotty_sess is not None:
+                # 进程已启动但会话未落库（写入失败 / 客户端断开取消请求）：终止进程并释放端口。
+                # shield 保证请求被取消时清理仍会执行完
+                try:
+                    await asyncio.shield(gotty_service.stop_gotty(gotty_sess.pid, gotty_sess.port))
+                except Exception as e:
+                    logger.warning(f"Failed to stop orphaned gotty pid={gotty_sess.pid}: {e}")
+            raise
+        await self.db.refresh(session)
+        session_token_index.add(session)
+        alert_detector.observe_session(user_id, session.started_at)
+        _publish_session_event(session, "created")
+
+        # 审计日志：会话创建（交给批量写入线程，不使用请求的异步会话）
         _audit_service.log(
-            self.db, AuditEventType.SESSION_CREATE,
+            None, AuditEventType.SESSION_CREATE,
             user_id, username, client_ip, None,
             {"session_id": session.id, "gotty_port": gotty_sess.port}, "success"
         )
 
         asyncio.create_task(self._mark_running(session.id))
-        # 更新 Nginx Gotty 路由（异步，不阻塞会话创建响应）
-        asyncio.create_task(self._update_gotty_routes_async())
+        # 更新 Nginx Gotty 路由（由后台写入任务合并处理，不阻塞会话创建响应）
+        self._update_gotty_routes()
         # 告警检测：会话创建频率
         asyncio.create_task(self._check_session_alert(user_id, client_ip, username))
         return session
@@ -82,44 +131,45 @@ class SessionService:
             logger.warning(f"Session alert check failed: {e}")
 
     async def _mark_running(self, session_id: str):
+        from app.core.database import AsyncSessionLocal
+
         await asyncio.sleep(2)
-        db = next(self._get_db())
-        try:
-            sess = db.query(SessionModel).filter_by(id=session_id).first()
+        async with AsyncSessionLocal() as db:
+            sess = await db.get(SessionModel, session_id)
             if sess and sess.status == "starting":
                 sess.status = "running"
-                db.commit()
-        finally:
-            db.close()
-
-    def _get_db(self):
-        from app.core.database import SessionLocal
-        db = SessionLocal()
-        try:
-            yield db
-        finally:
-            db.close()
+                await db.commit()
+                session_token_index.set_status(sess.random_token, "running")
+                _publish_session_event(sess, "running")
 
     async def close_session(self, session_id: str, user_id: int, is_admin: bool = False):
-        query = self.db.query(SessionModel).filter_by(id=session_id)
+        stmt = select(SessionModel).filter_by(id=session_id)
         if not is_admin:
-            query = query.filter_by(user_id=user_id)
-        session = query.first()
+            stmt = stmt.filter_by(user_id=user_id)
+        session = await self.db.scalar(stmt)
         if not session:
             raise SessionNotFoundError()
 
         await gotty_service.stop_gotty(session.gotty_pid, session.gotty_port)
 
+        was_active = session.status in ("starting", "running")
+        was_closed = session.status == "closed"
+        previous_duration = session.duration_seconds
         now = datetime.utcnow()
         session.status = "closed"
         session.closed_at = now
         if session.started_at:
             session.duration_seconds = int((now - session.started_at).total_seconds())
-        self.db.commit()
+        await self.db.run_sync(
+            lambda db: session_stats.record_close(db, session, previous_duration, was_closed)
+        )
+        await self.db.commit()
+        if was_active:
+            self.on_session_closed(session)
 
         # 审计日志：会话关闭
         _audit_service.log(
-            self.db, AuditEventType.SESSION_CLOSE,
+            None, AuditEventType.SESSION_CLOSE,
             session.user_id, None, None, None,
             {"session_id": session.id, "duration_seconds": session.duration_seconds}, "success"
         )
@@ -132,13 +182,13 @@ class SessionService:
             minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES
         )
         idle = (
-            self.db.query(SessionModel)
-            .filter(
-                SessionModel.status == "running",
-                SessionModel.last_activity_at < threshold,
+            await self.db.scalars(
+                select(SessionModel).where(
+                    SessionModel.status == "running",
+                    SessionModel.last_activity_at < threshold,
+                )
             )
-            .all()
-        )
+        ).all()
         for sess in idle:
             try:
                 await self.close_session(sess.id, sess.user_id, is_admin=True)
@@ -147,89 +197,109 @@ class SessionService:
 
     async def restore_sessions_on_startup(self):
         active = (
-            self.db.query(SessionModel)
-            .filter(SessionModel.status.in_(["starting", "running"]))
-            .all()
-        )
+            await self.db.scalars(
+                select(SessionModel).where(SessionModel.status.in_(["starting", "running"]))
+            )
+        ).all()
+        alive_ports = []
         for sess in active:
             alive = await gotty_service.check_process_alive(sess.gotty_pid)
             if not alive:
                 sess.status = "closed"
                 sess.closed_at = datetime.utcnow()
+                await self.db.run_sync(lambda db: session_stats.record_close(db, sess))
             else:
                 sess.status = "running"
-        self.db.commit()
-
-    async def _check_concurrent_limit(self, user_id: int):
-        perm = self.db.query(UserPermission).filter_by(user_id=user_id).first()
-        max_sessions = perm.max_concurrent_sessions if perm else 3
-        current = (
-            self.db.query(SessionModel)
-            .filter(
-                SessionModel.user_id == user_id,
-                SessionModel.status.in_(["starting", "running"]),
-            )
-            .count()
-        )
-        if current >= max_sessions:
-            raise SessionLimitExceededError(current, max_sessions)
-
-    async def _check_daily_quota(self, user_id: int):
-        perm = self.db.query(UserPermission).filter_by(user_id=user_id).first()
-        quota = perm.daily_session_quota if perm else 10
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        count = (
-            self.db.query(SessionModel)
-            .filter(
-                SessionModel.user_id == user_id,
-                SessionModel.started_at >= today_start,
-            )
-            .count()
-        )
-        if count >= quota:
-            raise DailyQuotaExceededError()
+                alive_ports.append(sess.gotty_port)
+        # 重新登记存活会话占用的端口，避免被再次分配
+        await gotty_service.port_manager.restore(alive_ports)
+        await self.db.commit()
+        await self.db.run_sync(session_token_index.load)
+        await self.db.run_sync(admission_controller.load)
 
-    def get_sessions(
+    @staticmethod
+    def on_session_closed(session: SessionModel) -> None:
+        """
+        会话由活动状态变为 closed 并提交后调用：
+        从 token 索引中移除，释放准入控制的活动名额，并推送会话关闭事件。
+        """
+        session_token_index.remove(session.random_token)
+        admission_controller.release(session.user_id)
+        _publish_session_event(session, "closed")
+
+    async def get_sessions(
         self,
         user_id: Optional[int] = None,
         status: Optional[str] = None,
         limit: int = 50,
         offset: int = 0,
+        cursor: Optional[Tuple[datetime, str]] = None,
     ) -> tuple:
-        query = self.db.query(SessionModel)
+        """
+        分页查询会话，单条 JOIN 查询同时取回用户名。
+        返回 ([(session, username), ...], total, next_cursor)。
+        传入 cursor（上一页最后一行的 (started_at, id)）时按游标翻页，忽略 offset。
+        """
+        conditions = []
         if user_id is not None:
-            query = query.filter_by(user_id=user_id)
+            conditions.append(SessionModel.user_id == user_id)
         if status:
-            query = query.filter_by(status=status)
-        total = query.count()
-        sessions = query.order_by(SessionModel.started_at.desc()).offset(offset).limit(limit).all()
-        return sessions, total
+            conditions.append(SessionModel.status == status)
+        total = await self.db.scalar(select(func.count()).select_from(SessionModel).where(*conditions))
+
+        page = (
+            select(SessionModel, User.username)
+            .outerjoin(User, User.id == SessionModel.user_id)
+            .where(*conditions)
+            .order_by(SessionModel.started_at.desc(), SessionModel.id.desc())
+        )
+        if cursor is not None:
+            page = page.where(keyset_before(SessionModel.started_at, SessionModel.id, cursor))
+        else:
+            page = page.offset(offset)
+        rows = (await self.db.execute(page.limit(limit))).all()
+
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1][0]
+            next_cursor = encode_cursor(last.started_at, last.id)
+        return rows, total, next_cursor
+
+    async def get_session_detail(self, session_id: str, user_id: Optional[int] = None) -> Optional[tuple]:
+        """按 id 查询单个会话及其用户名；传入 user_id 时只返回该用户的会话"""
+        stmt = (
+            select(SessionModel, User.username)
+            .outerjoin(User, User.id == SessionModel.user_id)
+            .where(SessionModel.id == session_id)
+        )
+        if user_id is not None:
+            stmt = stmt.where(SessionModel.user_id == user_id)
+        return (await self.db.execute(stmt)).first()
 
     def _update_gotty_routes(self) -> None:
         """
-        查询所有 running 状态的会话，生成 Nginx Gotty 路由配置并 reload。
-        同步版本，在会话关闭时调用。
+        通知 Nginx 配置写入任务重新生成 Gotty 路由。
+        防抖窗口内的多次会话创建 / 关闭只触发一次写入和 reload。
+        auth_request 路由模式下端口由 token-verify 返回，无需生成 map。
         """
-        try:
-            active = (
-                self.db.query(SessionModel)
-                .filter(SessionModel.status.in_(["starting", "running"]))
-                .all()
-            )
-            conf = _generate_gotty_routes_conf(active)
-            with open(NGINX_GOTTY_ROUTES_CONF, "w") as f:
-                f.write(conf)
-            subprocess.run(
-                ["/usr/bin/sudo", "/usr/sbin/nginx", "-s", "reload"],
-                capture_output=True, text=True, timeout=10, check=False
-            )
-        except Exception as e:
-            logger.warning(f"Failed to update Gotty routes: {e}")
+        if settings.GOTTY_ROUTING_MODE != "map":
+            return
+        nginx_config_writer.notify("gotty_routes")
 
-    async def _update_gotty_routes_async(self) -> None:
-        """异步版本，在会话创建后调用（等待 Gotty 启动后再更新路由）"""
-        await asyncio.sleep(3)
-        self._update_gotty_routes()
+
+def _render_gotty_routes() -> str:
+    """查询所有活动会话并生成路由配置（由写入任务在线程池中调用）"""
+    from app.core.database import SessionLocal
+    db = SessionLocal()
+    try:
+        active = (
+            db.query(SessionModel)
+            .filter(SessionModel.status.in_(["starting", "running"]))
+            .all()
+        )
+        return _generate_gotty_routes_conf(active)
+    finally:
+        db.close()
 
 
 def _generate_gotty_routes_conf(sessions: list) -> str:
@@ -258,3 +328,6 @@ def _generate_gotty_routes_conf(sessions: list) -> str:
     ]
     
     return "\n".join(lines)
+
+
+nginx_config_writer.register("gotty_routes", NGINX_GOTTY_ROUTES_CONF, _render_gotty_routes)
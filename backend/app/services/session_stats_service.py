@@ -0,0 +1,354 @@
+"""
+会话每日汇总
+
+session_daily_stats 按 (started_at 所在 UTC 日期, user_id) 保存会话数、已关闭会话数、
+已关闭会话时长合计和当日最大并发数。会话创建 / 关闭时在同一事务中增量更新
+（按方言使用 SQLite / PostgreSQL 的 ON CONFLICT 或 MySQL 的 ON DUPLICATE KEY 原子累加），
+监控统计只需读取汇总行，不再对 sessions 全表做 GROUP BY。
+
+所有把会话改为 closed 的路径都要调用 record_close：
+close_session、登出、管理员强制下线、启动时清理已退出的 Gotty 会话。
+
+rebuild() 从 sessions 原始行重新计算指定日期范围，用于首次启用时回填（表为空时在启动阶段执行）
+以及管理员手动修复。
+
+max_concurrency 定义为：当天每个会话开始时，该用户尚未关闭的会话数（含本会话）的最大值。
+增量更新时在写入会话行后统计 sessions 中未关闭的会话；回填时按会话起止时间扫描，
+会话在 closed_at 时刻结束（所有关闭路径都会写入 closed_at），两者结果一致。
+早期没有 closed_at 的已关闭会话按 started_at + duration 估算结束时间。
+"""
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.session import Session as SessionModel, SessionDailyStats
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# 回填时每个事务处理的天数，避免长时间持有 SQLite 写锁
+REBUILD_CHUNK_DAYS = 31
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def _as_date(value) -> date:
+    """func.date() 在 SQLite 中返回字符串，在 PostgreSQL / MySQL 中返回 date"""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _upsert(db: Session, values: dict, updates) -> None:
+    """
+    按 (day, user_id) 插入汇总行，已存在时执行 updates(新行) 返回的累加赋值。
+    按连接方言选择 ON CONFLICT（SQLite / PostgreSQL）或 ON DUPLICATE KEY（MySQL）。
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        stmt = (sqlite_insert if dialect == "sqlite" else pg_insert)(SessionDailyStats).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=["day", "user_id"], set_=updates(stmt.excluded))
+    elif dialect == "mysql":
+        stmt = mysql_insert(SessionDailyStats).values(**values)
+        stmt = stmt.on_duplicate_key_update(**updates(stmt.inserted))
+    else:
+        raise NotImplementedError(f"session_daily_stats upsert is not supported on {dialect}")
+    db.execute(stmt)
+
+
+def _greatest(db: Session, a, b):
+    # SQLite 的多参数 max() 为标量函数；PostgreSQL / MySQL 使用 GREATEST
+    if db.get_bind().dialect.name == "sqlite":
+        return func.max(a, b)
+    return func.greatest(a, b)
+
+
+class SessionStatsService:
+    def __init__(self):
+        self.rebuilds = 0
+        self.last_rebuild_ms = 0.0
+
+    # ── 增量更新（调用方负责 commit，与会话行的修改处于同一事务） ───────────────
+
+    def record_start(self, db: Session, session: SessionModel) -> None:
+        """新建会话（已 add 到 db）：当日会话数 +1，并按该用户未关闭的会话数更新最大并发数"""
+        # 先写入会话行：SQLite 中此时已持有写锁，并发创建按提交顺序依次统计
+        db.flush()
+        others = db.execute(
+            select(func.count()).select_from(SessionModel).where(
+                SessionModel.user_id == session.user_id,
+                SessionModel.status != "closed",
+                SessionModel.id != session.id,
+            )
+        ).scalar()
+        _upsert(
+            db,
+            {
+                "day": session.started_at.date(),
+                "user_id": session.user_id,
+                "session_count": 1,
+                "closed_count": 0,
+                "total_duration_seconds": 0,
+                "max_concurrency": others + 1,
+            },
+            lambda new: {
+                "session_count": SessionDailyStats.session_count + 1,
+                "max_concurrency": _greatest(db, SessionDailyStats.max_concurrency, new.max_concurrency),
+            },
+        )
+
+    def record_close(
+        self, db: Session, session: SessionModel, previous_duration: Optional[int] = None, was_closed: bool = False
+    ) -> None:
+        """
+        会话被设为 closed 后调用（此时 duration_seconds 已是最终值）。
+        was_closed 为 True 表示会话原本已关闭、只是重新计算了时长，只累加时长差值。
+        """
+        if session.started_at is None:
+            return
+        duration = session.duration_seconds
+        if was_closed:
+            closed_delta = 0
+            duration_delta = (duration or 0) - (previous_duration or 0)
+            if previous_duration is None and duration is not None:
+                closed_delta = 1
+            elif previous_duration is not None and duration is None:
+                closed_delta = -1
+        else:
+            closed_delta = 1 if duration is not None else 0
+            duration_delta = duration or 0
+        if not closed_delta and not duration_delta:
+            return
+        _upsert(
+            db,
+            {
+                "day": session.started_at.date(),
+                "user_id": session.user_id,
+                "session_count": 0,
+                "closed_count": closed_delta,
+                "total_duration_seconds": duration_delta,
+                "max_concurrency": 0,
+            },
+            lambda new: {
+                "closed_count": SessionDailyStats.closed_count + closed_delta,
+                "total_duration_seconds": SessionDailyStats.total_duration_seconds + duration_delta,
+            },
+        )
+
+    # ── 回填 / 修复 ──────────────────────────────────────────────────────────
+
+    def is_empty(self, db: Session) -> bool:
+        return db.execute(select(SessionDailyStats.day).limit(1)).first() is None
+
+    def backfill_if_empty(self, db: Session) -> int:
+        """汇总表为空而 sessions 有数据时（首次启用）全量回填，返回写入的汇总行数"""
+        if not self.is_empty(db):
+            return 0
+        first, last = db.execute(
+            select(func.min(SessionModel.started_at), func.max(SessionModel.started_at))
+        ).one()
+        if first is None:
+            return 0
+        rows = self.rebuild(db, first.date(), last.date() + timedelta(days=1))
+        logger.info(f"Session daily stats backfilled: {rows} rows")
+        return rows
+
+    def rebuild(self, db: Session, start_day: date, end_day: date) -> int:
+        """从 sessions 重新计算 [start_day, end_day) 的汇总，按 REBUILD_CHUNK_DAYS 分批提交"""
+        started = time.monotonic()
+        total = 0
+        chunk_start = start_day
+        while chunk_start < end_day:
+            chunk_end = min(chunk_start + timedelta(days=REBUILD_CHUNK_DAYS), end_day)
+            total += self._rebuild_chunk(db, chunk_start, chunk_end)
+            chunk_start = chunk_end
+        self.rebuilds += 1
+        self.last_rebuild_ms = (time.monotonic() - started) * 1000
+        return total
+
+    def _rebuild_chunk(self, db: Session, start_day: date, end_day: date) -> int:
+        lo, hi = _day_start(start_day), _day_start(end_day)
+        is_closed = SessionModel.status == "closed"
+        day_col = func.date(SessionModel.started_at)
+        counts = db.execute(
+            select(
+                day_col.label("day"),
+                SessionModel.user_id,
+                func.count(SessionModel.id).label("session_count"),
+                func.sum(case((is_closed & SessionModel.duration_seconds.isnot(None), 1), else_=0)).label("closed_count"),
+                func.coalesce(
+                    func.sum(case((is_closed, SessionModel.duration_seconds), else_=0)), 0
+                ).label("total_duration_seconds"),
+            )
+            .where(SessionModel.started_at >= lo, SessionModel.started_at < hi)
+            .group_by(day_col, SessionModel.user_id)
+        ).all()
+        concurrency = self._max_concurrency(db, lo, hi)
+
+        db.execute(delete(SessionDailyStats).where(
+            SessionDailyStats.day >= start_day, SessionDailyStats.day < end_day
+        ))
+        if counts:
+            db.execute(insert(SessionDailyStats).values([
+                {
+                    "day": _as_date(r.day),
+                    "user_id": r.user_id,
+                    "session_count": r.session_count,
+                    "closed_count": r.closed_count,
+                    "total_duration_seconds": r.total_duration_seconds,
+                    "max_concurrency": concurrency.get((_as_date(r.day), r.user_id), 1),
+                }
+                for r in counts
+            ]))
+        db.commit()
+        return len(counts)
+
+    @staticmethod
+    def _max_concurrency(db: Session, lo: datetime, hi: datetime) -> Dict[Tuple[date, int], int]:
+        """按会话起止时间扫描，返回 {(day, user_id): 当天会话开始时刻的最大未关闭会话数}"""
+        # 在范围开始前一天内启动、或仍处于活动状态 / 在范围内关闭的会话也可能与范围内的会话重叠
+        rows = db.execute(
+            select(
+                SessionModel.user_id, SessionModel.started_at, SessionModel.closed_at,
+                SessionModel.status, SessionModel.duration_seconds,
+            )
+            .where(
+                SessionModel.started_at < hi,
+                or_(
+                    SessionModel.started_at >= lo - timedelta(days=1),
+                    SessionModel.status.in_(["starting", "running"]),
+                    SessionModel.closed_at >= lo,
+                ),
+            )
+            .order_by(SessionModel.user_id, SessionModel.started_at)
+        ).all()
+        by_user: Dict[int, list] = defaultdict(list)
+        for r in rows:
+            if r.started_at is not None:
+                by_user[r.user_id].append(r)
+
+        result: Dict[Tuple[date, int], int] = {}
+        for user_id, sessions in by_user.items():
+            ends: List[datetime] = []   # 小顶堆：已开始会话的结束时间
+            for r in sessions:
+                while ends and ends[0] <= r.started_at:
+                    heapq.heappop(ends)
+                if r.status != "closed":
+                    end = datetime.max
+                else:
+                    end = r.closed_at or r.started_at + timedelta(seconds=r.duration_seconds or 0)
+                heapq.heappush(ends, end)
+                if r.started_at >= lo:
+                    key = (r.started_at.date(), user_id)
+                    result[key] = max(result.get(key, 0), len(ends))
+        return result
+
+    # ── 查询 ──────────────────────────────────────────────────────────────────
+
+    def summarize(self, db: Session, start: datetime) -> dict:
+        """
+        统计 started_at >= start 的会话，结果与直接扫描 sessions 一致：
+        start 所在的不完整的一天从原始行计算，之后的整天读取汇总行。
+        top_users 按会话数降序、用户名升序取前 10（会话数相同时结果确定）。
+        """
+        first_full_day = start.date() + timedelta(days=1)
+        boundary = _day_start(first_full_day)
+
+        daily: Dict[str, int] = defaultdict(int)
+        per_user: Dict[int, int] = defaultdict(int)
+        closed_count = 0
+        total_duration = 0
+
+        # 第一天的剩余部分：原始行
+        partial = db.execute(
+            select(
+                SessionModel.user_id,
+                func.count(SessionModel.id).label("session_count"),
+                func.count(case((SessionModel.status == "closed", SessionModel.duration_seconds))).label("closed_count"),
+                func.coalesce(
+                    func.sum(case((SessionModel.status == "closed", SessionModel.duration_seconds), else_=0)), 0
+                ).label("total_duration_seconds"),
+            )
+            .where(SessionModel.started_at >= start, SessionModel.started_at < boundary)
+            .group_by(SessionModel.user_id)
+        ).all()
+        for r in partial:
+            daily[start.date().isoformat()] += r.session_count
+            per_user[r.user_id] += r.session_count
+            closed_count += r.closed_count
+            total_duration += r.total_duration_seconds
+
+        # 之后的整天：汇总行（按天 / 按用户在 SQL 中合计，返回行数与天数、用户数同级）
+        after = SessionDailyStats.day >= first_full_day
+        for day, count in db.execute(
+            select(SessionDailyStats.day, func.sum(SessionDailyStats.session_count))
+            .where(after)
+            .group_by(SessionDailyStats.day)
+        ).all():
+            if count:
+                daily[day.isoformat()] += count
+        for user_id, count in db.execute(
+            select(SessionDailyStats.user_id, func.sum(SessionDailyStats.session_count))
+            .where(after)
+            .group_by(SessionDailyStats.user_id)
+        ).all():
+            per_user[user_id] += count
+        closed, duration = db.execute(
+            select(
+                func.coalesce(func.sum(SessionDailyStats.closed_count), 0),
+                func.coalesce(func.sum(SessionDailyStats.total_duration_seconds), 0),
+            ).where(after)
+        ).one()
+        closed_count += closed
+        total_duration += duration
+
+        usernames = dict(db.execute(
+            select(User.id, User.username).where(User.id.in_([uid for uid, n in per_user.items() if n]))
+        ).all()) if per_user else {}
+        by_username: Dict[str, int] = defaultdict(int)
+        for user_id, count in per_user.items():
+            # 与原先 JOIN users 一致：用户已不存在的会话不计入排行
+            if count and user_id in usernames:
+                by_username[usernames[user_id]] += count
+        top_users = sorted(by_username.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+        return {
+            "total_sessions": sum(daily.values()),
+            "average_session_duration_seconds": int(total_duration / closed_count) if closed_count else 0,
+            "daily_sessions": [{"date": d, "count": daily[d]} for d in sorted(daily)],
+            "top_users": [{"username": name, "session_count": count} for name, count in top_users],
+        }
+
+    def daily_rows(self, db: Session, start_day: date, end_day: date) -> list:
+        """[start_day, end_day) 的每日每用户汇总行（日期、用户名升序），供导出日报"""
+        return db.execute(
+            select(
+                SessionDailyStats.day, User.username, SessionDailyStats.session_count,
+                SessionDailyStats.closed_count, SessionDailyStats.total_duration_seconds,
+                SessionDailyStats.max_concurrency,
+            )
+            .join(User, User.id == SessionDailyStats.user_id)
+            .where(SessionDailyStats.day >= start_day, SessionDailyStats.day < end_day)
+            .order_by(SessionDailyStats.day, User.username)
+        ).all()
+
+    def get_stats(self, db: Session) -> dict:
+        rows = db.execute(select(func.count()).select_from(SessionDailyStats)).scalar()
+        return {
+            "rows": rows,
+            "rebuilds": self.rebuilds,
+            "last_rebuild_ms": round(self.last_rebuild_ms, 2),
+        }
+
+
+# 全局单例
+session_stats = SessionStatsService()
@@ -0,0 +1,83 @@
+"""
+活动会话 Token 内存索引
+
+Nginx auth_request 对每个终端 HTTP 请求和 WebSocket 升级都会调用 token-verify，
+这里按 random_token 维护活动会话（starting / running）的内存索引，
+命中时无需查询数据库。索引由 SessionService 的会话生命周期代码维护。
+索引只反映本进程创建 / 关闭的会话，后端以单个 worker 运行（见 app.core.instance_lock）。
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.session import Session as SessionModel
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("starting", "running")
+
+
+@dataclass
+class SessionTokenEntry:
+    session_id: str
+    user_id: int
+    status: str
+    port: int
+
+
+class SessionTokenIndex:
+    def __init__(self):
+        self._entries: Dict[str, SessionTokenEntry] = {}
+
+    def load(self, db: Session) -> None:
+        """启动时从数据库加载所有活动会话"""
+        rows = (
+            db.query(
+                SessionModel.id,
+                SessionModel.user_id,
+                SessionModel.status,
+                SessionModel.gotty_port,
+                SessionModel.random_token,
+            )
+            .filter(SessionModel.status.in_(ACTIVE_STATUSES))
+            .all()
+        )
+        self._entries = {
+            r.random_token: SessionTokenEntry(
+                session_id=r.id, user_id=r.user_id, status=r.status, port=r.gotty_port
+            )
+            for r in rows
+        }
+        logger.info(f"Session token index initialized with {len(self._entries)} entries")
+
+    def add(self, session: SessionModel) -> None:
+        self._entries[session.random_token] = SessionTokenEntry(
+            session_id=session.id,
+            user_id=session.user_id,
+            status=session.status,
+            port=session.gotty_port,
+        )
+
+    def set_status(self, token: str, status: str) -> None:
+        if status not in ACTIVE_STATUSES:
+            self.remove(token)
+            return
+        entry = self._entries.get(token)
+        if entry:
+            entry.status = status
+
+    def remove(self, token: Optional[str]) -> None:
+        if token:
+            self._entries.pop(token, None)
+
+    def get(self, token: str) -> Optional[SessionTokenEntry]:
+        return self._entries.get(token)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 全局单例
+session_token_index = SessionTokenIndex()
@@ -2,21 +2,31 @@
 JWT Refresh Token 服务
 
 管理 Refresh Token 的生成、验证、轮换和黑名单。
-内存缓存黑名单 jti，减少数据库查询。
+内存缓存黑名单 jti，减少数据库查询。其他 worker 拉黑的 jti 不会写入本进程内存，
+get_current_user 内存未命中时按 TOKEN_BLACKLIST_POLL_SECONDS 间隔调用 sync_blacklist 拉取新增记录，
+登出在其他 worker 上最多延迟一个轮询间隔生效。
+请求处理中调用的方法使用 AsyncSession；启动加载与定期清理在后台使用同步 Session。
 """
 import hashlib
 import logging
 import secrets
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Set
 
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.config import settings
+from app.core.security import invalidate_token_cache
 from app.models.token import BlacklistedToken, RefreshToken
 
 logger = logging.getLogger(__name__)
 
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+# 增量拉取时向前多取的时间，覆盖 worker 间时钟偏差和拉取时尚未提交的写入
+BLACKLIST_SYNC_SLACK = timedelta(seconds=60)
 
 
 def _sha256(value: str) -> str:
@@ -24,10 +34,15 @@ def _sha256(value: str) -> str:
 
 
 class TokenService:
-    def __init__(self):
+    def __init__(self, poll_seconds: float):
         # 内存黑名单缓存（jti set）
         self._blacklist: Set[str] = set()
         self._initialized = False
+        self.poll_seconds = poll_seconds
+        # 上次拉取的时刻（单调时钟）与数据库时间基准（blacklisted_at）
+        self._synced_at = 0.0
+        self._synced_until = datetime.min
+        self.syncs = 0
 
     def init_blacklist_cache(self, db: Session) -> None:
         """启动时从数据库加载所有未过期的 jti 到内存"""
@@ -36,10 +51,47 @@ class TokenService:
             BlacklistedToken.expires_at > now
         ).all()
         self._blacklist = {r.token_jti for r in rows}
+        self._synced_at = time.monotonic()
+        self._synced_until = now
         self._initialized = True
         logger.info(f"Blacklist cache initialized with {len(self._blacklist)} entries")
 
-    def create_refresh_token(self, db: Session, user_id: int) -> str:
+    def needs_sync(self) -> bool:
+        """距上次拉取已超过轮询间隔（poll_seconds 为 0 时总是需要）"""
+        return time.monotonic() - self._synced_at >= self.poll_seconds
+
+    async def sync_blacklist(self, db: AsyncSession, jti: Optional[str] = None) -> bool:
+        """
+        拉取上次拉取之后（含 BLACKLIST_SYNC_SLACK 重叠）新增的黑名单记录并加入内存，
+        返回 jti 是否已被拉黑。
+        """
+        # 先更新时间戳：同一轮询间隔内的并发请求不会重复拉取
+        self._synced_at = time.monotonic()
+        since = self._synced_until - BLACKLIST_SYNC_SLACK
+        self._synced_until = datetime.utcnow()
+        rows = await db.scalars(
+            select(BlacklistedToken.token_jti).where(BlacklistedToken.blacklisted_at >= since)
+        )
+        self._blacklist.update(rows.all())
+        self.syncs += 1
+        return jti is not None and jti in self._blacklist
+
+    @property
+    def initialized(self) -> bool:
+        """内存黑名单是否已从数据库加载（加载后所有拉黑操作都会同步写入内存）"""
+        return self._initialized
+
+    def blacklist_size(self) -> int:
+        return len(self._blacklist)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._blacklist),
+            "poll_seconds": self.poll_seconds,
+            "syncs": self.syncs,
+        }
+
+    async def create_refresh_token(self, db: AsyncSession, user_id: int) -> str:
         """生成 Refresh Token，存储哈希，返回明文"""
         plaintext = secrets.token_urlsafe(32)
         token_hash = _sha256(plaintext)
@@ -50,55 +102,64 @@ class TokenService:
             expires_at=expires_at,
             revoked=False,
         ))
-        db.commit()
+        await db.commit()
         return plaintext
 
-    def verify_refresh_token(self, db: Session, token_plaintext: str) -> Optional[int]:
+    @staticmethod
+    async def _find_refresh_token(db: AsyncSession, token_plaintext: str) -> Optional[RefreshToken]:
+        result = await db.execute(
+            select(RefreshToken).filter_by(token_hash=_sha256(token_plaintext), revoked=False)
+        )
+        return result.scalars().first()
+
+    async def verify_refresh_token(self, db: AsyncSession, token_plaintext: str) -> Optional[int]:
         """验证 Refresh Token，返回 user_id 或 None"""
-        token_hash = _sha256(token_plaintext)
-        rt = db.query(RefreshToken).filter_by(token_hash=token_hash, revoked=False).first()
+        rt = await self._find_refresh_token(db, token_plaintext)
         if not rt:
             return None
         if rt.expires_at < datetime.utcnow():
             return None
         return rt.user_id
 
-    def rotate_refresh_token(self, db: Session, old_token_plaintext: str) -> Optional[str]:
+    async def rotate_refresh_token(self, db: AsyncSession, old_token_plaintext: str) -> Optional[str]:
         """撤销旧 token，创建新 token，返回新明文；旧 token 无效时返回 None"""
-        token_hash = _sha256(old_token_plaintext)
-        rt = db.query(RefreshToken).filter_by(token_hash=token_hash, revoked=False).first()
+        rt = await self._find_refresh_token(db, old_token_plaintext)
         if not rt or rt.expires_at < datetime.utcnow():
             return None
         user_id = rt.user_id
         rt.revoked = True
-        db.commit()
-        return self.create_refresh_token(db, user_id)
+        await db.commit()
+        return await self.create_refresh_token(db, user_id)
 
-    def revoke_all_user_tokens(self, db: Session, user_id: int) -> None:
+    async def revoke_all_user_tokens(self, db: AsyncSession, user_id: int) -> None:
         """撤销用户所有 Refresh Token"""
-        db.query(RefreshToken).filter_by(user_id=user_id, revoked=False).update({"revoked": True})
-        db.commit()
+        await db.execute(
+            update(RefreshToken).filter_by(user_id=user_id, revoked=False).values(revoked=True)
+        )
+        await db.commit()
 
-    def blacklist_access_token(self, db: Session, jti: str, user_id: int, expires_at: datetime) -> None:
+    async def blacklist_access_token(self, db: AsyncSession, jti: str, user_id: int, expires_at: datetime) -> None:
         """将 Access Token jti 加入黑名单（数据库 + 内存缓存）"""
-        existing = db.query(BlacklistedToken).filter_by(token_jti=jti).first()
-        if not existing:
+        existing = await db.scalar(select(BlacklistedToken.id).filter_by(token_jti=jti))
+        if existing is None:
             db.add(BlacklistedToken(
                 token_jti=jti,
                 user_id=user_id,
                 expires_at=expires_at,
                 blacklisted_at=datetime.utcnow(),
             ))
-            db.commit()
+            await db.commit()
         self._blacklist.add(jti)
+        # 同步淘汰 JWT 解码缓存中的该 token
+        invalidate_token_cache(jti)
 
-    def is_blacklisted(self, jti: str, db: Optional[Session] = None) -> bool:
-        """先查内存缓存，未命中再查数据库"""
+    async def is_blacklisted(self, jti: str, db: Optional[AsyncSession] = None) -> bool:
+        """先查内存缓存，未命中再查数据库（不传 db 时只查内存）"""
         if jti in self._blacklist:
             return True
         if db is not None:
-            row = db.query(BlacklistedToken).filter_by(token_jti=jti).first()
-            if row:
+            row = await db.scalar(select(BlacklistedToken.id).filter_by(token_jti=jti))
+            if row is not None:
                 self._blacklist.add(jti)
                 return True
         return False
@@ -115,4 +176,4 @@ class TokenService:
 
 
 # 全局单例
-token_service = TokenService()
+token_service = TokenService(settings.TOKEN_BLACKLIST_POLL_SECONDS)
@@ -0,0 +1,83 @@
+"""
+用户身份短期缓存
+
+get_current_user 每个认证请求都要按 id 查询 User；前端每个标签页每隔几秒轮询一次，
+这里缓存用户身份（id / username / role / status 等）若干秒，
+用户信息变更时（登录同步、IAM 同步、组角色变更、强制下线）主动失效。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.models.user import User
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    id: int
+    username: str
+    role: str
+    status: str
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            status=user.status,
+            email=user.email,
+            full_name=user.full_name,
+        )
+
+
+class UserPrincipalCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[int, Tuple[UserPrincipal, float]] = {}
+        # 失效操作也会在线程池中的同步处理函数里调用
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[UserPrincipal]:
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None or item[1] <= time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[0]
+
+    def put(self, principal: UserPrincipal) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# 全局单例
+user_principal_cache = UserPrincipalCache(settings.USER_CACHE_TTL_SECONDS)
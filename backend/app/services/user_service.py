@@ -1,8 +1,9 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import boto3
 from botocore.exceptions import ClientError
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 
 from app.config import settings
@@ -12,6 +13,8 @@ from app.models.permission import UserPermission
 from app.models.preference import UserPreference
 from app.models.session import Session as SessionModel
 from app.models.user import User
+from app.services.admission_service import admission_controller
+from app.services.user_principal_cache import user_principal_cache
 
 
 def _create_default_permissions(db: Session, user_id: int):
@@ -89,6 +92,7 @@ def create_or_update_user(db: Session, user_info: dict) -> User:
     _update_user_groups(db, user, groups)
     db.commit()
     db.refresh(user)
+    user_principal_cache.invalidate(user.id)
     return user
 
 
@@ -115,6 +119,7 @@ class UserService:
                 setattr(perm, k, v)
         perm.updated_at = datetime.utcnow()
         self.db.commit()
+        admission_controller.invalidate_limits(user_id)
 
     def update_preferences(self, user_id: int, data: dict):
         pref = self.db.query(UserPreference).filter_by(user_id=user_id).first()
@@ -147,6 +152,28 @@ class UserService:
         
         return query.count()
 
+    def get_session_counts(self, user_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+        """
+        一次分组聚合查询多个用户的会话数量。
+
+        Returns:
+            {user_id: (今日会话数, 总会话数)}，没有会话的用户不在结果中
+        """
+        if not user_ids:
+            return {}
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = (
+            self.db.query(
+                SessionModel.user_id,
+                func.sum(case((SessionModel.started_at >= today_start, 1), else_=0)),
+                func.count(SessionModel.id),
+            )
+            .filter(SessionModel.user_id.in_(user_ids))
+            .group_by(SessionModel.user_id)
+            .all()
+        )
+        return {user_id: (int(today or 0), total) for user_id, today, total in rows}
+
     def sync_from_iam(self) -> dict:
         if not settings.IAM_IDENTITY_STORE_ID:
             return {"synced_users": 0, "new_users": 0, "updated_users": 0, "synced_groups": 0}
@@ -215,6 +242,8 @@ class UserService:
                 stats["synced_users"] += 1
 
             self.db.commit()
+            # 批量更新了用户状态和角色，整体失效身份缓存
+            user_principal_cache.clear()
             return stats
         except ClientError as e:
             raise IAMSyncError(str(e))
@@ -0,0 +1,40 @@
+"""
+游标（keyset）分页工具
+
+游标编码最后一行的 (时间, id)，下一页从该位置之后继续，
+与 OFFSET 不同，翻到任意深度的代价都相同。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(ts: Optional[datetime], row_id: Any) -> str:
+    raw = json.dumps([ts.isoformat() if ts else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    """解析游标，格式非法时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(ts), row_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_before(ts_column, id_column, cursor: Tuple[datetime, Any]):
+    """
+    倒序翻页条件：(ts, id) < cursor。
+    额外的 ts <= cursor_ts 让 SQLite 可以直接在时间索引上定位起点，
+    仅写 OR 形式时深度翻页会退化为从头扫描索引。
+    """
+    cursor_ts, cursor_id = cursor
+    return and_(
+        ts_column <= cursor_ts,
+        or_(ts_column < cursor_ts, id_column < cursor_id),
+    )
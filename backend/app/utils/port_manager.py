@@ -1,35 +1,109 @@
-import asyncio
 import socket
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Tuple
 
 from app.core.exceptions import NoAvailablePortError
 
 
+class PortState:
+    FREE = "free"
+    ALLOCATED = "allocated"      # 已分配给 Gotty 进程，尚未绑定会话（启动中 / 预热池空闲）
+    IN_USE = "in_use"            # 已绑定到会话
+    QUARANTINED = "quarantined"  # 刚释放，隔离期内不再分配（等待 socket 彻底关闭）
+
+
 class PortManager:
-    def __init__(self, primary_port: int, start_port: int, end_port: int):
+    """
+    空闲链表端口分配器。
+
+    空闲端口保存在 FIFO 队列中，分配时 O(1) 弹出队首，只对选中的端口做一次
+    bind 探测；释放的端口先进入隔离队列，隔离期满后回到空闲队列队尾。
+    所有操作均无 await，在单个事件循环内天然原子，无需加锁。
+    """
+
+    def __init__(
+        self,
+        primary_port: int,
+        start_port: int,
+        end_port: int,
+        quarantine_seconds: float = 0.0,
+    ):
         self.primary_port = primary_port
         self.start_port = start_port
         self.end_port = end_port
-        self.allocated_ports: set = set()
-        self._lock = asyncio.Lock()
+        self.quarantine_seconds = quarantine_seconds
 
-    async def allocate_port(self) -> int:
-        async with self._lock:
-            if self.primary_port not in self.allocated_ports and self._is_port_available(
-                self.primary_port
-            ):
-                self.allocated_ports.add(self.primary_port)
-                return self.primary_port
+        self._state: Dict[int, str] = {}
+        self._free: Deque[int] = deque()
+        self._quarantine: Deque[Tuple[int, float]] = deque()
+
+        for port in self._all_ports():
+            self._state[port] = PortState.FREE
+            self._free.append(port)
 
-            for port in range(self.start_port, self.end_port + 1):
-                if port not in self.allocated_ports and self._is_port_available(port):
-                    self.allocated_ports.add(port)
-                    return port
+    async def allocate_port(self) -> int:
+        self._drain_quarantine()
+        while self._free:
+            port = self._free.popleft()
+            # 惰性删除：reserve_port 等操作不会从队列中移除端口，这里跳过
+            if self._state.get(port) != PortState.FREE:
+                continue
+            if self._is_port_available(port):
+                self._state[port] = PortState.ALLOCATED
+                return port
+            # 被外部进程占用，隔离后稍后再试
+            self._quarantine_port(port)
+        raise NoAvailablePortError()
 
-            raise NoAvailablePortError()
+    async def mark_in_use(self, port: int):
+        if port in self._state:
+            self._state[port] = PortState.IN_USE
 
     async def release_port(self, port: int):
-        async with self._lock:
-            self.allocated_ports.discard(port)
+        if self._state.get(port) in (PortState.ALLOCATED, PortState.IN_USE):
+            self._quarantine_port(port)
+
+    async def reserve_port(self, port: int):
+        """将端口标记为使用中"""
+        if port in self._state:
+            self._state[port] = PortState.IN_USE
+
+    async def restore(self, ports: Iterable[int]):
+        """启动恢复：批量登记仍存活会话占用的端口"""
+        for port in ports:
+            await self.reserve_port(port)
+
+    def get_stats(self) -> dict:
+        self._drain_quarantine()
+        counts = {
+            PortState.FREE: 0,
+            PortState.ALLOCATED: 0,
+            PortState.IN_USE: 0,
+            PortState.QUARANTINED: 0,
+        }
+        for state in self._state.values():
+            counts[state] += 1
+        counts["total"] = len(self._state)
+        return counts
+
+    def _all_ports(self) -> Iterable[int]:
+        yield self.primary_port
+        for port in range(self.start_port, self.end_port + 1):
+            if port != self.primary_port:
+                yield port
+
+    def _quarantine_port(self, port: int):
+        self._state[port] = PortState.QUARANTINED
+        self._quarantine.append((port, time.monotonic() + self.quarantine_seconds))
+
+    def _drain_quarantine(self):
+        now = time.monotonic()
+        while self._quarantine and self._quarantine[0][1] <= now:
+            port, _ = self._quarantine.popleft()
+            if self._state.get(port) == PortState.QUARANTINED:
+                self._state[port] = PortState.FREE
+                self._free.append(port)
 
     def _is_port_available(self, port: int) -> bool:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -0,0 +1,17 @@
+"""
+流式导出工具
+
+导出接口以生成器逐块产出内容，配合 StreamingResponse 使用，内存占用与导出行数无关。
+"""
+import zlib
+from typing import Iterator
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """把字节块流压缩为 gzip 格式的字节块流"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
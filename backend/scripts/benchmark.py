@@ -0,0 +1,1762 @@
+"""
+KiroCLI Platform - 热点路径性能基准
+
+执行方式：python scripts/benchmark.py <场景> [参数]
+
+场景：
+  token-verify   token-verify 会话查找：全表扫描 / random_token 索引 / 内存索引
+  admission      同一用户并发创建会话，统计接受 / 拒绝数与耗时
+  audit-write    多线程并发写审计日志：逐条 commit / 批量写入线程，对比吞吐并核对落库条数
+  audit-export   导出大量审计日志，对比旧实现（ORM 全量加载）与流式导出的内存增长
+  audit-page     审计日志深度翻页：OFFSET + 每页 COUNT / 游标 + 缓存总数
+  audit-retention  归档早于保留期的审计日志，核对归档前后分页 / 总数 / 导出结果一致
+  audit-search   审计日志全文检索：LIKE 扫描 / FTS5 trigram 索引，核对结果一致
+  alert-engine   回放登录 / 会话事件流：逐事件 COUNT 查询 / 内存滑动窗口，核对每个事件的告警判定一致
+  alert-outbox   发送告警通知：事件循环中逐条阻塞发送 / outbox 投递线程，对比事件循环停顿与吞吐，核对重试后全部送达
+  realtime       并发请求 /monitoring/realtime：请求内 cpu_percent(0.5) / 后台采样，对比响应时间与事件循环停顿
+  metrics-rollup 模拟数天的每分钟指标：逐分钟写入并增量汇总，核对小时 / 天汇总与原始观测一致，对比查询耗时
+  session-export 导出大量会话：旧实现（全量加载 + StringIO）/ 流式导出，对比内存增长并核对内容一致
+  session-stats  随机创建 / 关闭会话并增量维护每日汇总，对比监控统计与直接扫描 sessions 的耗时及重建耗时
+  events         事件总线扇出：多个 SSE 订阅者按用户过滤接收会话事件，核对投递数，慢速客户端收到 resync，连接数上限生效
+  prometheus     请求耗时中间件 / 连接池计时的单次开销，以及 /metrics 输出耗时
+  config-cache   读取告警规则 / 系统配置 / 白名单：每次查库 / 版本化缓存，并模拟另一 worker 的修改是否按时生效
+  async-db       会话列表（查库）与 token-verify 混合并发负载：处理函数内同步查询 / 异步会话，对比两类请求的吞吐与延迟
+  async-db-write 并发写入：Refresh Token 轮换（异步会话）与管理端 / 偏好设置 / 告警写入混合，对比事件循环停顿，出现 database is locked 时失败
+
+基准使用临时 SQLite 数据库，不会读写 .env 中配置的数据库。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+_TMP_DIR = tempfile.mkdtemp(prefix="kirocli-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'bench.db')}"
+
+# 模拟 Gotty：输出监听地址后保持运行，不依赖真实 gotty / kiro-cli
+_FAKE_GOTTY = os.path.join(_TMP_DIR, "fake-gotty")
+with open(_FAKE_GOTTY, "w") as _f:
+    _f.write(
+        "#!/bin/sh\n"
+        "while [ \"$1\" != \"--port\" ]; do shift; done\n"
+        "echo \"HTTP server is listening at: http://127.0.0.1:$2/bench$2/\"\n"
+        "exec sleep 600\n"
+    )
+os.chmod(_FAKE_GOTTY, 0o755)
+os.environ["GOTTY_PATH"] = _FAKE_GOTTY
+os.environ["GOTTY_CERT_PATH"] = ""
+os.environ["GOTTY_KEY_PATH"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.database import (  # noqa: E402
+    AsyncSessionLocal,
+    SessionLocal,
+    async_engine,
+    engine,
+    init_db,
+)
+
+
+def _random_token(length: int = 16) -> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def _measure(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+def _print_result(label: str, result: dict) -> None:
+    print(
+        f"  {label:<28} mean={result['mean_us']:9.1f}us  "
+        f"p50={result['p50_us']:9.1f}us  p99={result['p99_us']:9.1f}us"
+    )
+
+
+def bench_token_verify(args) -> None:
+    from app.api.v1.sessions import _lookup_session_token
+    from app.core.security import create_access_token, decode_access_token
+    from app.models.session import Session as SessionModel
+    from app.models.user import User
+    from app.services.session_token_index import session_token_index
+
+    init_db()
+    db = SessionLocal()
+    db.add(User(id=1, username="bench", email="bench@example.com"))
+    tokens = []
+    rows = []
+    for i in range(args.sessions):
+        token = _random_token()
+        tokens.append(token)
+        rows.append({
+            "id": f"sess_{i:016d}",
+            "user_id": 1,
+            "gotty_pid": 1,
+            "gotty_port": 7861 + i % 100,
+            "gotty_url": "",
+            "random_token": token,
+            # 历史会话大多已关闭，只有少量活动会话
+            "status": "running" if i >= args.sessions - args.active else "closed",
+        })
+    db.bulk_insert_mappings(SessionModel, rows)
+    db.commit()
+
+    active_tokens = tokens[-args.active:]
+    jwt = create_access_token({"sub": "1"})
+
+    def verify_before():
+        decode_access_token(jwt)
+        db.query(SessionModel).filter_by(random_token=random.choice(active_tokens)).first()
+
+    loop = asyncio.new_event_loop()
+
+    def verify_db():
+        decode_access_token(jwt)
+        loop.run_until_complete(_lookup_session_token(random.choice(active_tokens)))
+
+    print(f"token-verify: {args.sessions} sessions ({args.active} active), {args.iterations} iterations")
+
+    db.execute(text("DROP INDEX IF EXISTS idx_sessions_random_token"))
+    db.commit()
+    _print_result("before (no index, ORM)", _measure(verify_before, args.iterations))
+
+    db.execute(text("CREATE INDEX idx_sessions_random_token ON sessions (random_token)"))
+    db.commit()
+    _print_result("after (DB index fallback)", _measure(verify_db, args.iterations))
+
+    session_token_index.load(db)
+    _print_result("after (memory index)", _measure(verify_db, args.iterations))
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    db.close()
+
+
+def bench_admission(args) -> None:
+    from app.core.exceptions import DailyQuotaExceededError, SessionLimitExceededError
+    from app.models.permission import UserPermission
+    from app.models.user import User
+    from app.services.session_service import SessionService
+
+    init_db()
+    db = SessionLocal()
+    db.add(User(id=1, username="bench", email="bench@example.com"))
+    db.add(UserPermission(
+        user_id=1,
+        max_concurrent_sessions=args.max_concurrent,
+        daily_session_quota=args.daily_quota,
+    ))
+    db.commit()
+    db.close()
+
+    async def start_one():
+        async with AsyncSessionLocal() as session_db:
+            try:
+                sess = await SessionService(session_db).create_session(1, "127.0.0.1", "bench")
+                return sess.id
+            except (SessionLimitExceededError, DailyQuotaExceededError) as e:
+                return e.code
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            await SessionService(db).restore_sessions_on_startup()
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(start_one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        accepted = [r for r in results if r.startswith("sess_")]
+        rejected = len(results) - len(accepted)
+        print(
+            f"admission: {args.requests} concurrent starts, max_concurrent={args.max_concurrent}: "
+            f"accepted={len(accepted)} rejected={rejected} in {elapsed * 1000:.0f} ms"
+        )
+
+        async with AsyncSessionLocal() as db:
+            service = SessionService(db)
+            for session_id in accepted:
+                await service.close_session(session_id, 1, is_admin=True)
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def bench_audit_write(args) -> None:
+    import threading
+
+    from app.models.audit_log import AuditLog
+    from app.services.audit_service import AuditEventType, AuditService
+    from app.services.audit_writer import audit_writer
+
+    init_db()
+    service = AuditService()
+    total = args.threads * args.events
+
+    def worker(thread_no: int):
+        # 与 BackgroundTasks 一致：每个线程使用自己的请求级会话
+        db = SessionLocal()
+        try:
+            for i in range(args.events):
+                service.log(
+                    db, AuditEventType.TOKEN_VERIFY_FAIL, None, None, f"10.0.{thread_no}.{i % 250}",
+                    "bench", {"reason": "token_not_found"}, "failure",
+                )
+        finally:
+            db.close()
+
+    def run(label: str) -> None:
+        db = SessionLocal()
+        db.query(AuditLog).delete()
+        db.commit()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        audit_writer.flush()
+        elapsed = time.perf_counter() - start
+        written = db.query(AuditLog).count()
+        db.close()
+        print(f"  {label:<28} {elapsed * 1000:9.1f}ms  {total / elapsed:9.0f} events/s  written={written}/{total}")
+        if written != total:
+            raise SystemExit(f"FAIL: {label} wrote {written}/{total} events")
+
+    print(f"audit-write: {args.threads} threads x {args.events} events")
+    run("before (commit per event)")
+    audit_writer.start()
+    try:
+        run("after (batched writer)")
+    finally:
+        asyncio.run(audit_writer.stop())
+    print(f"  writer stats: {audit_writer.get_stats()}")
+
+
+def bench_audit_export(args) -> None:
+    import csv
+    import io
+    import zlib
+    from datetime import datetime, timedelta
+
+    import psutil
+
+    from app.models.audit_log import AuditLog
+    from app.services.audit_service import AuditService
+    from app.utils.streaming import gzip_chunks
+
+    init_db()
+    base = datetime.utcnow()
+    print(f"audit-export: inserting {args.rows} audit log rows...")
+    with engine.begin() as conn:
+        for start in range(0, args.rows, 50000):
+            conn.execute(AuditLog.__table__.insert(), [
+                {
+                    "event_type": "TOKEN_VERIFY_FAIL",
+                    "user_id": i % 500,
+                    "username": f"user{i % 500}",
+                    "client_ip": f"10.{i % 250}.{i % 200}.{i % 100}",
+                    "user_agent": "Mozilla/5.0 (X11; Linux x86_64) bench",
+                    "event_time": base - timedelta(seconds=i),
+                    "event_detail": '{"reason": "token_not_found"}',
+                    "result": "failure",
+                }
+                for i in range(start, min(start + 50000, args.rows))
+            ])
+
+    process = psutil.Process()
+    service = AuditService()
+
+    def export(label: str, chunks) -> None:
+        rss_start = process.memory_info().rss
+        rss_peak = rss_start
+        size = lines = 0
+        start = time.perf_counter()
+        for n, chunk in enumerate(chunks):
+            size += len(chunk)
+            if args.check_rows:
+                lines += chunk.count(b"\n")
+            if n % 16 == 0:
+                rss_peak = max(rss_peak, process.memory_info().rss)
+        elapsed = time.perf_counter() - start
+        rss_peak = max(rss_peak, process.memory_info().rss)
+        print(
+            f"  {label:<34} {elapsed:7.1f}s  {size / 2**20:8.1f} MiB out  "
+            f"RSS +{(rss_peak - rss_start) / 2**20:7.1f} MiB"
+            + (f"  lines={lines}" if args.check_rows else "")
+        )
+
+    def export_before():
+        # 旧实现：先以 ORM 对象加载至多 100000 行，再逐行写 CSV
+        db = SessionLocal()
+        logs, _, _ = service.query_logs(db, {}, limit=100000, offset=0)
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for log in logs:
+            writer.writerow([
+                log.id, log.event_type, log.user_id, log.username, log.client_ip, log.user_agent,
+                log.event_time.isoformat(), log.event_detail or "", log.result,
+            ])
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate(0)
+        db.close()
+
+    def export_gzip():
+        # 与 export(compress=True) 相同的压缩流，解压后计数以核对内容
+        decompressor = zlib.decompressobj(31)
+        for chunk in gzip_chunks(service.iter_export({}, "csv")):
+            yield decompressor.decompress(chunk)
+
+    export("after csv", service.iter_export({}, "csv"))
+    export("after ndjson", service.iter_export({}, "ndjson"))
+    export("after csv.gz (decompressed)", export_gzip())
+    # 旧实现放在最后，避免其释放的内存被后续导出复用而掩盖增长
+    export("before (ORM, capped at 100000)", export_before())
+
+
+def _insert_audit_rows(rows: int) -> None:
+    from datetime import datetime, timedelta
+
+    from app.models.audit_log import AuditLog
+
+    base = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, rows, 50000):
+            conn.execute(AuditLog.__table__.insert(), [
+                {
+                    "event_type": ("LOGIN", "LOGOUT", "SESSION_CREATE", "TOKEN_VERIFY_FAIL")[i % 4],
+                    "user_id": i % 500,
+                    "username": f"user{i % 500}",
+                    "client_ip": f"10.{i % 250}.{i % 200}.{i % 100}",
+                    "user_agent": "Mozilla/5.0 (X11; Linux x86_64) bench",
+                    # 每两行共用一个 event_time，覆盖游标中 id 决胜的情况
+                    "event_time": base - timedelta(seconds=i // 2),
+                    "event_detail": '{"reason": "token_not_found"}',
+                    "result": "failure",
+                }
+                for i in range(start, min(start + 50000, rows))
+            ])
+
+
+def bench_audit_page(args) -> None:
+    from app.models.audit_log import AuditLog
+    from app.services.audit_service import AuditService, _apply_filters
+
+    init_db()
+    print(f"audit-page: inserting {args.rows} audit log rows...")
+    _insert_audit_rows(args.rows)
+    db = SessionLocal()
+    service = AuditService()
+    depth = int(args.rows * args.depth)
+    print(f"audit-page: page size {args.limit}, depth {depth} rows")
+
+    for label, filters in [("no filter", {}), ("event_type", {"event_type": "LOGIN"}), ("user_id", {"user_id": 7})]:
+        query = _apply_filters(db.query(AuditLog), filters)
+        ordered = query.order_by(AuditLog.event_time.desc(), AuditLog.id.desc())
+        # 深度位置按过滤后的行数折算
+        offset = min(depth, max(query.count() - args.limit, 0))
+        anchor = ordered.offset(offset - 1).first() if offset else None
+        cursor = (anchor.event_time, anchor.id) if anchor else None
+
+        def page_before():
+            query.count()
+            ordered.offset(offset).limit(args.limit).all()
+
+        def page_after():
+            service.query_logs(db, filters, limit=args.limit, cursor=cursor)
+
+        before = ordered.offset(offset).limit(args.limit).all()
+        after, _, _ = service.query_logs(db, filters, limit=args.limit, cursor=cursor)
+        if [r.id for r in before] != [r.id for r in after]:
+            raise SystemExit(f"FAIL: cursor page differs from offset page ({label})")
+        _print_result(f"{label}: offset + COUNT", _measure(page_before, args.iterations))
+        _print_result(f"{label}: cursor + cached", _measure(page_after, args.iterations))
+    db.close()
+
+
+def bench_audit_retention(args) -> None:
+    import hashlib
+    from datetime import datetime, timedelta
+
+    from app.config import settings
+    from app.models.audit_log import AuditLog
+    from app.models.system_config import SystemConfig
+    from app.services.audit_archive import AuditArchive
+    from app.services.audit_count_cache import audit_count_cache
+    from app.services import audit_service as audit_module
+    from app.utils.pagination import decode_cursor
+
+    settings.AUDIT_ARCHIVE_DIR = os.path.join(_TMP_DIR, "audit_archive")
+    archive = AuditArchive(settings.AUDIT_ARCHIVE_DIR)
+    audit_module.audit_archive = archive
+
+    init_db()
+    base = datetime.utcnow()
+    span = timedelta(days=args.days)
+    print(f"audit-retention: inserting {args.rows} rows over {args.days} days...")
+    with engine.begin() as conn:
+        for start in range(0, args.rows, 50000):
+            conn.execute(AuditLog.__table__.insert(), [
+                {
+                    "event_type": ("LOGIN", "LOGOUT", "SESSION_CREATE", "TOKEN_VERIFY_FAIL")[i % 4],
+                    "user_id": i % 50,
+                    "username": f"user{i % 50}",
+                    "client_ip": f"10.0.{i % 200}.{i % 100}",
+                    "user_agent": "bench",
+                    # 每两行共用一个 event_time，覆盖游标中 id 决胜的情况
+                    "event_time": base - span * ((i // 2) * 2 / args.rows),
+                    "event_detail": '{"reason": "bench"}',
+                    "result": "failure",
+                }
+                for i in range(start, min(start + 50000, args.rows))
+            ])
+
+    db = SessionLocal()
+    db.add(SystemConfig(key="audit_hot_retention_days", value=str(args.hot_days)))
+    db.add(SystemConfig(key="audit_archive_retention_days", value="0"))
+    db.commit()
+    service = audit_module.AuditService()
+    filter_sets = [
+        ("no filter", {}),
+        ("user_id", {"user_id": 7}),
+        ("event_type", {"event_type": "LOGIN"}),
+        ("user_id + event_type", {"user_id": 8, "event_type": "SESSION_CREATE"}),
+        ("time range", {"start_time": base - span * 0.8, "end_time": base - span * 0.3}),
+    ]
+
+    def snapshot() -> dict:
+        audit_count_cache.clear()
+        result = {}
+        for label, filters in filter_sets:
+            ids, cursor = [], None
+            while True:
+                logs, total, next_cursor = service.query_logs(
+                    db, filters, limit=args.page_size, cursor=cursor
+                )
+                ids += [log.id for log in logs]
+                if not next_cursor:
+                    break
+                cursor = decode_cursor(next_cursor)
+            offset_page, _, _ = service.query_logs(db, filters, limit=args.page_size, offset=len(ids) // 2)
+            export = hashlib.sha256(b"".join(service.iter_export(filters, "ndjson"))).hexdigest()
+            result[label] = (total, ids, [log.id for log in offset_page], export)
+        return result
+
+    before = snapshot()
+    start = time.perf_counter()
+    run = archive.run(db)
+    elapsed = time.perf_counter() - start
+    hot_rows = db.query(AuditLog).count()
+    stats = archive.get_stats()
+    print(
+        f"  archived {run['archived_rows']} rows into {run['archived_parts']} parts in {elapsed:.1f}s, "
+        f"{stats['bytes'] / 2**20:.1f} MiB on disk; {hot_rows} rows left in audit_logs"
+    )
+    if hot_rows + stats["rows"] != args.rows:
+        raise SystemExit(f"FAIL: {hot_rows} hot + {stats['rows']} archived != {args.rows}")
+    rerun = archive.run(db)
+    if rerun["archived_rows"]:
+        raise SystemExit("FAIL: second run archived rows again")
+
+    after = snapshot()
+    failures = []
+    for label, _ in filter_sets:
+        same = before[label] == after[label]
+        print(f"  {label:<24} total={after[label][0]:>7}  {'identical' if same else 'DIFFERENT'}")
+        if not same:
+            failures.append(label)
+    db.close()
+    if failures:
+        raise SystemExit(f"FAIL: {', '.join(failures)}")
+
+
+def bench_audit_search(args) -> None:
+    import json
+    from datetime import datetime, timedelta
+
+    from app.models.audit_log import AuditLog
+    from app.services import audit_search
+    from app.services.audit_count_cache import audit_count_cache
+    from app.services.audit_service import AuditService
+
+    init_db()
+    if not audit_search._fts_available:
+        raise SystemExit("FAIL: SQLite FTS5 trigram tokenizer is not available")
+    base = datetime.utcnow()
+    # 与 SessionService 生成的会话 id 格式一致
+    rng = random.Random(42)
+    alphabet = string.ascii_lowercase + string.digits
+    session_ids = ["sess_" + "".join(rng.choices(alphabet, k=16)) for _ in range(args.rows)]
+    print(f"audit-search: inserting {args.rows} audit log rows (FTS index maintained by triggers)...")
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for chunk in range(0, args.rows, 50000):
+            conn.execute(AuditLog.__table__.insert(), [
+                {
+                    "event_type": ("SESSION_CREATE", "SESSION_CLOSE", "TOKEN_VERIFY_FAIL")[i % 3],
+                    "user_id": i % 500,
+                    "username": f"user{i % 500}",
+                    "client_ip": f"10.{i % 250}.{i % 200}.{i % 100}",
+                    "user_agent": "Mozilla/5.0 (X11; Linux x86_64) bench",
+                    "event_time": base - timedelta(seconds=i),
+                    "event_detail": json.dumps({
+                        "session_id": session_ids[i],
+                        "port": 7861 + i % 100,
+                        "error": "token not found" if i % 3 == 2 else None,
+                    }),
+                    "result": "failure" if i % 3 == 2 else "success",
+                }
+                for i in range(chunk, min(chunk + 50000, args.rows))
+            ])
+    print(f"  insert {time.perf_counter() - start:.1f}s")
+
+    db = SessionLocal()
+    service = AuditService()
+    queries = [
+        session_ids[args.rows // 2],         # 单个会话 id，唯一匹配
+        "user123 7884",                      # 用户名 + 端口
+        "10.17.17.17",                       # 客户端 IP
+        "not found user42",                  # 错误信息 + 用户名
+    ]
+    failures = []
+    for q in queries:
+        terms = audit_search.parse_query(q)
+
+        # 两种方式都包含首次请求的 COUNT（清空总数缓存）
+        audit_search._fts_available = False
+        audit_count_cache.clear()
+        start = time.perf_counter()
+        like_logs, like_total, _ = service.query_logs(db, {"q": tuple(terms)}, limit=args.limit)
+        like_ms = (time.perf_counter() - start) * 1000
+
+        audit_search._fts_available = True
+        audit_count_cache.clear()
+        start = time.perf_counter()
+        fts_logs, fts_total, _ = service.query_logs(db, {"q": tuple(terms)}, limit=args.limit)
+        fts_ms = (time.perf_counter() - start) * 1000
+
+        same = [r.id for r in like_logs] == [r.id for r in fts_logs] and like_total == fts_total
+        print(f"  q={q!r:<28} matches={fts_total:>6}  LIKE {like_ms:8.1f}ms  FTS {fts_ms:7.1f}ms  "
+              f"{'identical' if same else 'DIFFERENT'}")
+        if not same:
+            failures.append(q)
+    db.close()
+    if failures:
+        raise SystemExit(f"FAIL: {', '.join(failures)}")
+
+
+def bench_alert_engine(args) -> None:
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import func
+
+    from app.models.audit_log import AuditLog
+    from app.models.session import Session as SessionModel
+    from app.services.alert_detector import AlertDetector
+
+    init_db()
+    db = SessionLocal()
+    # (时间窗口, 阈值) 与 init_db 中的默认规则相同；多 IP 规则窗口按小时计
+    burst_window, burst_threshold = timedelta(minutes=10), 5
+    failure_window, failure_threshold = timedelta(minutes=5), 5
+    multi_ip_window, multi_ip_threshold = timedelta(hours=1), 3
+
+    # 事件流：平均每秒一个事件且时间严格递增（参照查询按 <= ts 截取回放进度），
+    # 用户 / IP 数量较少，使各规则都有触发
+    now = datetime.utcnow().replace(microsecond=0)
+    t = now - timedelta(seconds=args.events)
+    stream = []
+    for i in range(args.events):
+        t += timedelta(milliseconds=random.randint(1, 2000))
+        kind = random.choice(("login_success", "login_failure", "session"))
+        stream.append((kind, 1 + random.randrange(args.users), f"10.0.0.{random.randrange(args.ips)}", t))
+
+    db.bulk_insert_mappings(AuditLog, [
+        {
+            "event_type": "LOGIN", "user_id": uid, "client_ip": ip, "event_time": ts,
+            "result": "success" if kind == "login_success" else "failure",
+        }
+        for kind, uid, ip, ts in stream if kind != "session"
+    ])
+    db.bulk_insert_mappings(SessionModel, [
+        {
+            "id": f"sess_{i:016d}", "user_id": uid, "gotty_pid": 1, "gotty_port": 7861,
+            "gotty_url": "", "random_token": _random_token(), "status": "closed", "started_at": ts,
+        }
+        for i, (kind, uid, ip, ts) in enumerate(stream) if kind == "session"
+    ])
+    db.commit()
+    print(f"alert-engine: replaying {args.events} events, {args.users} users, {args.ips} IPs")
+
+    def reference(kind, uid, ip, ts):
+        """旧实现：每个事件执行 COUNT 查询（只统计 ts 之前的事件以模拟回放）"""
+        if kind == "session":
+            count = db.query(func.count(SessionModel.id)).filter(
+                SessionModel.user_id == uid,
+                SessionModel.started_at >= ts - burst_window,
+                SessionModel.started_at <= ts,
+            ).scalar()
+            return (count > burst_threshold,)
+        failures = db.query(func.count(AuditLog.id)).filter(
+            AuditLog.event_type == "LOGIN", AuditLog.client_ip == ip, AuditLog.result == "failure",
+            AuditLog.event_time >= ts - failure_window, AuditLog.event_time <= ts,
+        ).scalar()
+        ips = db.query(func.count(func.distinct(AuditLog.client_ip))).filter(
+            AuditLog.event_type == "LOGIN", AuditLog.user_id == uid, AuditLog.result == "success",
+            AuditLog.event_time >= ts - multi_ip_window, AuditLog.event_time <= ts,
+        ).scalar()
+        return (failures > failure_threshold, ips > multi_ip_threshold)
+
+    def streaming(detector, kind, uid, ip, ts):
+        if kind == "session":
+            detector.observe_session(uid, ts)
+            return (detector.session_burst(uid, ts - burst_window, burst_threshold),)
+        detector.observe_login(uid, ip, "success" if kind == "login_success" else "failure", ts)
+        return (
+            detector.login_failure(ip, ts - failure_window, failure_threshold),
+            detector.multi_ip(uid, ts - multi_ip_window, multi_ip_threshold),
+        )
+
+    detector = AlertDetector()
+    ref_us, stream_us, mismatches, fired = [], [], 0, 0
+    for kind, uid, ip, ts in stream:
+        start = time.perf_counter()
+        expected = reference(kind, uid, ip, ts)
+        ref_us.append((time.perf_counter() - start) * 1e6)
+        start = time.perf_counter()
+        actual = streaming(detector, kind, uid, ip, ts)
+        stream_us.append((time.perf_counter() - start) * 1e6)
+        fired += sum(expected)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  mismatch at {ts} {kind} user={uid} ip={ip}: expected {expected}, got {actual}")
+
+    # 启动预热：从数据库重建的状态应与回放得到的状态判定一致
+    warmed = AlertDetector()
+    warmed.warm(db, now=t)
+    for uid in range(1, args.users + 1):
+        if (detector.session_burst(uid, t - burst_window, burst_threshold),
+                detector.multi_ip(uid, t - multi_ip_window, multi_ip_threshold)) != (
+                warmed.session_burst(uid, t - burst_window, burst_threshold),
+                warmed.multi_ip(uid, t - multi_ip_window, multi_ip_threshold)):
+            mismatches += 1
+            print(f"  warm-up mismatch for user {uid}")
+    for n in range(args.ips):
+        ip = f"10.0.0.{n}"
+        if detector.login_failure(ip, t - failure_window, failure_threshold) != warmed.login_failure(
+                ip, t - failure_window, failure_threshold):
+            mismatches += 1
+            print(f"  warm-up mismatch for ip {ip}")
+    db.close()
+
+    for label, samples in (("per-event COUNT queries", ref_us), ("sliding window", stream_us)):
+        samples.sort()
+        _print_result(label, {
+            "mean_us": statistics.fmean(samples),
+            "p50_us": samples[len(samples) // 2],
+            "p99_us": samples[int(len(samples) * 0.99) - 1],
+        })
+    print(f"  rule hits: {fired}, decision mismatches: {mismatches}")
+    if mismatches:
+        raise SystemExit("FAIL: sliding window decisions differ from COUNT queries")
+
+
+def bench_alert_outbox(args) -> None:
+    import json
+    import threading
+    from datetime import datetime
+
+    from app.config import settings
+    from app.models.alert import AlertEvent
+    from app.services.alert_outbox import DELIVERY_PENDING, DELIVERY_SENT, AlertNotifier, alert_outbox
+
+    class FlakyNotifier(AlertNotifier):
+        """本地替身：每次发送耗时 latency，按 failure_rate 随机失败"""
+        name = "bench"
+        requires_topic = False
+
+        def __init__(self):
+            self.sent = 0
+            self._lock = threading.Lock()
+
+        def publish(self, topic_arn, subject, message, detail):
+            time.sleep(args.latency_ms / 1000)
+            if random.random() < args.failure_rate:
+                raise ConnectionError("simulated SNS outage")
+            with self._lock:
+                self.sent += 1
+
+    init_db()
+    object.__setattr__(settings, "ALERT_OUTBOX_BACKOFF_BASE_SECONDS", 0.01)
+    object.__setattr__(settings, "ALERT_OUTBOX_BACKOFF_MAX_SECONDS", 0.05)
+    object.__setattr__(settings, "ALERT_OUTBOX_MAX_ATTEMPTS", 20)
+    object.__setattr__(settings, "ALERT_OUTBOX_POLL_SECONDS", 0.02)
+    notifier = FlakyNotifier()
+    alert_outbox.set_notifier(notifier)
+    logging.getLogger("app.services.alert_outbox").setLevel(logging.ERROR)
+
+    print(
+        f"alert-outbox: {args.events} alerts, {args.latency_ms}ms per publish, "
+        f"{args.failure_rate:.0%} failures, {settings.ALERT_OUTBOX_WORKERS} workers"
+    )
+
+    async def watch_loop(work) -> float:
+        """work 执行期间事件循环的最大停顿（毫秒）"""
+        max_gap, done = 0.0, False
+
+        async def ticker():
+            nonlocal max_gap
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0.005)
+                current = time.perf_counter()
+                max_gap = max(max_gap, current - last)
+                last = current
+
+        tick = asyncio.create_task(ticker())
+        await work()
+        done = True
+        await tick
+        return max_gap * 1000
+
+    async def inline_sends():
+        # 旧实现：在协程中直接调用阻塞的 publish（只发送一轮，不含 60 秒重试等待）
+        for i in range(args.events):
+            try:
+                notifier.publish("", "", "", {})
+            except ConnectionError:
+                pass
+            await asyncio.sleep(0)
+
+    async def outbox_sends():
+        alert_outbox.start()
+        alert_outbox.wake()
+        while db.query(AlertEvent).filter(AlertEvent.delivery_status == DELIVERY_PENDING).count():
+            await asyncio.sleep(0.05)
+        await alert_outbox.stop()
+
+    started = time.perf_counter()
+    inline_gap = asyncio.run(watch_loop(inline_sends))
+    inline_s = time.perf_counter() - started
+    notifier.sent = 0
+
+    # 旧实现跑完后再写入待发送事件，送达延迟只包含 outbox 本身
+    db = SessionLocal()
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(AlertEvent, [
+        {
+            "rule_key": "login_failure", "triggered_user_id": i, "triggered_at": now,
+            "event_detail": json.dumps({"user_id": i, "client_ip": "10.0.0.1"}),
+            "notification_sent": False, "delivery_status": DELIVERY_PENDING,
+        }
+        for i in range(args.events)
+    ])
+    db.commit()
+
+    started = time.perf_counter()
+    outbox_gap = asyncio.run(watch_loop(outbox_sends))
+    outbox_s = time.perf_counter() - started
+    sent = db.query(AlertEvent).filter(AlertEvent.delivery_status == DELIVERY_SENT).count()
+    stats = alert_outbox.get_stats(db)
+    db.close()
+
+    print(f"  inline publish      total={inline_s:6.2f}s  max loop stall={inline_gap:8.1f}ms")
+    print(f"  outbox              total={outbox_s:6.2f}s  max loop stall={outbox_gap:8.1f}ms")
+    print(
+        f"  delivered={sent}/{args.events} attempts={stats['attempts']} "
+        f"failed_attempts={stats['failed_attempts']} max_lag={stats['max_lag_seconds']}s"
+    )
+    if sent != args.events or notifier.sent != args.events:
+        raise SystemExit("FAIL: not every alert was delivered exactly once")
+
+
+def bench_realtime(args) -> None:
+    import psutil
+
+    from app.services.metrics_sampler import metrics_sampler
+    from app.services.monitoring_service import MonitoringService
+
+    init_db()
+    print(f"realtime: {args.clients} concurrent dashboards, {args.rounds} polls each")
+
+    def old_realtime(db):
+        # 旧实现：请求内阻塞采样 CPU
+        MonitoringService(db).get_realtime_metrics()
+        psutil.cpu_percent(interval=0.5)
+
+    async def run(handler) -> tuple:
+        latencies, max_gap, done = [], 0.0, False
+
+        async def ticker():
+            nonlocal max_gap
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0.01)
+                current = time.perf_counter()
+                max_gap = max(max_gap, current - last)
+                last = current
+
+        async def client():
+            db = SessionLocal()
+            try:
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    handler(db)     # 与接口一致：在 async 处理函数中同步调用
+                    latencies.append((time.perf_counter() - start) * 1e6)
+                    await asyncio.sleep(0)
+            finally:
+                db.close()
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(args.clients)])
+        elapsed = time.perf_counter() - started
+        done = True
+        await tick
+        latencies.sort()
+        return latencies, elapsed, max_gap * 1000
+
+    async def with_sampler():
+        metrics_sampler.start()
+        await asyncio.sleep(metrics_sampler.interval_seconds / 2)
+        try:
+            return await run(lambda db: MonitoringService(db).get_realtime_metrics())
+        finally:
+            await metrics_sampler.stop()
+
+    for label, result in (
+        ("cpu_percent(0.5) in request", asyncio.run(run(old_realtime))),
+        ("background sampler", asyncio.run(with_sampler())),
+    ):
+        latencies, elapsed, gap = result
+        print(
+            f"  {label:<28} p50={latencies[len(latencies) // 2] / 1000:8.2f}ms  "
+            f"total={elapsed:6.2f}s  max loop stall={gap:8.1f}ms"
+        )
+
+
+def bench_metrics_rollup(args) -> None:
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import func
+
+    from app.models.metric_point import MetricPoint
+    from app.services.metrics_store import (
+        METRICS, TIER_DAY, TIER_HOUR, TIER_MINUTE, MetricsStore, _epoch,
+    )
+
+    init_db()
+    db = SessionLocal()
+    store = MetricsStore()
+    end = datetime.utcnow().replace(second=0, microsecond=0)
+    start = end - timedelta(days=args.days)
+    minutes = args.days * 24 * 60
+    print(f"metrics-rollup: {args.days} days x {len(METRICS)} metrics, {args.per_minute} observations/minute")
+
+    # 参照结果：直接按小时 / 天聚合原始观测
+    expected = {TIER_HOUR: {}, TIER_DAY: {}}
+    rollup_ms = []
+    t = start
+    for i in range(minutes):
+        for name, metric_id in METRICS.items():
+            for _ in range(args.per_minute):
+                value = random.uniform(0, 100)
+                store.observe(name, value, t)
+                for tier, size in ((TIER_HOUR, 3600), (TIER_DAY, 86400)):
+                    key = (metric_id, _epoch(t) // size * size)
+                    agg = expected[tier].setdefault(key, [0, 0.0, value, value])
+                    agg[0] += 1
+                    agg[1] += value
+                    agg[2] = min(agg[2], value)
+                    agg[3] = max(agg[3], value)
+        t += timedelta(minutes=1)
+        # 与后台任务一样每分钟写入并汇总（按 --rollup-every 抽样以缩短耗时）
+        if (i + 1) % args.rollup_every == 0 or i == minutes - 1:
+            store.flush(db)
+            started = time.perf_counter()
+            store.rollup(db)
+            rollup_ms.append((time.perf_counter() - started) * 1000)
+
+    mismatches = 0
+    for tier, buckets in expected.items():
+        rows = db.query(MetricPoint).filter(MetricPoint.tier == tier).all()
+        actual = {(r.metric_id, r.bucket): r for r in rows}
+        if set(actual) != set(buckets):
+            mismatches += len(set(actual) ^ set(buckets))
+        for key, (count, total, low, high) in buckets.items():
+            r = actual.get(key)
+            if r is None:
+                continue
+            if r.count != count or abs(r.sum - total) > 1e-6 * max(1.0, abs(total)) or r.min != low or r.max != high:
+                mismatches += 1
+
+    def raw_daily():
+        # 不做汇总时：每次从 1 分钟数据按天 GROUP BY
+        db.query(
+            MetricPoint.metric_id, MetricPoint.bucket - MetricPoint.bucket % 86400,
+            func.sum(MetricPoint.sum), func.sum(MetricPoint.count), func.max(MetricPoint.max),
+        ).filter(MetricPoint.tier == TIER_MINUTE, MetricPoint.bucket >= _epoch(start)).group_by(
+            MetricPoint.metric_id, MetricPoint.bucket - MetricPoint.bucket % 86400
+        ).all()
+
+    _print_result("daily from 1m rows", _measure(raw_daily, 20))
+    _print_result("daily from 1d rollup", _measure(lambda: store.daily(db, start, end), 20))
+    rollup_ms.sort()
+    print(f"  incremental rollup p50={rollup_ms[len(rollup_ms) // 2]:.2f}ms max={rollup_ms[-1]:.2f}ms")
+    print(f"  hour/day buckets checked: {len(expected[TIER_HOUR]) + len(expected[TIER_DAY])}, mismatches: {mismatches}")
+    db.close()
+    if mismatches:
+        raise SystemExit("FAIL: rollups differ from raw observations")
+
+
+def bench_session_export(args) -> None:
+    import csv
+    import io
+    import json
+    import zlib
+    from datetime import datetime, timedelta
+
+    import psutil
+
+    from app.models.session import Session as SessionModel
+    from app.models.user import User
+    from app.services.monitoring_service import DEFAULT_EXPORT_COLUMNS, MonitoringService
+    from app.utils.streaming import gzip_chunks
+
+    init_db()
+    now = datetime.utcnow()
+    print(f"session-export: inserting {args.rows} sessions over {args.days} days...")
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"username": f"user{i}", "email": f"user{i}@bench.local", "role": "user", "status": "active"}
+            for i in range(1, 201)
+        ])
+        for start in range(0, args.rows, 50000):
+            rows = []
+            for i in range(start, min(start + 50000, args.rows)):
+                started_at = now - timedelta(seconds=random.uniform(0, args.days * 86400))
+                closed = i % 4 != 0
+                rows.append({
+                    "id": f"bench-{i:08d}", "user_id": i % 200 + 1, "gotty_pid": 0, "gotty_port": 0,
+                    "gotty_url": "", "random_token": _random_token(), "status": "closed" if closed else "running",
+                    "started_at": started_at, "last_activity_at": started_at,
+                    "closed_at": started_at + timedelta(seconds=i % 7200) if closed else None,
+                    "duration_seconds": i % 7200 if closed else 0,
+                })
+            conn.execute(SessionModel.__table__.insert(), rows)
+
+    process = psutil.Process()
+    start_date = (now - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    end_date = now.strftime("%Y-%m-%d")
+    sd, ed = datetime.strptime(start_date, "%Y-%m-%d"), datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+
+    def export(label: str, chunks) -> bytes:
+        rss_start = process.memory_info().rss
+        rss_peak = rss_start
+        lines = []
+        size = 0
+        start = time.perf_counter()
+        for n, chunk in enumerate(chunks):
+            size += len(chunk)
+            if args.check_rows:
+                lines.append(chunk)
+            if n % 16 == 0:
+                rss_peak = max(rss_peak, process.memory_info().rss)
+        elapsed = time.perf_counter() - start
+        rss_peak = max(rss_peak, process.memory_info().rss)
+        print(
+            f"  {label:<34} {elapsed:7.1f}s  {size / 2**20:8.1f} MiB out  "
+            f"RSS +{(rss_peak - rss_start) / 2**20:7.1f} MiB"
+        )
+        return b"".join(lines)
+
+    def export_before():
+        # 旧实现：.all() 加载 sessions JOIN users，整个 CSV 写入 StringIO 后一次返回
+        db = SessionLocal()
+        sessions = (
+            db.query(SessionModel, User.username)
+            .join(User, SessionModel.user_id == User.id)
+            .filter(SessionModel.started_at >= sd, SessionModel.started_at < ed)
+            .all()
+        )
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(DEFAULT_EXPORT_COLUMNS)
+        for sess, username in sessions:
+            writer.writerow([sess.id, username, sess.status, sess.started_at, sess.closed_at, sess.duration_seconds])
+        db.close()
+        yield output.getvalue().encode()
+
+    def export_gzip():
+        decompressor = zlib.decompressobj(31)
+        for chunk in gzip_chunks(MonitoringService.iter_export(sd, ed, {}, DEFAULT_EXPORT_COLUMNS, "csv")):
+            yield decompressor.decompress(chunk)
+
+    after = export("after csv", MonitoringService.iter_export(sd, ed, {}, DEFAULT_EXPORT_COLUMNS, "csv"))
+    ndjson = export("after ndjson", MonitoringService.iter_export(sd, ed, {}, DEFAULT_EXPORT_COLUMNS, "ndjson"))
+    after_gz = export("after csv.gz (decompressed)", export_gzip())
+    filtered = export(
+        "after csv, user+status+2 columns",
+        MonitoringService.iter_export(
+            sd, ed, {"user_id": 7, "status": ["closed"]}, ["session_id", "duration_seconds"], "csv"
+        ),
+    )
+    # 旧实现放在最后，避免其释放的内存被后续导出复用而掩盖增长
+    before = export("before (.all() + StringIO)", export_before())
+
+    if args.check_rows:
+        # 旧实现没有 ORDER BY，按行排序后比较
+        before_lines = before.decode().splitlines()
+        after_lines = after.decode().splitlines()
+        ok = before_lines[0] == after_lines[0] and sorted(before_lines[1:]) == sorted(after_lines[1:])
+        ok = ok and after_gz == after
+        ok = ok and len(ndjson.splitlines()) == len(after_lines) - 1
+        ok = ok and all(json.loads(line)["session_id"] for line in ndjson.splitlines()[:10])
+        db = SessionLocal()
+        expected_filtered = db.query(SessionModel).filter(
+            SessionModel.user_id == 7, SessionModel.status == "closed",
+            SessionModel.started_at >= sd, SessionModel.started_at < ed,
+        ).count()
+        db.close()
+        ok = ok and len(filtered.splitlines()) - 1 == expected_filtered
+        print(f"  rows={len(after_lines) - 1} filtered={expected_filtered} content {'identical' if ok else 'DIFFERENT'}")
+        if not ok:
+            raise SystemExit("FAIL: streaming export differs from the previous export")
+
+
+def bench_session_stats(args) -> None:
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import func
+
+    from app.models.session import Session as SessionModel
+    from app.models.user import User
+    from app.services.session_stats_service import session_stats
+
+    init_db()
+    db = SessionLocal()
+    now = datetime.utcnow()
+    users = [User(username=f"bench-user-{i:03d}", email=f"u{i}@bench.local") for i in range(args.users)]
+    db.add_all(users)
+    db.commit()
+    user_ids = [u.id for u in users]
+    print(f"session-stats: {args.sessions} sessions over {args.days} days, {args.users} users")
+
+    # 按时间顺序创建会话，随机关闭（正常关闭 / 登出路径不计时长 / 重复关闭重新计时）
+    open_sessions = []
+    starts = sorted(now - timedelta(seconds=random.uniform(0, args.days * 86400)) for _ in range(args.sessions))
+    for i, started_at in enumerate(starts):
+        sess = SessionModel(
+            id=f"bench-{i}", user_id=random.choice(user_ids), gotty_pid=0, gotty_port=0,
+            gotty_url="", random_token=_random_token(), status="starting", started_at=started_at,
+            duration_seconds=0,
+        )
+        db.add(sess)
+        session_stats.record_start(db, sess)
+        open_sessions.append(sess)
+        if len(open_sessions) > 20 or random.random() < 0.5:
+            victim = open_sessions.pop(random.randrange(len(open_sessions)))
+            # 在下一个会话开始前关闭
+            closed_at = starts[i + 1] if i + 1 < len(starts) else now
+            victim.status = "closed"
+            victim.closed_at = closed_at
+            path = random.random()
+            if path < 0.7:
+                victim.duration_seconds = int((closed_at - victim.started_at).total_seconds())
+                session_stats.record_close(db, victim, 0, False)
+            elif path < 0.9:
+                session_stats.record_close(db, victim)
+            else:
+                victim.duration_seconds = random.randint(0, 3600)
+                session_stats.record_close(db, victim)
+                previous = victim.duration_seconds
+                victim.duration_seconds = previous + random.randint(0, 3600)
+                session_stats.record_close(db, victim, previous, True)
+        if i % 500 == 0:
+            db.commit()
+    db.commit()
+
+    def legacy(days: int) -> dict:
+        # 原实现：每次对 sessions 做 COUNT / AVG / GROUP BY
+        start_date = datetime.utcnow() - timedelta(days=days)
+        total = db.query(SessionModel).filter(SessionModel.started_at >= start_date).count()
+        avg = (
+            db.query(func.avg(SessionModel.duration_seconds))
+            .filter(SessionModel.started_at >= start_date, SessionModel.status == "closed")
+            .scalar() or 0
+        )
+        daily = (
+            db.query(func.date(SessionModel.started_at).label("date"), func.count(SessionModel.id).label("count"))
+            .filter(SessionModel.started_at >= start_date)
+            .group_by(func.date(SessionModel.started_at))
+            .all()
+        )
+        top = (
+            db.query(User.username, func.count(SessionModel.id).label("session_count"))
+            .join(SessionModel, User.id == SessionModel.user_id)
+            .filter(SessionModel.started_at >= start_date)
+            .group_by(User.username)
+            .order_by(func.count(SessionModel.id).desc(), User.username)
+            .limit(10)
+            .all()
+        )
+        return {
+            "total_sessions": total,
+            "average_session_duration_seconds": int(avg),
+            "daily_sessions": [{"date": str(d.date), "count": d.count} for d in daily],
+            "top_users": [{"username": u.username, "session_count": u.session_count} for u in top],
+        }
+
+    for days in args.windows:
+        _print_result(f"days={days} raw sessions", _measure(lambda: legacy(days), args.iterations))
+        _print_result(
+            f"days={days} daily stats",
+            _measure(lambda: session_stats.summarize(db, datetime.utcnow() - timedelta(days=days)), args.iterations),
+        )
+
+    rows = session_stats.rebuild(db, (now - timedelta(days=args.days + 1)).date(), now.date() + timedelta(days=1))
+    print(f"  rebuild: {rows} rows in {session_stats.last_rebuild_ms:.1f}ms")
+    db.close()
+
+
+def bench_events(args) -> None:
+    from app.config import settings
+    from app.core.exceptions import EventStreamLimitError
+    from app.services.event_bus import EventBus
+
+    settings.EVENTS_MAX_CONNECTIONS = args.subscribers + 1
+    settings.EVENTS_MAX_CONNECTIONS_PER_USER = args.subscribers
+    settings.EVENTS_HEARTBEAT_SECONDS = 3600
+
+    async def run():
+        bus = EventBus()
+        bus.start()
+        subs = [
+            bus.subscribe(i % args.users + 1, i == 0, frozenset({"sessions"}))
+            for i in range(args.subscribers)
+        ]
+        # 该订阅者（管理员，接收全部事件）从不读取，模拟慢速客户端
+        slow = bus.subscribe(1, True, frozenset({"sessions"}))
+        received = [0] * len(subs)
+        resyncs = [0] * len(subs)
+
+        async def consume(idx, sub):
+            async for chunk in bus.stream(sub):
+                if chunk.startswith(b"id:"):
+                    received[idx] += 1
+                elif b"event: resync" in chunk:
+                    resyncs[idx] += 1
+
+        consumers = [asyncio.create_task(consume(i, s)) for i, s in enumerate(subs)]
+        await asyncio.sleep(0)
+
+        publish_times = []
+        for n in range(args.events):
+            started = time.perf_counter()
+            bus.publish("session", {"id": n, "status": "running"}, user_id=n % args.users + 1)
+            publish_times.append(time.perf_counter() - started)
+            if n % 50 == 0:
+                await asyncio.sleep(0)
+        while any(not s.queue.empty() for s in subs):
+            await asyncio.sleep(0.01)
+
+        expected = []
+        for i in range(len(subs)):
+            user_id = i % args.users + 1
+            expected.append(args.events if i == 0 else sum(1 for n in range(args.events) if n % args.users + 1 == user_id))
+        mismatches = sum(1 for got, want, r in zip(received, expected, resyncs) if got != want and not r)
+
+        rejected = 0
+        try:
+            bus.subscribe(2, False, frozenset({"sessions"}))
+            bus.subscribe(3, False, frozenset({"sessions"}))
+        except EventStreamLimitError:
+            rejected = 1
+
+        stats = bus.get_stats()
+        slow_queued = slow.queue.qsize()
+        await bus.stop()
+        await asyncio.gather(*consumers)
+        # 未开始推送的连接由响应的后台任务释放
+        bus.unsubscribe(slow)
+        return publish_times, received, resyncs, mismatches, slow, slow_queued, rejected, stats, bus.get_stats()
+
+    publish_times, received, resyncs, mismatches, slow, slow_queued, rejected, stats, after = asyncio.run(run())
+    publish_times.sort()
+    print(f"events: {args.events} session events, {args.subscribers} subscribers across {args.users} users + 1 slow consumer")
+    print(f"  publish p50 {statistics.median(publish_times) * 1e6:8.2f}us  "
+          f"p99 {publish_times[int(len(publish_times) * 0.99)] * 1e6:8.2f}us  (fan-out per event)")
+    print(f"  delivered {sum(received)} events, consumers resynced {sum(1 for r in resyncs if r)}, mismatches {mismatches}")
+    print(f"  slow consumer: overflows {slow.overflows}, queued {slow_queued} (bounded by EVENTS_QUEUE_SIZE={settings.EVENTS_QUEUE_SIZE})")
+    print(f"  connection cap enforced: {bool(rejected)}; connections {stats['connections']} -> {after['connections']} after shutdown")
+    if mismatches or not slow.overflows or not rejected or after["connections"]:
+        raise SystemExit("event bus check failed")
+
+
+def bench_prometheus(args) -> None:
+    from app.core.prometheus import PrometheusMiddleware, render
+
+    init_db()
+
+    class _Route:
+        path = "/api/v1/bench"
+
+    async def endpoint(scope, receive, send):
+        scope["route"] = _Route()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    def run(app):
+        async def loop():
+            for _ in range(args.iterations):
+                await app({"type": "http", "method": "GET", "path": "/api/v1/bench"}, receive, send)
+        started = time.perf_counter()
+        asyncio.run(loop())
+        return (time.perf_counter() - started) / args.iterations * 1e6
+
+    bare = run(endpoint)
+    wrapped = run(PrometheusMiddleware(endpoint))
+    print(f"prometheus: {args.iterations} requests through a no-op ASGI endpoint")
+    print(f"  middleware overhead          {wrapped - bare:9.2f}us per request (bare {bare:.2f}us)")
+
+    def checkout():
+        with engine.connect():
+            pass
+    _print_result("pool checkout (timed)", _measure(checkout, args.iterations))
+    _print_result("render /metrics", _measure(render, 50))
+
+
+def bench_config_cache(args) -> None:
+    from app.models.alert import AlertRule
+    from app.models.ip_whitelist import IPWhitelist
+    from app.models.system_config import SystemConfig
+    from app.services.config_cache import ConfigCache
+
+    init_db()
+    db = SessionLocal()
+    for i, key in enumerate(("session_burst", "login_failure", "multi_ip_login", "offhour_login")):
+        db.add(AlertRule(rule_key=key, rule_name=key, time_window_minutes=10, threshold=5 + i))
+    for key, value in (("alert_cooldown_minutes", "30"), ("ip_whitelist_enabled", "true"), ("config_version", "0")):
+        db.add(SystemConfig(key=key, value=value))
+    for i in range(args.entries):
+        db.add(IPWhitelist(cidr=f"10.{i // 256}.{i % 256}.0/24", note=f"entry {i}"))
+    db.commit()
+
+    def read_db():
+        {r.rule_key: r for r in db.query(AlertRule).filter_by(enabled=True).all()}
+        {c.key: c.value for c in db.query(SystemConfig).all()}
+        db.query(IPWhitelist).order_by(IPWhitelist.id).all()
+        db.expire_all()
+
+    cache = ConfigCache(args.poll)
+    _print_result("query per call", _measure(read_db, args.iterations))
+    _print_result("versioned cache", _measure(lambda: cache.get(db), args.iterations))
+    print(f"  {cache.stats()}")
+
+    # 两个缓存实例模拟两个 worker：worker_b 修改后，worker_a 在一个轮询间隔内看到新值
+    worker_a, worker_b = ConfigCache(args.poll), ConfigCache(args.poll)
+    other = SessionLocal()
+    before = worker_a.get(db).enabled_rules["session_burst"].threshold
+    other.query(AlertRule).filter_by(rule_key="session_burst").update({"threshold": before + 1})
+    worker_b.bump(other)
+    other.close()
+    stale = worker_a.get(db).enabled_rules["session_burst"].threshold
+    time.sleep(args.poll)
+    fresh = worker_a.get(db).enabled_rules["session_burst"].threshold
+    print(f"  cross-worker: before={before} within poll={stale} after poll={fresh}")
+    db.close()
+    if fresh != before + 1:
+        raise SystemExit("FAIL: change from another worker not picked up after one poll interval")
+
+
+def bench_async_db(args) -> None:
+    from datetime import datetime, timedelta
+
+    from fastapi import Depends, FastAPI, Header
+    from sqlalchemy.orm import Session
+
+    from app.core.database import get_db
+    from app.core.security import create_access_token
+    from app.main import app
+    from app.models.session import Session as SessionModel
+    from app.models.user import User
+    from app.services.session_token_index import session_token_index
+    from app.services.token_service import token_service
+    from app.services.user_principal_cache import UserPrincipal, user_principal_cache
+
+    logging.getLogger("app.core.database").setLevel(logging.WARNING)
+    init_db()
+    db = SessionLocal()
+    db.bulk_insert_mappings(User, [
+        {"id": uid, "username": f"user{uid}", "email": f"user{uid}@example.com"}
+        for uid in range(1, args.users + 1)
+    ])
+    base = datetime.utcnow()
+    db.bulk_insert_mappings(SessionModel, [
+        {
+            "id": f"sess_{i:016d}",
+            "user_id": 1 + i % args.users,
+            "gotty_pid": 1,
+            "gotty_port": 7861,
+            "gotty_url": "",
+            "random_token": f"tok{i:016d}",
+            # 第一条为活动会话，token-verify 命中内存索引
+            "status": "running" if i == 0 else "closed",
+            "started_at": base - timedelta(seconds=i),
+        }
+        for i in range(args.sessions)
+    ])
+    db.commit()
+    token_service.init_blacklist_cache(db)
+    session_token_index.load(db)
+    db.close()
+    # 关闭用户身份缓存，每个会话列表请求都经过 get_current_user 的数据库查询
+    user_principal_cache.ttl_seconds = 0
+    user_principal_cache.clear()
+
+    # 旧实现：同步依赖在线程池中查询用户，async 处理函数内直接执行同步查询（阻塞事件循环）
+    old_app = FastAPI()
+
+    def old_current_user(db: Session = Depends(get_db)) -> UserPrincipal:
+        return UserPrincipal.from_user(db.query(User).filter_by(id=1).first())
+
+    @old_app.get("/api/v1/sessions")
+    async def old_list_sessions(current_user=Depends(old_current_user), db: Session = Depends(get_db)):
+        query = db.query(SessionModel).filter(SessionModel.user_id == current_user.id)
+        total = query.count()
+        rows = (
+            query.outerjoin(User, User.id == SessionModel.user_id)
+            .add_columns(User.username)
+            .order_by(SessionModel.started_at.desc(), SessionModel.id.desc())
+            .limit(50)
+            .all()
+        )
+        return {"total": total, "sessions": [sess.id for sess, _ in rows]}
+
+    @old_app.get("/api/v1/sessions/token-verify")
+    async def old_token_verify(
+        x_session_token: str = Header(alias="X-Session-Token"), db: Session = Depends(get_db)
+    ):
+        return {"success": session_token_index.get(x_session_token) is not None}
+
+    cookie = (b"cookie", f"access_token={create_access_token({'sub': '1'})}".encode())
+    verify_token = (b"x-session-token", b"tok0000000000000000")
+
+    async def call(target, path: str, headers: list) -> int:
+        status = 0
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        path, _, query = path.partition("?")
+        await target({
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+            "root_path": "", "headers": headers, "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 8000),
+        }, receive, send)
+        return status
+
+    async def run(target) -> dict:
+        """会话列表（数据库查询）与 token-verify（内存索引）混合负载，持续到列表请求全部完成"""
+        list_latencies, verify_latencies, errors, done = [], [], 0, False
+
+        async def list_client():
+            nonlocal errors
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                if await call(target, "/api/v1/sessions?limit=50", [cookie]) != 200:
+                    errors += 1
+                list_latencies.append((time.perf_counter() - start) * 1000)
+
+        async def verify_client():
+            nonlocal errors
+            while not done:
+                start = time.perf_counter()
+                if await call(target, "/api/v1/sessions/token-verify", [cookie, verify_token]) != 200:
+                    errors += 1
+                verify_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        verifiers = [asyncio.create_task(verify_client()) for _ in range(args.verify_clients)]
+        started = time.perf_counter()
+        await asyncio.gather(*[list_client() for _ in range(args.clients)])
+        elapsed = time.perf_counter() - started
+        done = True
+        await asyncio.gather(*verifiers)
+        await async_engine.dispose()
+        list_latencies.sort()
+        verify_latencies.sort()
+        return {
+            "list_rps": len(list_latencies) / elapsed,
+            "list_p50": list_latencies[len(list_latencies) // 2],
+            "verify_rps": len(verify_latencies) / elapsed,
+            "verify_p50": verify_latencies[len(verify_latencies) // 2],
+            "verify_p99": verify_latencies[int(len(verify_latencies) * 0.99)],
+            "errors": errors,
+        }
+
+    print(
+        f"async-db: {args.clients} clients x {args.requests} GET /sessions "
+        f"+ {args.verify_clients} token-verify clients, {args.sessions} sessions / {args.users} users"
+    )
+    failures = 0
+    for label, target in (("sync queries in handler", old_app), ("async session", app)):
+        result = asyncio.run(run(target))
+        failures += result["errors"]
+        print(
+            f"  {label:<24} sessions {result['list_rps']:6.1f} req/s p50={result['list_p50']:7.1f}ms  |  "
+            f"token-verify {result['verify_rps']:6.0f} req/s p50={result['verify_p50']:6.1f}ms "
+            f"p99={result['verify_p99']:6.1f}ms  errors={result['errors']}"
+        )
+    if failures:
+        raise SystemExit("FAIL: unexpected response status")
+
+
+def bench_async_db_write(args) -> None:
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.orm import Session
+
+    from app.api.v1.auth import _alert_service
+    from app.api.v1.auth import router as auth_router
+    from app.core.database import get_db
+    from app.core.security import create_access_token
+    from app.main import app
+    from app.models.group import GroupRoleMapping
+    from app.models.permission import UserPermission
+    from app.models.preference import UserPreference
+    from app.models.user import User
+    from app.services.audit_service import AuditEventType
+    from app.services.token_service import token_service
+    from app.services.user_principal_cache import user_principal_cache
+
+    logging.getLogger("app.core.database").setLevel(logging.WARNING)
+    init_db()
+    db = SessionLocal()
+    db.bulk_insert_mappings(User, [
+        {"id": uid, "username": f"user{uid}", "email": f"user{uid}@example.com",
+         "role": "admin" if uid == 1 else "user"}
+        for uid in range(1, args.users + 1)
+    ])
+    db.bulk_insert_mappings(UserPermission, [{"user_id": uid} for uid in range(1, args.users + 1)])
+    db.add(GroupRoleMapping(group_name="bench", role="user"))
+    db.commit()
+    group_id = db.query(GroupRoleMapping.id).filter_by(group_name="bench").scalar()
+    token_service.init_blacklist_cache(db)
+    db.close()
+    user_principal_cache.clear()
+
+    # 统计日志中的 database is locked（告警检测等后台任务吞掉异常，只写日志）
+    locked = []
+
+    class _LockedHandler(logging.Handler):
+        def emit(self, record):
+            if "database is locked" in record.getMessage() or (
+                record.exc_info and "database is locked" in str(record.exc_info[1])
+            ):
+                locked.append(record)
+
+    logging.getLogger().addHandler(_LockedHandler())
+
+    # 旧实现：async 处理函数内直接执行同步写入并提交（在事件循环上等待 SQLite 写锁）
+    old_app = FastAPI()
+    old_app.include_router(auth_router, prefix="/api/v1/auth")
+
+    def old_write(db: Session) -> None:
+        pref = db.query(UserPreference).filter_by(user_id=1).first()
+        if not pref:
+            pref = UserPreference(user_id=1)
+            db.add(pref)
+        pref.theme = random.choice(("light", "dark"))
+        db.commit()
+
+    for method, path in (
+        ("PUT", "/api/v1/users/me/preferences"),
+        ("PUT", "/api/v1/admin/users/{user_id}/permissions"),
+        ("PUT", "/api/v1/admin/groups/{group_id}/role"),
+        ("PUT", "/api/v1/admin/audit-logs/retention"),
+        ("PUT", "/api/v1/admin/alert-rules"),
+    ):
+        async def old_handler(db: Session = Depends(get_db)):
+            old_write(db)
+            return {"success": True}
+
+        old_app.add_api_route(path, old_handler, methods=[method])
+
+    cookie = f"access_token={create_access_token({'sub': '1'})}"
+    writes = [
+        ("/api/v1/users/me/preferences", lambda i: {"theme": ("light", "dark")[i % 2]}),
+        ("/api/v1/admin/users/{uid}/permissions", lambda i: {"max_concurrent_sessions": 3 + i % 3}),
+        (f"/api/v1/admin/groups/{group_id}/role", lambda i: {"role": ("admin", "user")[i % 2]}),
+        ("/api/v1/admin/audit-logs/retention", lambda i: {"hot_retention_days": 30 + i % 5}),
+        ("/api/v1/admin/alert-rules", lambda i: {"config": {"cooldown_minutes": 0}}),
+    ]
+
+    async def call(target, method: str, path: str, cookies: str, body: dict = None):
+        """直接调用 ASGI 应用，返回 (状态码, Set-Cookie 中的 refresh_token)"""
+        status, refresh = 0, None
+        payload = json.dumps(body).encode() if body is not None else b""
+
+        async def receive():
+            return {"type": "http.request", "body": payload}
+
+        async def send(message):
+            nonlocal status, refresh
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message["headers"]:
+                    if name == b"set-cookie" and value.startswith(b"refresh_token="):
+                        refresh = value.split(b";", 1)[0].split(b"=", 1)[1].decode()
+
+        headers = [(b"cookie", cookies.encode()), (b"content-type", b"application/json")]
+        try:
+            await target({
+                "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+                "path": path, "raw_path": path.encode(), "query_string": b"",
+                "root_path": "", "headers": headers, "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 8000),
+            }, receive, send)
+        except Exception:
+            # ServerErrorMiddleware 已返回 500，异常继续向上抛出
+            status = 500
+        return status, refresh
+
+    async def run(target) -> dict:
+        latencies, errors, stalls, done = [], 0, [], False
+        locked.clear()
+        async with AsyncSessionLocal() as session:
+            refresh_tokens = [
+                await token_service.create_refresh_token(session, 1 + i % args.users)
+                for i in range(args.clients)
+            ]
+
+        async def monitor():
+            """每 5ms 唤醒一次，记录事件循环的调度延迟"""
+            while not done:
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                stalls.append((time.perf_counter() - start - 0.005) * 1000)
+
+        async def timed(coro):
+            start = time.perf_counter()
+            result = await coro
+            latencies.append((time.perf_counter() - start) * 1000)
+            return result
+
+        async def refresh_client(i):
+            nonlocal errors
+            token = refresh_tokens[i]
+            for _ in range(args.requests):
+                status, new_token = await timed(
+                    call(target, "POST", "/api/v1/auth/refresh", f"refresh_token={token}")
+                )
+                if status != 200 or not new_token:
+                    errors += 1
+                    return
+                token = new_token
+
+        async def admin_client(i):
+            nonlocal errors
+            for n in range(args.requests):
+                path, body = writes[(i + n) % len(writes)]
+                path = path.format(uid=1 + (i + n) % args.users)
+                status, _ = await timed(call(target, "PUT", path, cookie, body(n)))
+                if status != 200:
+                    errors += 1
+
+        async def alert_client(i):
+            for n in range(args.requests):
+                uid = 1 + (i + n) % args.users
+                await timed(_alert_service.check_and_alert(
+                    AuditEventType.LOGIN, uid, f"10.0.{i}.{n % 250}", None, f"user{uid}"
+                ))
+
+        watcher = asyncio.create_task(monitor())
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[refresh_client(i) for i in range(args.clients)],
+            *[admin_client(i) for i in range(args.clients)],
+            *[alert_client(i) for i in range(args.clients)],
+        )
+        elapsed = time.perf_counter() - started
+        done = True
+        await watcher
+        await async_engine.dispose()
+        latencies.sort()
+        return {
+            "rps": len(latencies) / elapsed,
+            "p50": latencies[len(latencies) // 2],
+            "p99": latencies[int(len(latencies) * 0.99)],
+            "max_stall": max(stalls),
+            "errors": errors,
+            "locked": len(locked),
+        }
+
+    print(
+        f"async-db-write: {args.clients} refresh + {args.clients} admin/preference + {args.clients} alert "
+        f"writers x {args.requests} requests, {args.users} users"
+    )
+    result = None
+    for label, target in (("sync writes in handler", old_app), ("writes off the loop", app)):
+        result = asyncio.run(run(target))
+        print(
+            f"  {label:<24} {result['rps']:6.1f} writes/s p50={result['p50']:7.1f}ms p99={result['p99']:7.1f}ms  "
+            f"max loop stall={result['max_stall']:7.1f}ms  errors={result['errors']}  locked={result['locked']}"
+        )
+    if result["errors"] or result["locked"]:
+        raise SystemExit("FAIL: write failed or database is locked")
+    if result["max_stall"] > args.max_stall_ms:
+        raise SystemExit(f"FAIL: event loop stalled {result['max_stall']:.0f}ms > {args.max_stall_ms}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    p = sub.add_parser("token-verify", help="token-verify session lookup latency")
+    p.add_argument("--sessions", type=int, default=50000)
+    p.add_argument("--active", type=int, default=100)
+    p.add_argument("--iterations", type=int, default=2000)
+    p.set_defaults(func=bench_token_verify)
+
+    p = sub.add_parser("admission", help="concurrent session starts for one user")
+    p.add_argument("--requests", type=int, default=50)
+    p.add_argument("--max-concurrent", type=int, default=3)
+    p.add_argument("--daily-quota", type=int, default=100)
+    p.set_defaults(func=bench_admission)
+
+    p = sub.add_parser("audit-write", help="concurrent audit log writes")
+    p.add_argument("--threads", type=int, default=16)
+    p.add_argument("--events", type=int, default=500)
+    p.set_defaults(func=bench_audit_write)
+
+    p = sub.add_parser("audit-export", help="audit log export memory usage")
+    p.add_argument("--rows", type=int, default=5_000_000)
+    p.add_argument("--check-rows", action="store_true", help="count exported lines")
+    p.set_defaults(func=bench_audit_export)
+
+    p = sub.add_parser("audit-page", help="deep audit log pagination latency")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--depth", type=float, default=0.9, help="page position as a fraction of the table")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--iterations", type=int, default=20)
+    p.set_defaults(func=bench_audit_page)
+
+    p = sub.add_parser("audit-retention", help="audit log archive consistency")
+    p.add_argument("--rows", type=int, default=200000)
+    p.add_argument("--days", type=int, default=240)
+    p.add_argument("--hot-days", type=int, default=90)
+    p.add_argument("--page-size", type=int, default=1000)
+    p.set_defaults(func=bench_audit_retention)
+
+    p = sub.add_parser("audit-search", help="audit log full-text search latency")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=bench_audit_search)
+
+    p = sub.add_parser("alert-engine", help="alert rule evaluation latency and consistency")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--ips", type=int, default=30)
+    p.set_defaults(func=bench_alert_engine)
+
+    p = sub.add_parser("alert-outbox", help="alert notification delivery")
+    p.add_argument("--events", type=int, default=200)
+    p.add_argument("--latency-ms", type=float, default=50)
+    p.add_argument("--failure-rate", type=float, default=0.2)
+    p.set_defaults(func=bench_alert_outbox)
+
+    p = sub.add_parser("realtime", help="realtime monitoring endpoint latency")
+    p.add_argument("--clients", type=int, default=5)
+    p.add_argument("--rounds", type=int, default=4)
+    p.set_defaults(func=bench_realtime)
+
+    p = sub.add_parser("metrics-rollup", help="time-series rollup consistency and query latency")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--per-minute", type=int, default=2)
+    p.add_argument("--rollup-every", type=int, default=7, help="simulated minutes between flush + rollup")
+    p.set_defaults(func=bench_metrics_rollup)
+
+    p = sub.add_parser("session-export", help="session report export memory usage")
+    p.add_argument("--rows", type=int, default=500000)
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--check-rows", action="store_true", help="keep output in memory and compare with the old export")
+    p.set_defaults(func=bench_session_export)
+
+    p = sub.add_parser("session-stats", help="session statistics from daily aggregates vs raw sessions")
+    p.add_argument("--sessions", type=int, default=20000)
+    p.add_argument("--users", type=int, default=40)
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--windows", type=int, nargs="+", default=[1, 7, 30, 90])
+    p.add_argument("--iterations", type=int, default=20)
+    p.set_defaults(func=bench_session_stats)
+
+    p = sub.add_parser("events", help="event bus fan-out latency, filtering and backpressure")
+    p.add_argument("--events", type=int, default=5000)
+    p.add_argument("--subscribers", type=int, default=200)
+    p.add_argument("--users", type=int, default=50)
+    p.set_defaults(func=bench_events)
+
+    p = sub.add_parser("prometheus", help="instrumentation overhead and /metrics render time")
+    p.add_argument("--iterations", type=int, default=20000)
+    p.set_defaults(func=bench_prometheus)
+
+    p = sub.add_parser("config-cache", help="alert rule / system config read latency and coherence")
+    p.add_argument("--entries", type=int, default=200, help="IP whitelist entries")
+    p.add_argument("--poll", type=float, default=0.5, help="version poll interval in seconds")
+    p.add_argument("--iterations", type=int, default=2000)
+    p.set_defaults(func=bench_config_cache)
+
+    p = sub.add_parser("async-db", help="request throughput with sync queries vs the async session")
+    p.add_argument("--sessions", type=int, default=200000)
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--clients", type=int, default=8, help="concurrent session list clients")
+    p.add_argument("--requests", type=int, default=20)
+    p.add_argument("--verify-clients", type=int, default=8)
+    p.set_defaults(func=bench_async_db)
+
+    p = sub.add_parser("async-db-write", help="event loop stalls under concurrent database writes")
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--clients", type=int, default=4, help="concurrent writers of each kind")
+    p.add_argument("--requests", type=int, default=25)
+    p.add_argument("--max-stall-ms", type=float, default=500)
+    p.set_defaults(func=bench_async_db_write)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    finally:
+        engine.dispose()
+        shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
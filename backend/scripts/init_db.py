@@ -84,6 +84,9 @@ def seed_default_data(db):
         ("alert_cooldown_minutes", "30"),
         ("sns_topic_arn",          ""),
         ("secret_key_hash",        ""),
+        ("audit_hot_retention_days",     "90"),
+        ("audit_archive_retention_days", "730"),
+        ("config_version",         "0"),
     ]
     for key, value in default_configs:
         if not db.query(SystemConfig).filter_by(key=key).first():
@@ -0,0 +1,116 @@
+"""
+测试使用临时 SQLite 数据库和模拟 Gotty，不会读写 .env 中配置的数据库，也不依赖真实 gotty / kiro-cli。
+环境变量须在导入 app 之前设置（引擎在导入 app.core.database 时创建）。
+
+执行方式（backend 目录下）：python -m pytest -q
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+_TMP_DIR = tempfile.mkdtemp(prefix="kirocli-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+
+# 模拟 Gotty：输出监听地址后保持运行
+_FAKE_GOTTY = os.path.join(_TMP_DIR, "fake-gotty")
+with open(_FAKE_GOTTY, "w") as _f:
+    _f.write(
+        "#!/bin/sh\n"
+        "while [ \"$1\" != \"--port\" ]; do shift; done\n"
+        "echo \"HTTP server is listening at: http://127.0.0.1:$2/test$2/\"\n"
+        "exec sleep 600\n"
+    )
+os.chmod(_FAKE_GOTTY, 0o755)
+os.environ["GOTTY_PATH"] = _FAKE_GOTTY
+os.environ["GOTTY_CERT_PATH"] = ""
+os.environ["GOTTY_KEY_PATH"] = ""
+os.environ["GOTTY_PORT_QUARANTINE_SECONDS"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.core.database import Base, SessionLocal, async_engine, engine, init_db  # noqa: E402
+
+
+def pytest_sessionstart(session):
+    init_db()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    engine.dispose()
+    shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _clean_state():
+    """每个测试前清空所有表和依赖数据库内容的进程内状态"""
+    from app.services.admission_service import admission_controller
+    from app.services.config_cache import config_cache
+    from app.services.session_token_index import session_token_index
+    from app.services.user_principal_cache import user_principal_cache
+
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    db = SessionLocal()
+    try:
+        admission_controller.load(db)
+        session_token_index.load(db)
+    finally:
+        db.close()
+    config_cache.invalidate()
+    user_principal_cache.clear()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def run():
+    """在新的事件循环中执行协程；结束前释放异步连接池（连接绑定在创建它的事件循环上）"""
+
+    def _run(coro):
+        async def _main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(_main())
+
+    return _run
+
+
+@pytest.fixture
+def count_statements():
+    """统计代码块内在同步 / 异步引擎上执行的 SQL 语句条数"""
+
+    @contextmanager
+    def _count():
+        statements = []
+
+        def _on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        targets = (engine, async_engine.sync_engine)
+        for target in targets:
+            event.listen(target, "before_cursor_execute", _on_execute)
+        try:
+            yield statements
+        finally:
+            for target in targets:
+                event.remove(target, "before_cursor_execute", _on_execute)
+
+    return _count
@@ -0,0 +1,185 @@
+"""准入控制：同一用户并发创建会话时并发上限与每日配额不被突破，创建失败时释放名额和 Gotty 进程"""
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.core.exceptions import DailyQuotaExceededError, SessionLimitExceededError
+from app.models.permission import UserPermission
+from app.models.session import Session as SessionModel
+from app.models.user import User
+from app.services.admission_service import admission_controller
+from app.services.gotty_service import gotty_service
+from app.services.session_service import SessionService
+from app.services.session_stats_service import session_stats
+from app.utils.port_manager import PortState
+
+
+def _add_user(db, max_concurrent: int, daily_quota: int) -> None:
+    db.add(User(id=1, username="alice", email="alice@example.com"))
+    db.add(UserPermission(user_id=1, max_concurrent_sessions=max_concurrent, daily_session_quota=daily_quota))
+    db.commit()
+
+
+async def _start_concurrently(requests: int) -> list:
+    async def start_one():
+        async with AsyncSessionLocal() as db:
+            try:
+                sess = await SessionService(db).create_session(1, "127.0.0.1", "alice")
+                return sess.id
+            except (SessionLimitExceededError, DailyQuotaExceededError) as e:
+                return e.code
+
+    return await asyncio.gather(*(start_one() for _ in range(requests)))
+
+
+async def _close_all(session_ids: list) -> None:
+    async with AsyncSessionLocal() as db:
+        service = SessionService(db)
+        for session_id in session_ids:
+            await service.close_session(session_id, 1, is_admin=True)
+
+
+async def _active_in_db() -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(func.count()).select_from(SessionModel).where(
+                SessionModel.user_id == 1, SessionModel.status.in_(["starting", "running"])
+            )
+        )
+
+
+def test_concurrent_starts_respect_max_sessions(db, run):
+    _add_user(db, max_concurrent=3, daily_quota=50)
+
+    async def scenario():
+        results = await _start_concurrently(20)
+        accepted = [r for r in results if r.startswith("sess_")]
+        active = await _active_in_db()
+        await _close_all(accepted)
+        return results, accepted, active
+
+    results, accepted, active = run(scenario())
+    assert len(accepted) == 3
+    assert active == 3
+    assert set(results) - set(accepted) == {"SESSION_LIMIT_EXCEEDED"}
+    assert admission_controller.get_counts(1) == {"active": 0, "today": 3}
+
+
+def test_concurrent_starts_respect_daily_quota(db, run):
+    _add_user(db, max_concurrent=10, daily_quota=2)
+
+    async def scenario():
+        results = await _start_concurrently(8)
+        accepted = [r for r in results if r.startswith("sess_")]
+        await _close_all(accepted)
+        # 关闭后并发名额释放，但当日配额已用完
+        again = await _start_concurrently(1)
+        return results, accepted, again
+
+    results, accepted, again = run(scenario())
+    assert len(accepted) == 2
+    assert set(results) - set(accepted) == {"DAILY_QUOTA_EXCEEDED"}
+    assert again == ["DAILY_QUOTA_EXCEEDED"]
+
+
+def test_failed_spawn_releases_slot(db, run, monkeypatch):
+    _add_user(db, max_concurrent=1, daily_quota=5)
+
+    async def failing_start_gotty(user_id):
+        raise RuntimeError("gotty failed to start")
+
+    async def scenario():
+        async with AsyncSessionLocal() as session_db:
+            with pytest.raises(RuntimeError):
+                await SessionService(session_db).create_session(1, "127.0.0.1", "alice")
+        return await _active_in_db()
+
+    monkeypatch.setattr(gotty_service, "start_gotty", failing_start_gotty)
+    assert run(scenario()) == 0
+    assert admission_controller.get_counts(1) == {"active": 0, "today": 0}
+    monkeypatch.undo()
+
+    # 归还的名额可以立即再次使用
+    async def retry():
+        results = await _start_concurrently(2)
+        accepted = [r for r in results if r.startswith("sess_")]
+        await _close_all(accepted)
+        return accepted
+
+    assert len(run(retry())) == 1
+    assert admission_controller.get_counts(1) == {"active": 0, "today": 1}
+
+
+def test_failed_create_releases_slot_and_stops_gotty(db, run, monkeypatch):
+    _add_user(db, max_concurrent=1, daily_quota=5)
+    started = []
+    start_gotty = gotty_service.start_gotty
+
+    async def recording_start_gotty(user_id):
+        sess = await start_gotty(user_id)
+        started.append(sess)
+        return sess
+
+    def failing_record_start(db, session):
+        raise RuntimeError("stats write failed")
+
+    monkeypatch.setattr(gotty_service, "start_gotty", recording_start_gotty)
+    monkeypatch.setattr(session_stats, "record_start", failing_record_start)
+
+    async def scenario():
+        async with AsyncSessionLocal() as session_db:
+            with pytest.raises(RuntimeError):
+                await SessionService(session_db).create_session(1, "127.0.0.1", "alice")
+        return await _active_in_db()
+
+    assert run(scenario()) == 0
+    assert len(started) == 1
+    gotty_sess = started[0]
+    assert not gotty_service.process_manager.is_alive(gotty_sess.pid)
+    assert gotty_service.port_manager.get_stats()[PortState.IN_USE] == 0
+    assert admission_controller.get_counts(1) == {"active": 0, "today": 0}
+
+
+def test_cancelled_create_stops_gotty(db, run, monkeypatch):
+    _add_user(db, max_concurrent=1, daily_quota=5)
+    started = []
+    start_gotty = gotty_service.start_gotty
+
+    async def recording_start_gotty(user_id):
+        sess = await start_gotty(user_id)
+        started.append(sess)
+        return sess
+
+    async def scenario():
+        entered = asyncio.Event()
+        original = session_stats.record_start
+
+        def marking_record_start(db, session):
+            # 标记已进入会话写入阶段，主协程随即取消请求（取消落在 run_sync / commit 上）
+            entered.set()
+            original(db, session)
+
+        monkeypatch.setattr(gotty_service, "start_gotty", recording_start_gotty)
+        monkeypatch.setattr(session_stats, "record_start", marking_record_start)
+
+        async def create():
+            async with AsyncSessionLocal() as session_db:
+                await SessionService(session_db).create_session(1, "127.0.0.1", "alice")
+
+        task = asyncio.create_task(create())
+        await entered.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 被 shield 的清理在取消后继续执行
+        for _ in range(100):
+            if not gotty_service.process_manager.is_alive(started[0].pid):
+                break
+            await asyncio.sleep(0.05)
+        return await _active_in_db()
+
+    assert run(scenario()) == 0
+    assert not gotty_service.process_manager.is_alive(started[0].pid)
+    assert admission_controller.get_counts(1) == {"active": 0, "today": 0}
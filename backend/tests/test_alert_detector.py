@@ -0,0 +1,125 @@
+"""告警滑动窗口：对同一事件流，AlertDetector 的判定与原先基于 audit_logs / sessions 的 COUNT 查询一致"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app.models.audit_log import AuditLog
+from app.models.session import Session as SessionModel
+from app.services.alert_detector import AlertDetector
+
+EVENTS = 1500
+USERS = 4
+IPS = 6
+
+# (时间窗口, 阈值) 与 init_db 中的默认规则相同；多 IP 规则窗口按小时计
+BURST_WINDOW, BURST_THRESHOLD = timedelta(minutes=10), 5
+FAILURE_WINDOW, FAILURE_THRESHOLD = timedelta(minutes=5), 5
+MULTI_IP_WINDOW, MULTI_IP_THRESHOLD = timedelta(hours=1), 3
+
+
+def _stream(now: datetime) -> list:
+    """时间严格递增的事件流；部分登录缺少 IP（无法取得客户端地址）或用户（未知账号登录失败）"""
+    rnd = random.Random(16)
+    t = now - timedelta(seconds=EVENTS)
+    events = []
+    for _ in range(EVENTS):
+        t += timedelta(milliseconds=rnd.randint(1, 2000))
+        kind = rnd.choice(("login_success", "login_failure", "session"))
+        user_id = 1 + rnd.randrange(USERS)
+        ip = f"10.0.0.{rnd.randrange(IPS)}"
+        if kind != "session" and rnd.random() < 0.15:
+            ip = None
+        if kind == "login_failure" and rnd.random() < 0.1:
+            user_id = None
+        events.append((kind, user_id, ip, t))
+    return events
+
+
+def _seed(db, events: list) -> None:
+    db.bulk_insert_mappings(AuditLog, [
+        {
+            "event_type": "LOGIN", "user_id": user_id, "client_ip": ip, "event_time": ts,
+            "result": "success" if kind == "login_success" else "failure",
+        }
+        for kind, user_id, ip, ts in events if kind != "session"
+    ])
+    db.bulk_insert_mappings(SessionModel, [
+        {
+            "id": f"sess_{i:016d}", "user_id": user_id, "gotty_pid": 1, "gotty_port": 7861,
+            "gotty_url": "", "random_token": f"tok{i:016d}", "status": "closed", "started_at": ts,
+        }
+        for i, (kind, user_id, ip, ts) in enumerate(events) if kind == "session"
+    ])
+    db.commit()
+
+
+def _sql_decisions(db, kind, user_id, ip, ts) -> tuple:
+    """原 AlertService 的 COUNT 检查（只统计 ts 及之前的事件以模拟回放）"""
+    if kind == "session":
+        count = db.query(func.count(SessionModel.id)).filter(
+            SessionModel.user_id == user_id,
+            SessionModel.started_at >= ts - BURST_WINDOW,
+            SessionModel.started_at <= ts,
+        ).scalar()
+        return (count > BURST_THRESHOLD,)
+    failure = multi_ip = False
+    if ip:
+        failures = db.query(func.count(AuditLog.id)).filter(
+            AuditLog.event_type == "LOGIN", AuditLog.client_ip == ip, AuditLog.result == "failure",
+            AuditLog.event_time >= ts - FAILURE_WINDOW, AuditLog.event_time <= ts,
+        ).scalar()
+        failure = failures > FAILURE_THRESHOLD
+    if user_id:
+        ips = db.query(func.count(func.distinct(AuditLog.client_ip))).filter(
+            AuditLog.event_type == "LOGIN", AuditLog.user_id == user_id, AuditLog.result == "success",
+            AuditLog.event_time >= ts - MULTI_IP_WINDOW, AuditLog.event_time <= ts,
+        ).scalar()
+        multi_ip = (ips or 0) > MULTI_IP_THRESHOLD
+    return (failure, multi_ip)
+
+
+def _detector_decisions(detector, kind, user_id, ip, ts) -> tuple:
+    if kind == "session":
+        detector.observe_session(user_id, ts)
+        return (detector.session_burst(user_id, ts - BURST_WINDOW, BURST_THRESHOLD),)
+    detector.observe_login(user_id, ip, "success" if kind == "login_success" else "failure", ts)
+    return (
+        bool(ip) and detector.login_failure(ip, ts - FAILURE_WINDOW, FAILURE_THRESHOLD),
+        bool(user_id) and detector.multi_ip(user_id, ts - MULTI_IP_WINDOW, MULTI_IP_THRESHOLD),
+    )
+
+
+def test_detector_matches_sql_checks(db):
+    now = datetime.utcnow().replace(microsecond=0)
+    events = _stream(now)
+    _seed(db, events)
+
+    detector = AlertDetector()
+    mismatches, hits = [], {"session": [0], "login": [0, 0]}
+    for event in events:
+        expected = _sql_decisions(db, *event)
+        if _detector_decisions(detector, *event) != expected:
+            mismatches.append((event, expected))
+        counters = hits["session" if event[0] == "session" else "login"]
+        for i, fired in enumerate(expected):
+            counters[i] += fired
+    assert mismatches == []
+    # 事件流须让每条规则都有触发，否则一致性检查没有意义
+    assert all(hits["session"] + hits["login"]), hits
+
+    # 从数据库预热得到的状态与逐条回放得到的状态判定一致
+    end = events[-1][3]
+    warmed = AlertDetector()
+    warmed.warm(db, now=end)
+    for user_id in range(1, USERS + 1):
+        for check in (
+            lambda d: d.session_burst(user_id, end - BURST_WINDOW, BURST_THRESHOLD),
+            lambda d: d.multi_ip(user_id, end - MULTI_IP_WINDOW, MULTI_IP_THRESHOLD),
+        ):
+            assert check(warmed) == check(detector)
+    for n in range(IPS):
+        ip = f"10.0.0.{n}"
+        assert warmed.login_failure(ip, end - FAILURE_WINDOW, FAILURE_THRESHOLD) == detector.login_failure(
+            ip, end - FAILURE_WINDOW, FAILURE_THRESHOLD
+        )
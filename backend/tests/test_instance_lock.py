@@ -0,0 +1,41 @@
+"""单实例锁：已有进程持有锁时第二个实例拒绝启动，释放后可以重新获取"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.core.instance_lock import InstanceLock
+
+_HOLD_LOCK = (
+    "import fcntl, sys, time\n"
+    "f = open(sys.argv[1], 'a+')\n"
+    "fcntl.flock(f.fileno(), fcntl.LOCK_EX)\n"
+    "f.seek(0); f.truncate(); f.write('4242'); f.flush()\n"
+    "print('locked', flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+def test_second_instance_refused(tmp_path):
+    path = str(tmp_path / "backend.lock")
+    holder = subprocess.Popen([sys.executable, "-c", _HOLD_LOCK, path], stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        with pytest.raises(RuntimeError, match="pid 4242"):
+            InstanceLock(path).acquire()
+    finally:
+        holder.kill()
+        holder.wait()
+
+    # 持有锁的进程退出后锁自动释放
+    lock = InstanceLock(path)
+    lock.acquire()
+    with open(path) as f:
+        assert f.read() == str(os.getpid())
+    with pytest.raises(RuntimeError):
+        InstanceLock(path).acquire()
+    lock.release()
+    again = InstanceLock(path)
+    again.acquire()
+    again.release()
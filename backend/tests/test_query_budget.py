@@ -0,0 +1,107 @@
+"""会话列表 / 详情、管理端用户 / 组列表每次请求执行的 SQL 条数不超过预算（无 N+1 查询），游标分页结果完整"""
+from datetime import datetime, timedelta
+
+from app.api.v1.admin import list_groups, list_users
+from app.api.v1.sessions import get_session, list_sessions
+from app.core.database import AsyncSessionLocal
+from app.models.group import GroupRoleMapping, UserGroup
+from app.models.permission import UserPermission
+from app.models.session import Session as SessionModel
+from app.models.user import User
+from app.services.user_principal_cache import UserPrincipal
+
+USERS = 20
+SESSIONS = 300
+PAGE = 50
+
+LIST_BUDGET = 2      # COUNT + 列表（JOIN users）
+DETAIL_BUDGET = 1
+USERS_BUDGET = 3
+GROUPS_BUDGET = 1
+
+ADMIN = UserPrincipal(id=1, username="user1", role="admin", status="active")
+
+
+def _seed(db) -> None:
+    db.bulk_insert_mappings(User, [
+        {"id": uid, "username": f"user{uid}", "email": f"user{uid}@example.com"}
+        for uid in range(1, USERS + 1)
+    ])
+    base = datetime.utcnow()
+    db.bulk_insert_mappings(SessionModel, [
+        {
+            "id": f"sess_{i:016d}",
+            "user_id": 1 + i % USERS,
+            "gotty_pid": 1,
+            "gotty_port": 7861,
+            "gotty_url": "",
+            "random_token": f"tok{i:016d}",
+            "status": "closed",
+            # 每两条会话共用一个 started_at，覆盖游标中 id 决胜的情况
+            "started_at": base - timedelta(seconds=i // 2),
+        }
+        for i in range(SESSIONS)
+    ])
+    db.bulk_insert_mappings(UserPermission, [
+        {"user_id": uid, "daily_session_quota": 20} for uid in range(1, USERS + 1, 2)
+    ])
+    db.bulk_insert_mappings(GroupRoleMapping, [{"group_name": f"group{g}", "role": "user"} for g in range(5)])
+    db.bulk_insert_mappings(UserGroup, [
+        {"user_id": uid, "group_name": f"group{uid % 5}"} for uid in range(1, USERS + 1)
+    ])
+    db.commit()
+
+
+async def _list(db, cursor=None):
+    return await list_sessions(
+        status=None, user_id=None, limit=PAGE, offset=0, cursor=cursor, current_user=ADMIN, db=db,
+    )
+
+
+def test_session_list_and_detail_within_budget(db, run, count_statements):
+    _seed(db)
+
+    async def scenario():
+        async with AsyncSessionLocal() as async_db:
+            with count_statements() as first:
+                page = await _list(async_db)
+            seen = [s["id"] for s in page["data"]["sessions"]]
+            assert all(s["username"] for s in page["data"]["sessions"])
+
+            budgets = []
+            cursor = page["data"]["next_cursor"]
+            while cursor:
+                with count_statements() as stmts:
+                    page = await _list(async_db, cursor)
+                budgets.append(len(stmts))
+                seen += [s["id"] for s in page["data"]["sessions"]]
+                cursor = page["data"]["next_cursor"]
+
+            with count_statements() as detail:
+                await get_session(session_id=seen[-1], current_user=ADMIN, db=async_db)
+            return len(first), budgets, seen, len(detail)
+
+    first, budgets, seen, detail = run(scenario())
+    assert first <= LIST_BUDGET
+    assert budgets and max(budgets) <= LIST_BUDGET
+    assert detail <= DETAIL_BUDGET
+    # 游标翻页覆盖全部会话，既不重复也不遗漏（started_at 相同时按 id 决胜）
+    assert len(seen) == SESSIONS
+    assert len(set(seen)) == SESSIONS
+
+
+def test_admin_lists_within_budget(db, run, count_statements):
+    _seed(db)
+
+    with count_statements() as stmts:
+        users = run(list_users(
+            role=None, status=None, search=None, limit=PAGE, offset=0, current_user=ADMIN, db=db,
+        ))
+    assert len(stmts) <= USERS_BUDGET
+    assert users["data"]["total"] == USERS
+    assert sum(u["total_sessions"] for u in users["data"]["users"]) == SESSIONS
+
+    with count_statements() as stmts:
+        groups = run(list_groups(current_user=ADMIN, db=db))
+    assert len(stmts) <= GROUPS_BUDGET
+    assert sum(g["member_count"] for g in groups["data"]["groups"]) == USERS
@@ -0,0 +1,148 @@
+"""会话每日汇总：监控统计与直接扫描 sessions 一致（含重建后），增量维护与重建得到相同的 max_concurrency"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app.core.database import AsyncSessionLocal
+from app.models.permission import UserPermission
+from app.models.session import Session as SessionModel, SessionDailyStats
+from app.models.user import User
+from app.services.session_service import SessionService
+from app.services.session_stats_service import session_stats
+
+WINDOWS = (1, 7, 30)
+
+
+def _raw_statistics(db, start_date: datetime) -> dict:
+    """原实现：对 sessions 做 COUNT / AVG / GROUP BY"""
+    total = db.query(SessionModel).filter(SessionModel.started_at >= start_date).count()
+    avg = (
+        db.query(func.avg(SessionModel.duration_seconds))
+        .filter(SessionModel.started_at >= start_date, SessionModel.status == "closed")
+        .scalar() or 0
+    )
+    daily = (
+        db.query(func.date(SessionModel.started_at).label("date"), func.count(SessionModel.id).label("count"))
+        .filter(SessionModel.started_at >= start_date)
+        .group_by(func.date(SessionModel.started_at))
+        .all()
+    )
+    top = (
+        db.query(User.username, func.count(SessionModel.id).label("session_count"))
+        .join(SessionModel, User.id == SessionModel.user_id)
+        .filter(SessionModel.started_at >= start_date)
+        .group_by(User.username)
+        .order_by(func.count(SessionModel.id).desc(), User.username)
+        .limit(10)
+        .all()
+    )
+    return {
+        "total_sessions": total,
+        "average_session_duration_seconds": int(avg),
+        "daily_sessions": [{"date": str(d.date), "count": d.count} for d in daily],
+        "top_users": [{"username": u.username, "session_count": u.session_count} for u in top],
+    }
+
+
+def _max_concurrency(db) -> dict:
+    return {(r.day, r.user_id): r.max_concurrency for r in db.query(SessionDailyStats).all()}
+
+
+def _simulate(db, rng: random.Random, sessions: int, users: int, days: int) -> datetime:
+    """按时间顺序创建会话并随机关闭（正常关闭 / 登出路径不计时长 / 重复关闭重新计时），返回模拟的当前时刻"""
+    now = datetime.utcnow()
+    db.add_all([User(id=uid, username=f"user{uid:03d}", email=f"u{uid}@example.com") for uid in range(1, users + 1)])
+    db.commit()
+
+    open_sessions = []
+    starts = sorted(now - timedelta(seconds=rng.uniform(0, days * 86400)) for _ in range(sessions))
+    for i, started_at in enumerate(starts):
+        sess = SessionModel(
+            id=f"sess_{i:016d}", user_id=rng.randint(1, users), gotty_pid=0, gotty_port=0,
+            gotty_url="", random_token=f"tok{i:016d}", status="starting", started_at=started_at,
+            duration_seconds=0,
+        )
+        db.add(sess)
+        session_stats.record_start(db, sess)
+        open_sessions.append(sess)
+        if len(open_sessions) > 8 or rng.random() < 0.5:
+            victim = open_sessions.pop(rng.randrange(len(open_sessions)))
+            # 在下一个会话开始前关闭
+            closed_at = starts[i + 1] if i + 1 < len(starts) else now
+            victim.status = "closed"
+            victim.closed_at = closed_at
+            path = rng.random()
+            if path < 0.7:
+                victim.duration_seconds = int((closed_at - victim.started_at).total_seconds())
+                session_stats.record_close(db, victim, 0, False)
+            elif path < 0.9:
+                session_stats.record_close(db, victim)
+            else:
+                victim.duration_seconds = rng.randint(0, 3600)
+                session_stats.record_close(db, victim)
+                previous = victim.duration_seconds
+                victim.duration_seconds = previous + rng.randint(0, 3600)
+                session_stats.record_close(db, victim, previous, True)
+        if i % 200 == 0:
+            db.commit()
+    db.commit()
+    return now
+
+
+def _assert_summaries_match(db) -> None:
+    for days in WINDOWS:
+        start = datetime.utcnow() - timedelta(days=days)
+        assert session_stats.summarize(db, start) == _raw_statistics(db, start), f"days={days}"
+
+
+def test_summary_matches_raw_sessions_incremental_and_rebuilt(db):
+    now = _simulate(db, random.Random(21), sessions=1500, users=12, days=30)
+    _assert_summaries_match(db)
+
+    incremental = _max_concurrency(db)
+    rows = session_stats.rebuild(db, (now - timedelta(days=31)).date(), now.date() + timedelta(days=1))
+    assert rows == len(incremental)
+    _assert_summaries_match(db)
+    assert _max_concurrency(db) == incremental
+
+
+def test_backfill_matches_incremental(db):
+    _simulate(db, random.Random(7), sessions=300, users=5, days=7)
+    incremental = _max_concurrency(db)
+    db.query(SessionDailyStats).delete()
+    db.commit()
+
+    assert session_stats.backfill_if_empty(db) == len(incremental)
+    assert _max_concurrency(db) == incremental
+    assert session_stats.backfill_if_empty(db) == 0
+
+
+def test_session_service_maintains_stats(db, run):
+    db.add(User(id=1, username="alice", email="alice@example.com"))
+    db.add(UserPermission(user_id=1, max_concurrent_sessions=5, daily_session_quota=10))
+    db.commit()
+
+    async def scenario():
+        async with AsyncSessionLocal() as async_db:
+            service = SessionService(async_db)
+            first = await service.create_session(1, "127.0.0.1", "alice")
+            second = await service.create_session(1, "127.0.0.1", "alice")
+            await service.close_session(first.id, 1)
+            third = await service.create_session(1, "127.0.0.1", "alice")
+            await service.close_session(second.id, 1)
+            await service.close_session(third.id, 1)
+
+    run(scenario())
+    today = db.query(func.min(SessionModel.started_at)).scalar().date()
+    row = db.get(SessionDailyStats, (today, 1))
+    assert (row.session_count, row.closed_count) == (3, 3)
+    assert row.max_concurrency == 2
+    assert row.total_duration_seconds == sum(
+        s.duration_seconds for s in db.query(SessionModel).filter_by(user_id=1)
+    )
+
+    session_stats.rebuild(db, today, today + timedelta(days=1))
+    db.expire_all()
+    assert db.get(SessionDailyStats, (today, 1)).max_concurrency == 2
+    _assert_summaries_match(db)
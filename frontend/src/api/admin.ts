@@ -40,6 +40,9 @@ export interface AlertEvent {
   event_detail: string | null
   notification_sent: boolean
   notification_error: string | null
+  delivery_status: 'pending' | 'sent' | 'failed' | null
+  delivery_attempts: number
+  delivered_at: string | null
 }
 
 export interface AuditLog {
@@ -99,10 +102,12 @@ export function getAuditLogs(params?: {
   event_type?: string
   start_time?: string
   end_time?: string
+  q?: string
   limit?: number
   offset?: number
+  cursor?: string
 }) {
-  return request.get<{ success: boolean; data: { logs: AuditLog[]; total: number } }>('/admin/audit-logs', { params })
+  return request.get<{ success: boolean; data: { logs: AuditLog[]; total: number; next_cursor?: string | null } }>('/admin/audit-logs', { params })
 }
 
 export function exportAuditLogs(params?: {
@@ -110,6 +115,9 @@ export function exportAuditLogs(params?: {
   event_type?: string
   start_time?: string
   end_time?: string
+  q?: string
+  format?: 'csv' | 'ndjson'
+  gzip?: boolean
 }) {
   return request.get('/admin/audit-logs/export', { params, responseType: 'blob' })
 }
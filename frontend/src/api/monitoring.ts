@@ -4,13 +4,45 @@ export function getRealtimeMetrics() {
   return request.get('/monitoring/realtime')
 }
 
+export function getMetricsHistory(minutes = 15) {
+  return request.get('/monitoring/history', { params: { minutes } })
+}
+
+export function getTimeseries(metric: string, hours = 24) {
+  return request.get('/monitoring/timeseries', { params: { metric, hours } })
+}
+
 export function getStatistics(days = 7) {
   return request.get('/monitoring/statistics', { params: { days } })
 }
 
-export function exportReport(startDate: string, endDate: string) {
+export interface ExportOptions {
+  format?: 'csv' | 'ndjson'
+  gzip?: boolean
+  columns?: string[]
+  userId?: number
+  username?: string
+  status?: string[]
+}
+
+export function exportReport(
+  startDate: string,
+  endDate: string,
+  report: 'sessions' | 'daily' = 'sessions',
+  options: ExportOptions = {},
+) {
   return request.get('/monitoring/export', {
-    params: { start_date: startDate, end_date: endDate },
+    params: {
+      start_date: startDate,
+      end_date: endDate,
+      report,
+      format: options.format,
+      gzip: options.gzip || undefined,
+      columns: options.columns?.join(','),
+      user_id: options.userId,
+      username: options.username,
+      status: options.status?.join(','),
+    },
     responseType: 'blob',
   })
 }
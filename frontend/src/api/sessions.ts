@@ -10,6 +10,7 @@ export function getSessions(params?: {
   user_id?: number
   limit?: number
   offset?: number
+  cursor?: string
 }) {
   return request.get<{ success: boolean; data: SessionListResponse }>('/sessions', { params })
 }
@@ -1,12 +1,14 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
-import { getRealtimeMetrics, getStatistics } from '@/api/monitoring'
+import { getMetricsHistory, getRealtimeMetrics, getStatistics } from '@/api/monitoring'
+import { eventStream } from '@/utils/eventStream'
 
 export const useMonitoringStore = defineStore('monitoring', () => {
   const realtime = ref<Record<string, unknown> | null>(null)
   const statistics = ref<Record<string, unknown> | null>(null)
+  const hostHistory = ref<Record<string, unknown>[]>([])
   const loading = ref(false)
-  let refreshTimer: ReturnType<typeof setInterval> | null = null
+  let unsubscribe: (() => void) | null = null
 
   async function fetchRealtime() {
     try {
@@ -17,6 +19,15 @@ export const useMonitoringStore = defineStore('monitoring', () => {
     }
   }
 
+  async function fetchHostHistory(minutes = 15) {
+    try {
+      const res = await getMetricsHistory(minutes)
+      hostHistory.value = (res.data as { data: { samples: Record<string, unknown>[] } }).data.samples
+    } catch {
+      // ignore
+    }
+  }
+
   async function fetchStatistics(days = 7) {
     loading.value = true
     try {
@@ -27,17 +38,35 @@ export const useMonitoringStore = defineStore('monitoring', () => {
     }
   }
 
-  function startAutoRefresh(interval = 5000) {
+  // 订阅服务端定期推送的实时指标，替代每个页面各自轮询
+  function startAutoRefresh() {
     stopAutoRefresh()
-    refreshTimer = setInterval(() => fetchRealtime(), interval)
+    unsubscribe = eventStream.subscribe(
+      'metrics',
+      'metrics',
+      (data: Record<string, unknown>) => {
+        realtime.value = data
+      },
+      () => fetchRealtime(),
+    )
   }
 
   function stopAutoRefresh() {
-    if (refreshTimer !== null) {
-      clearInterval(refreshTimer)
-      refreshTimer = null
+    if (unsubscribe !== null) {
+      unsubscribe()
+      unsubscribe = null
     }
   }
 
-  return { realtime, statistics, loading, fetchRealtime, fetchStatistics, startAutoRefresh, stopAutoRefresh }
+  return {
+    realtime,
+    statistics,
+    hostHistory,
+    loading,
+    fetchRealtime,
+    fetchHostHistory,
+    fetchStatistics,
+    startAutoRefresh,
+    stopAutoRefresh,
+  }
 })
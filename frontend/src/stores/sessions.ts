@@ -2,18 +2,26 @@ import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import { getSessions, startSession as apiStart, closeSession as apiClose } from '@/api/sessions'
 import type { Session } from '@/types/session'
+import { eventStream } from '@/utils/eventStream'
+
+interface SessionEvent {
+  action: 'created' | 'running' | 'closed'
+  session: Pick<Session, 'id' | 'user_id' | 'status' | 'started_at' | 'duration_seconds'>
+}
 
 export const useSessionsStore = defineStore('sessions', () => {
   const sessions = ref<Session[]>([])
   const loading = ref(false)
   const total = ref(0)
-  let refreshTimer: ReturnType<typeof setInterval> | null = null
+  let lastParams: { status?: string; limit?: number; offset?: number } | undefined
+  let unsubscribe: (() => void) | null = null
 
   const activeSessions = computed(() =>
     sessions.value.filter((s) => s.status === 'running' || s.status === 'starting')
   )
 
   async function fetchSessions(params?: { status?: string; limit?: number; offset?: number }) {
+    lastParams = params
     loading.value = true
     try {
       const res = await getSessions(params)
@@ -35,15 +43,32 @@ export const useSessionsStore = defineStore('sessions', () => {
     await fetchSessions()
   }
 
-  function startAutoRefresh(interval = 5000) {
+  function applySessionEvent({ action, session }: SessionEvent) {
+    // 新会话需要 gotty_url 等完整字段；按状态筛选时状态变化会影响列表成员，均重新拉取当前页
+    if (action === 'created') {
+      fetchSessions(lastParams)
+      return
+    }
+    const existing = sessions.value.find((s) => s.id === session.id)
+    if (!existing) return
+    if (lastParams?.status) {
+      fetchSessions(lastParams)
+      return
+    }
+    existing.status = session.status
+    existing.duration_seconds = session.duration_seconds
+  }
+
+  // 订阅服务端推送的会话事件，替代定时轮询
+  function startAutoRefresh() {
     stopAutoRefresh()
-    refreshTimer = setInterval(() => fetchSessions(), interval)
+    unsubscribe = eventStream.subscribe('sessions', 'session', applySessionEvent, () => fetchSessions(lastParams))
   }
 
   function stopAutoRefresh() {
-    if (refreshTimer !== null) {
-      clearInterval(refreshTimer)
-      refreshTimer = null
+    if (unsubscribe !== null) {
+      unsubscribe()
+      unsubscribe = null
     }
   }
 
@@ -17,6 +17,7 @@ export interface SessionListResponse {
   total: number
   limit: number
   offset: number
+  next_cursor?: string | null
 }
 
 export interface StartSessionResponse {
@@ -0,0 +1,93 @@
+import request from '@/utils/request'
+
+export type Topic = 'sessions' | 'alerts' | 'metrics'
+type Handler = (data: any) => void
+
+interface Subscription {
+  topic: Topic
+  event: string
+  handler: Handler
+  // 连接（重新）建立或服务端要求重新同步时调用，期间可能漏掉了事件
+  onResync?: () => void
+}
+
+const MAX_RETRY_DELAY = 30000
+
+/**
+ * 全局共享的 SSE 连接（/api/v1/events）。
+ * 各 store 按主题订阅事件，连接的主题为当前所有订阅的并集；订阅变化时重新连接。
+ * 服务端返回非 200（令牌过期 / 连接数超限）时先刷新令牌，再按指数退避重连。
+ */
+class EventStream {
+  private source: EventSource | null = null
+  private topics = ''
+  private subscriptions = new Set<Subscription>()
+  private retryDelay = 1000
+  private retryTimer: ReturnType<typeof setTimeout> | null = null
+
+  subscribe(topic: Topic, event: string, handler: Handler, onResync?: () => void): () => void {
+    const sub: Subscription = { topic, event, handler, onResync }
+    this.subscriptions.add(sub)
+    this.sync()
+    return () => {
+      this.subscriptions.delete(sub)
+      this.sync()
+    }
+  }
+
+  private sync() {
+    const topics = [...new Set([...this.subscriptions].map((s) => s.topic))].sort().join(',')
+    if (topics === this.topics && (this.source || this.retryTimer)) return
+    this.topics = topics
+    this.close()
+    if (topics) this.connect()
+  }
+
+  private connect() {
+    const source = new EventSource(`/api/v1/events?topics=${this.topics}`, { withCredentials: true })
+    this.source = source
+    const events = new Set([...this.subscriptions].map((s) => s.event))
+    events.forEach((event) => {
+      source.addEventListener(event, (e) => {
+        const data = JSON.parse((e as MessageEvent).data)
+        this.subscriptions.forEach((s) => s.event === event && s.handler(data))
+      })
+    })
+    source.addEventListener('resync', () => this.resync())
+    source.onopen = () => {
+      this.retryDelay = 1000
+      this.resync()
+    }
+    source.onerror = () => {
+      // CONNECTING：浏览器自动重连（服务端在令牌过期时结束连接）；CLOSED：服务端拒绝，需自行处理
+      if (source.readyState !== EventSource.CLOSED) return
+      this.close()
+      this.retryTimer = setTimeout(async () => {
+        this.retryTimer = null
+        try {
+          await request.post('/auth/refresh')
+        } catch {
+          // 刷新失败由请求拦截器跳转登录页
+          return
+        }
+        if (this.topics && !this.source) this.connect()
+      }, this.retryDelay)
+      this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY)
+    }
+  }
+
+  private resync() {
+    this.subscriptions.forEach((s) => s.onResync?.())
+  }
+
+  private close() {
+    if (this.retryTimer !== null) {
+      clearTimeout(this.retryTimer)
+      this.retryTimer = null
+    }
+    this.source?.close()
+    this.source = null
+  }
+}
+
+export const eventStream = new EventStream()
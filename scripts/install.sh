@@ -360,6 +360,7 @@ GOTTY_REMOTE_MODE=false
 GOTTY_REMOTE_HOST=$EC2_IP
 GOTTY_CERT_PATH=$CERT_DIR/gotty-cert.pem
 GOTTY_KEY_PATH=$CERT_DIR/gotty-key.pem
+GOTTY_ROUTING_MODE=auth_request
 
 CORS_ORIGINS=["http://$EC2_IP:3000"]
 